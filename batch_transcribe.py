@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Transcribe a directory of audio files in length-sorted batches
+
+Results are appended to a JSONL file one batch at a time, so an
+interrupted run can be restarted with the same arguments and will skip
+the files that are already done. Files that failed to transcribe are
+recorded with an "error" field and retried on the next run.
+
+    python batch_transcribe.py recordings/ --output transcripts.jsonl --batch-size 16
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile as sf
+import torch
+
+import config
+from modules.asr import SpeechRecognizer
+from utils.audio_utils import preprocess_audio
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".aiff", ".aif")
+
+
+def find_audio_files(input_dir, extensions=AUDIO_EXTENSIONS):
+    """List audio files under input_dir, recursively and in a stable order"""
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith(extensions):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def load_done(output_path):
+    """Paths transcribed successfully in a previous run"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                path = record["path"]
+            except (ValueError, KeyError):
+                # A line cut short by an interruption; the file is redone
+                continue
+            if "error" in record:
+                done.discard(path)
+            else:
+                done.add(path)
+    return done
+
+
+def open_output(output_path):
+    """Open the results file for appending, after any line cut short by an interruption"""
+    out = open(output_path, "a+", encoding="utf-8")
+    if out.tell() > 0:
+        out.seek(out.tell() - 1)
+        if out.read(1) != "\n":
+            out.write("\n")
+    return out
+
+
+def make_batches(paths, batch_size, max_batch_seconds):
+    """Group files of similar length so little of each batch is padding
+
+    Durations come from the file headers, without decoding any audio.
+    """
+    durations = []
+    for path in paths:
+        try:
+            info = sf.info(path)
+            durations.append((info.frames / info.samplerate, path))
+        except RuntimeError as e:
+            logging.error(f"Skipping unreadable file {path}: {e}")
+    durations.sort()
+
+    batches = []
+    batch = []
+    longest = 0.0
+    for duration, path in durations:
+        # The batch costs as much as its longest file times its size
+        if batch and (len(batch) >= batch_size or max(longest, duration) * (len(batch) + 1) > max_batch_seconds):
+            batches.append(batch)
+            batch = []
+            longest = 0.0
+        batch.append((path, duration))
+        longest = max(longest, duration)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def load_batch(batch, sample_rate):
+    """Read and preprocess the audio of one batch"""
+    audios = []
+    for path, _ in batch:
+        audio, file_rate = sf.read(path, dtype="float32")
+        audios.append(preprocess_audio(audio, target_sr=sample_rate, input_sr=file_rate))
+    return audios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-transcribe a directory of audio files")
+    parser.add_argument("input_dir", help="Directory to search for audio files")
+    parser.add_argument("--output", default="transcripts.jsonl", help="JSONL file to append results to")
+    parser.add_argument("--model", default=config.ASR_MODEL, help="ESPnet ASR model tag")
+    parser.add_argument("--batch-size", type=int, default=8, help="Maximum files per batch")
+    parser.add_argument("--max-batch-seconds", type=float, default=240.0,
+                        help="Maximum padded audio per batch, in seconds")
+    parser.add_argument("--num-threads", type=int, default=os.cpu_count(),
+                        help="Torch intra-op threads")
+    parser.add_argument("--quantize", action="store_true", help="Decode with int8-quantized layers")
+    parser.add_argument("--beam-size", type=int, default=None, help="Beam search width (default: model's)")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+
+    paths = find_audio_files(args.input_dir)
+    done = load_done(args.output)
+    todo = [path for path in paths if path not in done]
+    print(f"{len(paths)} files found, {len(paths) - len(todo)} already transcribed, {len(todo)} to go")
+    if not todo:
+        return
+
+    batches = make_batches(todo, args.batch_size, args.max_batch_seconds)
+    recognizer = SpeechRecognizer(args.model, quantize=args.quantize, beam_size=args.beam_size)
+
+    start_time = time.time()
+    audio_seconds = 0.0
+    files_done = 0
+
+    # Load the next batch from disk while the current one is being decoded
+    with ThreadPoolExecutor(max_workers=1) as loader, open_output(args.output) as out:
+        pending = loader.submit(load_batch, batches[0], recognizer.sample_rate)
+        for i, batch in enumerate(batches):
+            try:
+                audios = pending.result()
+            except Exception as e:
+                logging.error(f"Failed to load batch {i}: {e}")
+                audios = None
+            if i + 1 < len(batches):
+                pending = loader.submit(load_batch, batches[i + 1], recognizer.sample_rate)
+            if audios is None:
+                continue
+
+            results = recognizer.transcribe_batch(audios, sample_rate=recognizer.sample_rate)
+
+            failed = 0
+            for (path, duration), result in zip(batch, results):
+                record = {
+                    "path": path,
+                    "text": result["text"],
+                    "confidence": result["confidence"],
+                    "duration": round(duration, 3),
+                }
+                if "error" in result:
+                    record["error"] = result["error"]
+                    failed += 1
+                out.write(json.dumps(record) + "\n")
+            # Make the batch durable before moving on, so a restart can resume after it
+            out.flush()
+            os.fsync(out.fileno())
+
+            files_done += len(batch) - failed
+            audio_seconds += sum(duration for _, duration in batch)
+            elapsed = time.time() - start_time
+            print(f"[{files_done}/{len(todo)}] {audio_seconds / elapsed:.1f}x real time")
+
+    elapsed = time.time() - start_time
+    print(f"Transcribed {files_done} files ({audio_seconds:.0f} s of audio) in {elapsed:.1f} s "
+          f"(real-time factor {elapsed / max(audio_seconds, 1e-9):.3f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Compare accuracy and speed of the CPU inference optimizations
+
+Each WAV file in the directory needs its reference transcript in a .txt
+file with the same name. Every combination of the given options is
+decoded and compared with the first one (the baseline):
+
+    python -m benchmarks.compare_optimizations wavs/ --quantize off on --beam-sizes 20 8 4 --num-threads 4
+
+With --tts, the reference texts are also synthesized with and without
+quantization; intelligibility is measured by transcribing the synthesized
+audio with the baseline recognizer.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+
+import numpy as np
+import soundfile as sf
+
+import config
+from modules.asr import SpeechRecognizer
+from modules.model_loader import configure_threads
+from modules.tts import SpeechSynthesizer
+from utils.audio_utils import preprocess_audio
+from utils.text_utils import word_error_rate
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+
+def load_dataset(wav_dir, sample_rate, limit=None):
+    """Load (name, audio, reference text) for every WAV with a transcript"""
+    items = []
+    for name in sorted(os.listdir(wav_dir)):
+        if not name.lower().endswith(".wav"):
+            continue
+        text_path = os.path.join(wav_dir, os.path.splitext(name)[0] + ".txt")
+        if not os.path.exists(text_path):
+            logging.error(f"Skipping {name}: no reference transcript")
+            continue
+        audio, file_rate = sf.read(os.path.join(wav_dir, name), dtype="float32")
+        with open(text_path, "r", encoding="utf-8") as f:
+            reference = f.read().strip()
+        items.append((name, preprocess_audio(audio, target_sr=sample_rate, input_sr=file_rate), reference))
+        if limit and len(items) >= limit:
+            break
+    return items
+
+
+def run_asr(dataset, quantize, beam_size, num_threads, args):
+    """Decode the dataset with one configuration"""
+    configure_threads(num_threads)
+    recognizer = SpeechRecognizer(args.model, snapshot_dir=args.snapshot_dir, quantize=quantize, beam_size=beam_size)
+    # The first decode pays for one-off initialization
+    recognizer.transcribe(dataset[0][1])
+
+    hypotheses = []
+    decode_seconds = 0.0
+    for _, audio, _ in dataset:
+        start = time.perf_counter()
+        hypotheses.append(recognizer.transcribe(audio)["text"])
+        decode_seconds += time.perf_counter() - start
+
+    audio_seconds = sum(len(audio) for _, audio, _ in dataset) / recognizer.sample_rate
+    return {
+        "quantize": quantize,
+        "beam_size": beam_size,
+        "num_threads": num_threads,
+        "wer": word_error_rate([reference for _, _, reference in dataset], hypotheses),
+        "decode_seconds": decode_seconds,
+        "rtf": decode_seconds / audio_seconds,
+    }, recognizer
+
+
+def run_tts(texts, quantize, judge, args):
+    """Synthesize the texts with one configuration and transcribe the result"""
+    synthesizer = SpeechSynthesizer(args.tts_model, snapshot_dir=args.snapshot_dir, quantize=quantize)
+    synthesizer.synthesize(texts[0])
+
+    transcripts = []
+    synth_seconds = 0.0
+    audio_seconds = 0.0
+    for text in texts:
+        start = time.perf_counter()
+        wav = synthesizer.synthesize(text)
+        synth_seconds += time.perf_counter() - start
+        audio_seconds += len(wav) / synthesizer.get_sample_rate()
+        transcripts.append(judge.transcribe(np.asarray(wav, dtype=np.float32),
+                                            sample_rate=synthesizer.get_sample_rate())["text"])
+
+    return {
+        "quantize": quantize,
+        "round_trip_wer": word_error_rate(texts, transcripts),
+        "synth_seconds": synth_seconds,
+        "rtf": synth_seconds / max(audio_seconds, 1e-9),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ASR/TTS inference optimizations")
+    parser.add_argument("wav_dir", help="Directory of .wav files with .txt reference transcripts")
+    parser.add_argument("--model", default=config.ASR_MODEL, help="ESPnet ASR model tag")
+    parser.add_argument("--tts-model", default=config.TTS_MODEL, help="ESPnet TTS model tag")
+    parser.add_argument("--quantize", nargs="+", choices=["off", "on"], default=["off", "on"])
+    parser.add_argument("--beam-sizes", nargs="+", type=int, default=[None],
+                        help="Beam sizes to compare (default: the model's)")
+    parser.add_argument("--num-threads", nargs="+", type=int, default=[os.cpu_count()],
+                        help="Intra-op thread counts to compare")
+    parser.add_argument("--limit", type=int, default=None, help="Use only the first N files")
+    parser.add_argument("--tts", action="store_true", help="Also compare TTS with and without quantization")
+    parser.add_argument("--snapshot-dir", default=config.MODEL_SNAPSHOT_DIR,
+                        help="Model snapshot directory (speeds up reloading each configuration)")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.wav_dir, SpeechRecognizer.sample_rate, args.limit)
+    if not dataset:
+        print("No WAV files with reference transcripts found.")
+        return
+    print(f"{len(dataset)} files, {sum(len(a) for _, a, _ in dataset) / SpeechRecognizer.sample_rate:.0f} s of audio")
+
+    asr_results = []
+    judge = None
+    for quantize, beam_size, num_threads in itertools.product(args.quantize, args.beam_sizes, args.num_threads):
+        result, recognizer = run_asr(dataset, quantize == "on", beam_size, num_threads, args)
+        asr_results.append(result)
+        if judge is None:
+            judge = recognizer
+
+    baseline = asr_results[0]
+    print(f"\n{'quantize':>8} {'beam':>5} {'threads':>7} {'WER':>7} {'dWER':>7} {'RTF':>7} {'speedup':>7}")
+    for result in asr_results:
+        print(f"{str(result['quantize']):>8} {str(result['beam_size'] or 'model'):>5} {result['num_threads']:>7} "
+              f"{result['wer']:7.2%} {result['wer'] - baseline['wer']:+7.2%} {result['rtf']:7.3f} "
+              f"{baseline['decode_seconds'] / result['decode_seconds']:6.2f}x")
+
+    tts_results = []
+    if args.tts:
+        texts = [reference for _, _, reference in dataset]
+        tts_results = [run_tts(texts, quantize == "on", judge, args) for quantize in args.quantize]
+        print(f"\n{'TTS quantize':>12} {'round-trip WER':>14} {'RTF':>7} {'speedup':>7}")
+        for result in tts_results:
+            print(f"{str(result['quantize']):>12} {result['round_trip_wer']:14.2%} {result['rtf']:7.3f} "
+                  f"{tts_results[0]['synth_seconds'] / result['synth_seconds']:6.2f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"asr": asr_results, "tts": tts_results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
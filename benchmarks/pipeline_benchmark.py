@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""Offline benchmark of the voice pipeline
+
+Runs full conversation turns (record -> ASR -> LLM -> TTS -> playback)
+without a microphone, speakers or network: recorded WAV fixtures stand in
+for the microphone, a deterministic stub stands in for Gemini, and ASR/TTS
+are either the real ESPnet models or mocks with a fixed real-time factor.
+
+    python -m benchmarks.pipeline_benchmark --fixtures wavs/ --real-models
+    python -m benchmarks.pipeline_benchmark --baseline benchmarks/baseline.json
+
+Without --fixtures, synthetic utterances are generated, so the default run
+needs nothing but numpy and measures the pipeline code in modules/ itself.
+Reported: ASR and TTS real-time factor, time to first audio, turn latency
+percentiles (from the end of the user's speech), peak RSS and Python
+allocations. With --baseline, the results are compared with a stored run
+and the exit status is 1 if any metric got worse by more than --tolerance.
+--llm-error-rate and --llm-stall-rate inject faults into the stub LLM, and
+--llm-policy calls it through the timeout/retry/hedging policy of config.py.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+import config
+from modules.dialouge import DialogueManager
+from modules.llm_backends import ChatModelBackend, LocalBackend
+from modules.llm_policy import CircuitBreaker, ResilientBackend
+from modules.pipeline import TurnPipeline
+from modules.stub_llm import FaultInjectingBackend, StubModel
+from utils.audio_utils import preprocess_audio
+from utils.text_utils import split_sentences
+from utils.tracing import tracer
+
+# Set up logging
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+# Scripted LLM responses, cycled through the turns
+RESPONSES = [
+    "It should be sunny this afternoon. Expect a light breeze from the west, and a high of twenty degrees.",
+    "Sure. I have set a timer for ten minutes. I will let you know when it goes off.",
+    "The capital of Australia is Canberra. Many people guess Sydney, but Canberra was chosen as a compromise.",
+    "Here is a quick tip. Keep your answers short, and ask a follow-up question if anything is unclear.",
+]
+
+# Transcripts of the synthetic utterances (also what the mock recognizer returns for them)
+SYNTHETIC_TRANSCRIPTS = [
+    "what is the weather like today",
+    "set a timer for ten minutes",
+    "what is the capital of australia",
+    "give me a tip for my interview",
+]
+
+# Metrics compared with the baseline; lower is better for all of them
+METRICS = ["asr_rtf", "tts_rtf", "ttfa_p50", "ttfa_p95", "turn_p50", "turn_p95", "turn_p99",
+           "peak_rss_mb", "peak_alloc_mb"]
+
+
+def synthetic_utterance(index, sample_rate, seconds=2.0):
+    """Deterministic speech-like test signal (harmonic tone with a syllable envelope)"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = 120.0 + 20.0 * index
+    voice = sum(np.sin(2 * np.pi * f0 * k * t) / np.sqrt(k) for k in range(1, 8))
+    envelope = 0.5 * (1 - np.cos(2 * np.pi * 4.0 * t)) * (t < seconds - 0.3)
+    return (0.1 * voice * envelope).astype(np.float32)
+
+
+def load_fixtures(fixture_dir, sample_rate, count):
+    """(audio, transcript) pairs from a directory of WAVs, or synthetic ones"""
+    if fixture_dir is None:
+        return [(synthetic_utterance(i, sample_rate), SYNTHETIC_TRANSCRIPTS[i % len(SYNTHETIC_TRANSCRIPTS)])
+                for i in range(count)]
+
+    fixtures = []
+    for name in sorted(os.listdir(fixture_dir)):
+        if not name.lower().endswith(".wav"):
+            continue
+        audio, file_rate = sf.read(os.path.join(fixture_dir, name), dtype="float32")
+        text_path = os.path.join(fixture_dir, os.path.splitext(name)[0] + ".txt")
+        transcript = ""
+        if os.path.exists(text_path):
+            with open(text_path, "r", encoding="utf-8") as f:
+                transcript = f.read().strip()
+        fixtures.append((preprocess_audio(audio, target_sr=sample_rate, input_sr=file_rate), transcript))
+    return fixtures
+
+
+class FixtureAudioHandler:
+    def __init__(self, fixtures, sample_rate=16000, realtime_playback=False):
+        """Audio handler that records fixtures in turn and discards playback
+
+        Args:
+            fixtures: List of (audio, transcript); record() returns the audio in turn
+            sample_rate: Sample rate of the fixtures and of the played audio
+            realtime_playback: Make play() take as long as the audio would
+        """
+        self.fixtures = fixtures
+        self.sample_rate = sample_rate
+        self.realtime_playback = realtime_playback
+        self.played_seconds = 0.0
+        self._next = 0
+
+    def record(self):
+        audio, _ = self.fixtures[self._next % len(self.fixtures)]
+        self._next += 1
+        return audio
+
+    def play(self, audio_data, sample_rate=None):
+        seconds = len(audio_data) / (sample_rate or self.sample_rate)
+        self.played_seconds += seconds
+        if self.realtime_playback:
+            time.sleep(seconds)
+        return True
+
+
+class MockRecognizer:
+    def __init__(self, fixtures, rtf=0.1):
+        """Recognizer that returns the fixture transcripts after a fixed real-time factor"""
+        self.fixtures = fixtures
+        self.rtf = rtf
+
+    def transcribe(self, audio, sample_rate=16000):
+        time.sleep(len(audio) / sample_rate * self.rtf)
+        for fixture, transcript in self.fixtures:
+            if audio is fixture:
+                return {"text": transcript, "confidence": 1.0}
+        return {"text": "", "confidence": 0.0}
+
+
+class MockSynthesizer:
+    def __init__(self, sample_rate=22050, rtf=0.2, seconds_per_char=0.06):
+        """Synthesizer producing a tone as long as the text would take to say,
+        after a fixed real-time factor"""
+        self.sample_rate = sample_rate
+        self.rtf = rtf
+        self.seconds_per_char = seconds_per_char
+
+    def synthesize(self, text):
+        seconds = len(text) * self.seconds_per_char
+        time.sleep(seconds * self.rtf)
+        t = np.arange(int(seconds * self.sample_rate)) / self.sample_rate
+        return (0.1 * np.sin(2 * np.pi * 220.0 * t)).astype(np.float32)
+
+    def get_sample_rate(self):
+        return self.sample_rate
+
+
+def build_models(fixtures, args):
+    """Recognizer and synthesizer: the ESPnet models or mocks"""
+    if not args.real_models:
+        return MockRecognizer(fixtures, rtf=args.mock_asr_rtf), MockSynthesizer(rtf=args.mock_tts_rtf)
+
+    # Imported here so that mocked runs do not need torch and ESPnet
+    from modules.asr import SpeechRecognizer
+    from modules.tts import SpeechSynthesizer
+    recognizer = SpeechRecognizer(config.ASR_MODEL, snapshot_dir=config.MODEL_SNAPSHOT_DIR,
+                                  quantize=config.ASR_QUANTIZE, beam_size=config.ASR_BEAM_SIZE)
+    synthesizer = SpeechSynthesizer(config.TTS_MODEL, snapshot_dir=config.MODEL_SNAPSHOT_DIR,
+                                    quantize=config.TTS_QUANTIZE)
+    return recognizer, synthesizer
+
+
+def measure_rtf(recognizer, synthesizer, fixtures, sample_rate):
+    """Real-time factors of ASR over the fixtures and TTS over the response sentences"""
+    # The first calls pay for one-off initialization
+    recognizer.transcribe(fixtures[0][0], sample_rate=sample_rate)
+    synthesizer.synthesize(RESPONSES[0])
+
+    start = time.perf_counter()
+    for audio, _ in fixtures:
+        recognizer.transcribe(audio, sample_rate=sample_rate)
+    asr_rtf = (time.perf_counter() - start) / (sum(len(audio) for audio, _ in fixtures) / sample_rate)
+
+    synth_seconds = 0.0
+    audio_seconds = 0.0
+    for sentence in (s for response in RESPONSES for s in split_sentences(response)):
+        start = time.perf_counter()
+        wav = synthesizer.synthesize(sentence)
+        synth_seconds += time.perf_counter() - start
+        audio_seconds += len(wav) / synthesizer.get_sample_rate()
+    return asr_rtf, synth_seconds / max(audio_seconds, 1e-9)
+
+
+def make_llm_backend(args):
+    """Stub LLM backend, with injected faults and the retry policy if requested"""
+    stub = StubModel(RESPONSES, chunk_size=args.llm_chunk_words, first_chunk_delay=args.llm_latency,
+                     chunk_delay=args.llm_chunk_words / args.llm_tokens_per_second)
+    backend = ChatModelBackend(stub)
+    if args.llm_error_rate or args.llm_stall_rate:
+        backend = FaultInjectingBackend(backend, error_rate=args.llm_error_rate, stall_rate=args.llm_stall_rate,
+                                        stall_time=args.llm_stall_time, seed=1)
+    if args.llm_policy:
+        # Hedging starts after a few turns, so that short runs exercise it
+        backend = ResilientBackend(backend, timeout=config.LLM_TIMEOUT, deadline=config.LLM_DEADLINE,
+                                   max_retries=config.LLM_MAX_RETRIES, hedge=config.LLM_HEDGE,
+                                   hedge_min_samples=5,
+                                   breaker=CircuitBreaker(config.LLM_BREAKER_FAILURES, config.LLM_BREAKER_RESET))
+    return backend
+
+
+def make_pipeline(recognizer, synthesizer, fixtures, sample_rate, args):
+    """Pipeline with the stub LLM, recording from the fixtures"""
+    dialogue = DialogueManager(api_key=None, backend=make_llm_backend(args), fallback=LocalBackend())
+    audio_handler = FixtureAudioHandler(fixtures, sample_rate=sample_rate, realtime_playback=args.realtime_playback)
+    return TurnPipeline(recognizer, dialogue, synthesizer, audio_handler)
+
+
+def run_turns(pipeline, turns):
+    for _ in range(turns):
+        pipeline.run_turn()
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(args):
+    sample_rate = config.SAMPLE_RATE
+    fixtures = load_fixtures(args.fixtures, sample_rate, args.turns)
+    if not fixtures:
+        raise SystemExit(f"No WAV fixtures found in {args.fixtures}")
+    recognizer, synthesizer = build_models(fixtures, args)
+    asr_rtf, tts_rtf = measure_rtf(recognizer, synthesizer, fixtures, sample_rate)
+
+    # Timed turns, after one warm-up turn
+    pipeline = make_pipeline(recognizer, synthesizer, fixtures, sample_rate, args)
+    tracer.enable()
+    run_turns(pipeline, 1)
+    tracer.clear()
+    run_turns(pipeline, args.turns)
+    tracer.disable()
+    histograms = tracer.histograms()
+    if args.trace:
+        tracer.write_chrome_trace(args.trace)
+
+    # Allocations are traced in a separate pass, as tracemalloc slows everything down
+    pipeline = make_pipeline(recognizer, synthesizer, fixtures, sample_rate, args)
+    tracemalloc.start()
+    run_turns(pipeline, min(args.turns, 5))
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    first_audio = histograms.get("turn.first_audio", {})
+    done = histograms.get("turn.done", {})
+    return {
+        "config": {
+            "real_models": args.real_models,
+            "fixtures": args.fixtures,
+            "turns": args.turns,
+            "llm_latency": args.llm_latency,
+            "llm_tokens_per_second": args.llm_tokens_per_second,
+            "llm_error_rate": args.llm_error_rate,
+            "llm_stall_rate": args.llm_stall_rate,
+            "llm_policy": args.llm_policy,
+            "realtime_playback": args.realtime_playback,
+        },
+        "metrics": {
+            "asr_rtf": asr_rtf,
+            "tts_rtf": tts_rtf,
+            "ttfa_p50": first_audio.get("p50"),
+            "ttfa_p95": first_audio.get("p95"),
+            "turn_p50": done.get("p50"),
+            "turn_p95": done.get("p95"),
+            "turn_p99": done.get("p99"),
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_alloc_mb": peak_alloc / (1024 * 1024),
+        },
+        "stages": histograms,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print the metrics next to the baseline; return the names of regressed metrics"""
+    if baseline["config"] != results["config"]:
+        print("Warning: the baseline was recorded with different settings:", baseline["config"])
+
+    regressions = []
+    print(f"\n{'metric':<14} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in METRICS:
+        old, new = baseline["metrics"].get(name), results["metrics"].get(name)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<14} {old:10.3f} {new:10.3f} {change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the voice pipeline")
+    parser.add_argument("--fixtures", default=None,
+                        help="Directory of .wav utterances (with optional .txt transcripts); "
+                             "synthetic utterances are used if omitted")
+    parser.add_argument("--turns", type=int, default=10, help="Number of timed turns")
+    parser.add_argument("--real-models", action="store_true", help="Use the ESPnet models instead of mocks")
+    parser.add_argument("--mock-asr-rtf", type=float, default=0.1, help="Real-time factor of the mock recognizer")
+    parser.add_argument("--mock-tts-rtf", type=float, default=0.2, help="Real-time factor of the mock synthesizer")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Stub LLM time to first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=40.0, help="Stub LLM streaming rate")
+    parser.add_argument("--llm-chunk-words", type=int, default=4, help="Words per streamed stub LLM chunk")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0,
+                        help="Fraction of stub LLM calls that fail with a transient error")
+    parser.add_argument("--llm-stall-rate", type=float, default=0.0,
+                        help="Fraction of stub LLM calls that hang before their first token")
+    parser.add_argument("--llm-stall-time", type=float, default=5.0, help="Seconds a stalled stub LLM call hangs")
+    parser.add_argument("--llm-policy", action="store_true",
+                        help="Call the stub LLM with the timeout, retry and hedging policy from config.py")
+    parser.add_argument("--realtime-playback", action="store_true",
+                        help="Make playback take as long as the audio (default: discard it instantly)")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--trace", default=None, help="Write a Chrome trace of the timed turns to this file")
+    parser.add_argument("--baseline", default=None, help="Compare with the results stored in this JSON file")
+    parser.add_argument("--save-baseline", default=None, help="Store the results as a baseline in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative increase of a metric reported as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+
+    print(f"\n{'stage':<24} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in results["stages"].items():
+        print(f"{name:<24} {stats['count']:>6} {stats['p50'] * 1000:9.1f} {stats['p95'] * 1000:9.1f} "
+              f"{stats['p99'] * 1000:9.1f}")
+    print()
+    for name in METRICS:
+        value = results["metrics"][name]
+        print(f"{name:<14} {value:10.3f}" if value is not None else f"{name:<14} {'n/a':>10}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,16 +8,92 @@ SAMPLE_RATE = 16000
 CHANNELS = 1
 CHUNK_SIZE = 1024
 FORMAT = "int16"  # Format for PyAudio
+VAD_END_OF_SPEECH_MS = 700  # Silence after speech that ends a recording
+VAD_PRE_ROLL_MS = 300  # Audio kept from before the detected speech onset
+
+# Playback through one persistent output stream
+OUTPUT_BLOCK_SIZE = 512  # Frames per output callback
+PLAYBACK_CROSSFADE_MS = 10  # Overlap between consecutive synthesized sentences
+
+# Barge-in: talking over the assistant interrupts its response
+BARGE_IN_ENABLED = True
+BARGE_IN_MIN_SPEECH_MS = 200  # Speech over the playback needed to interrupt
+BARGE_IN_ECHO_MARGIN = 2.0  # How much louder than the expected echo the user must be
+
+# Models are loaded in the background while the greeting plays; loaded
+# models are pickled here and reload faster than the pretrained files
+LAZY_MODEL_LOADING = True
+MODEL_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".model_snapshots")
+
+# CPU inference tuning (None leaves torch's defaults)
+TORCH_NUM_THREADS = None  # Intra-op threads per model call
+TORCH_INTEROP_THREADS = None  # Threads for running independent ops in parallel
+
+# Latency tracing of each turn (end of speech -> transcript -> first token
+# -> first audio -> done); a latency report is logged on exit
+TRACING_ENABLED = False
+TRACE_JSON_PATH = None  # p50/p95/p99 of every stage, as JSON
+TRACE_CHROME_PATH = None  # All spans, for chrome://tracing or ui.perfetto.dev
 
 # ASR model settings
 ASR_MODEL = "espnet/librispeech_asr_train_asr_conformer6_n_fft512_hop_length256_raw_en_bpe5000_sp"
+ASR_QUANTIZE = False  # int8 dynamic quantization: faster decoding, slightly higher WER
+ASR_BEAM_SIZE = None  # Smaller beams decode faster (None for the model default)
 
 # TTS model settings
 TTS_MODEL = "espnet/ljspeech_tts_train_transformer_raw_phn_tacotron_g2p_en_no_space_train.loss.ave"
+TTS_QUANTIZE = False  # int8 dynamic quantization of the acoustic model
+TTS_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".tts_cache")
+TTS_CACHE_MEMORY_BYTES = 64 * 1024 * 1024
+TTS_CACHE_DISK_BYTES = 512 * 1024 * 1024
+TTS_CACHE_PERSIST_ALL = False  # Write every response sentence to disk, not only the canned phrases
+
+# Fixed phrases synthesized into the TTS cache at startup
+GREETING = "Hi there! I'm Alex, your AI assistant. How can I help you today?"
+NOT_UNDERSTOOD_PHRASE = "I couldn't understand that. Could you please try again?"
+GOODBYE_PHRASE = "Goodbye! It was nice talking with you."
+CANNED_PHRASES = [
+    GREETING,
+    NOT_UNDERSTOOD_PHRASE,
+    GOODBYE_PHRASE,
+    "I didn't catch that. Could you please repeat?",
+    "I'm having trouble processing that. Could you try again?",
+]
 
 # Dialogue settings
+LLM_BACKEND = "gemini"  # "gemini", or "local" for a scripted offline responder
+LLM_POOL_SIZE = 16  # Keep-alive connections (and concurrent requests) to the Gemini API
 MODEL_NAME = "gemini-2.0-flash"
+LLM_TIMEOUT = 8.0  # Seconds an LLM request may go without producing text before it is abandoned
+LLM_DEADLINE = 15.0  # Seconds to get the first token of a response, retries included
+LLM_MAX_RETRIES = 2  # Retries of failed requests (with jittered exponential backoff)
+LLM_HEDGE = True  # Send a second request when the first has no token by the p95 time to first token
+LLM_BREAKER_FAILURES = 5  # Consecutive failures after which the LLM is not called for a while
+LLM_BREAKER_RESET = 30.0  # Seconds before the LLM is tried again
+SPECULATIVE_LLM = False  # Start the LLM at pauses before the endpoint: faster replies, up to one extra request per pause
+LLM_FALLBACK_LOCAL = True  # Answer with the offline responder when the LLM fails and the cache has no answer
+CONTEXT_TOKEN_BUDGET = 2048  # Tokens of conversation history sent with each request
+SUMMARY_TOKEN_BUDGET = 256  # Tokens of rolling summary for turns evicted from the history
 SYSTEM_PROMPT = """
 You are a helpful, intelligent assistant. 
 Be concise, friendly, and helpful in your responses.
-"""
\ No newline at end of file
+"""
+
+# Response cache settings
+RESPONSE_CACHE_MAX_BYTES = 2 * 1024 * 1024
+RESPONSE_CACHE_TTL = 24 * 3600  # Seconds
+RESPONSE_CACHE_SIMILARITY = None  # Cosine similarity for near-duplicate prompts, e.g. 0.9 (None for exact matches only)
+
+# Conversation log: JSONL segments plus an index of each session's records
+CONVERSATION_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversation_logs")
+CONVERSATION_LOG_MAX_BYTES = 16 * 1024 * 1024  # Size at which a new segment file is started
+
+# Session store: conversations are saved turn by turn and can be resumed
+# after a restart or on another server process sharing the store
+SESSION_STORE_BACKEND = "sqlite"  # "sqlite", "mmap" or None to keep sessions in memory only
+SESSION_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+SESSION_CACHE_SIZE = 256  # Sessions kept in memory per process
+
+# Server settings
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
@@ -1,38 +1,316 @@
 import numpy as np
-from espnet2.bin.asr_inference import Speech2Text
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.model_loader import (LazyModel, inference_mode, load_snapshot, quantize_dynamic, save_snapshot,
+                                  snapshot_path)
+from modules.vad import VoiceActivityDetector
+from utils.resample import resample
+from utils.tracing import traced
 
 
 class SpeechRecognizer:
-    def __init__(self, model_name):
-        """Initialize the speech recognizer with a pre-trained model"""
-        try:
-            self.model = Speech2Text.from_pretrained(model_name)
-            logging.info(f"Loaded ASR model: {model_name}")
-        except Exception as e:
-            logging.error(f"Failed to load ASR model: {e}")
-            raise
+    # Sample rate the ASR model was trained on
+    sample_rate = 16000
+
+    def __init__(self, model_name, lazy=False, snapshot_dir=None, quantize=False, beam_size=None):
+        """Initialize the speech recognizer with a pre-trained model
+
+        Args:
+            model_name: ESPnet ASR model tag
+            lazy: Load the model on first use (or in the background with
+                start_loading()) instead of now
+            snapshot_dir: Optional directory for a pickled snapshot of the
+                loaded model, which reloads faster than the pretrained files
+            quantize: Quantize the Linear/LSTM layers to int8 for faster CPU decoding
+            beam_size: Beam search width (None for the model's default); a
+                smaller beam decodes faster at some cost in accuracy
+        """
+        self.model_name = model_name
+        self.snapshot_dir = snapshot_dir
+        self.quantize = quantize
+        self.decode_params = {"beam_size": beam_size} if beam_size else {}
+        self._model = LazyModel(f"ASR model {model_name}", self._load_model, warm_up=self._warm_up)
+        if not lazy:
+            self._model.get()
+
+    @property
+    def model(self):
+        """The Speech2Text model (waits for it to be loaded)"""
+        return self._model.get()
+
+    def _load_model(self):
+        # Imported here so that importing this module does not pull in espnet and torch
+        from espnet2.bin.asr_inference import Speech2Text
+
+        path = None
+        if self.snapshot_dir:
+            path = snapshot_path(self.snapshot_dir, "asr", self.model_name, self.decode_params)
+        model = load_snapshot(path) if path else None
+        if model is None:
+            model = Speech2Text.from_pretrained(self.model_name, **self.decode_params)
+            if path:
+                save_snapshot(path, model)
+
+        # Snapshots hold the fp32 model; quantization is cheap to redo
+        if self.quantize and str(model.device) == "cpu":
+            quantize_dynamic(model.asr_model, model.beam_search)
+            logging.info("Quantized ASR model to int8")
+        logging.info(f"Loaded ASR model: {self.model_name}")
+        return model
+
+    def _warm_up(self, model):
+        # A short decode initializes the kernels and allocator before the first utterance
+        with inference_mode():
+            model(np.zeros(self.sample_rate // 2, dtype=np.float32))
+
+    def start_loading(self):
+        """Load and warm up the model in a background thread"""
+        self._model.start()
+
+    @property
+    def load_seconds(self):
+        """Time taken to load the model, or None while it is not loaded yet"""
+        return self._model.load_seconds
+
+    def _prepare(self, audio, sample_rate):
+        """Convert audio to mono float32 at the model's rate, within [-1, 1]"""
+        # Ensure audio is in the correct format
+        if audio.dtype != np.float32:
+            audio = audio.astype(np.float32)
+
+        # If audio is stereo, convert to mono
+        if len(audio.shape) > 1:
+            audio = audio.mean(axis=1)
 
+        # Resample to the model's rate
+        if sample_rate != self.sample_rate:
+            audio = resample(audio, sample_rate, self.sample_rate)
+
+        # Normalize audio
+        if np.abs(audio).max() > 1.0:
+            audio = audio / np.abs(audio).max()
+
+        return audio
+
+    @traced("asr.transcribe")
     def transcribe(self, audio, sample_rate=16000):
         """Convert speech to text"""
         try:
-            # Ensure audio is in the correct format
-            if audio.dtype != np.float32:
-                audio = audio.astype(np.float32)
-
-            # If audio is stereo, convert to mono
-            if len(audio.shape) > 1:
-                audio = audio.mean(axis=1)
-
-            # Normalize audio
-            if np.abs(audio).max() > 1.0:
-                audio = audio / np.abs(audio).max()
+            audio = self._prepare(audio, sample_rate)
 
             # Recognize speech
-            nbests = self.model(audio)
+            model = self.model
+            with inference_mode():
+                nbests = model(audio)
             text, *_ = nbests[0]
 
             return {"text": text, "confidence": 1.0}
         except Exception as e:
             logging.error(f"Transcription error: {e}")
-            return {"text": "", "confidence": 0.0}
\ No newline at end of file
+            return {"text": "", "confidence": 0.0, "error": str(e)}
+
+    def transcribe_batch(self, audios, sample_rate=16000):
+        """Convert a batch of utterances to text
+
+        The encoder runs once over the zero-padded batch; beam search then
+        decodes each utterance from its slice of the encoder output. Batches
+        are most efficient when the utterances have similar lengths.
+
+        Returns:
+            List of results, like transcribe(), in input order
+        """
+        import torch
+
+        audios = [audio for audio in audios]
+        decode_single = getattr(self.model, "_decode_single_sample", None)
+        if len(audios) <= 1 or decode_single is None:
+            # Older ESPnet releases cannot decode a slice of a batched encoder output
+            return [self.transcribe(audio, sample_rate) for audio in audios]
+
+        try:
+            prepared = [self._prepare(audio, sample_rate) for audio in audios]
+            lengths = torch.tensor([len(audio) for audio in prepared], dtype=torch.long)
+            speech = torch.zeros(len(prepared), int(lengths.max()), dtype=getattr(torch, self.model.dtype))
+            for i, audio in enumerate(prepared):
+                speech[i, :len(audio)] = torch.from_numpy(audio)
+
+            with inference_mode():
+                enc, enc_lengths = self.model.asr_model.encode(
+                    speech.to(self.model.device), lengths.to(self.model.device))
+                if isinstance(enc, tuple):  # Models with intermediate CTC outputs
+                    enc = enc[0]
+
+                results = []
+                for i in range(len(prepared)):
+                    nbests = decode_single(enc[i, :enc_lengths[i]])
+                    text = nbests[0][0] or ""
+                    results.append({"text": text, "confidence": 1.0})
+            return results
+        except Exception as e:
+            logging.error(f"Batch transcription error: {e}")
+            return [{"text": "", "confidence": 0.0, "error": str(e)} for _ in audios]
+
+    def transcribe_stream(self, chunks, sample_rate=16000, on_partial=None, on_stable=None, **kwargs):
+        """Transcribe audio chunks while they are still being captured
+
+        Args:
+            chunks: Iterable of float32 audio chunks (e.g. AudioHandler.stream())
+            sample_rate: Sample rate of the chunks
+            on_partial: Optional callback receiving each new partial transcript
+            on_stable: Optional callback receiving the transcript of all the
+                speech so far whenever a pause has been decoded
+            **kwargs: Extra StreamingTranscriber options
+
+        Returns:
+            Final transcription result, like transcribe()
+        """
+        transcriber = StreamingTranscriber(self, sample_rate=sample_rate, on_partial=on_partial,
+                                           on_stable=on_stable, **kwargs)
+        for chunk in chunks:
+            transcriber.feed(chunk)
+        return transcriber.finish()
+
+
+class StreamingTranscriber:
+    def __init__(self, recognizer, sample_rate=16000, pause_ms=250, max_segment_s=8.0,
+                 partial_interval_ms=400, on_partial=None, on_stable=None):
+        """Incremental transcription on top of a full-utterance recognizer
+
+        The non-streaming Conformer model cannot carry encoder state between
+        chunks, so the audio is cut into segments at short pauses inside the
+        utterance (or after max_segment_s) and each segment is decoded in a
+        background thread as soon as it is closed. While a segment is still
+        open it is re-decoded every partial_interval_ms to produce partial
+        hypotheses. At the end of speech only the last segment is left to
+        decode, so the final transcript is ready shortly after the endpoint.
+
+        A pause is shorter than the end-of-speech hangover, so when the user
+        has finished, the last segment is usually decoded before the
+        endpoint. on_stable then receives the transcript of everything said
+        so far, which is the final transcript unless the user speaks again.
+
+        Args:
+            recognizer: SpeechRecognizer (or any object with transcribe(audio, sample_rate))
+            sample_rate: Sample rate of the fed audio
+            pause_ms: Silence inside the utterance that closes a segment
+            max_segment_s: Longest segment before it is closed regardless
+            partial_interval_ms: Minimum audio between partial decodes
+            on_partial: Optional callback receiving each new partial transcript
+            on_stable: Optional callback receiving the transcript of all the
+                closed segments after a pause closed the last one (called
+                from the decoding thread, never after finish() returns)
+        """
+        self.recognizer = recognizer
+        self.sample_rate = sample_rate
+        self.max_segment_samples = int(max_segment_s * sample_rate)
+        self.partial_interval_samples = int(partial_interval_ms * sample_rate / 1000)
+        self.on_partial = on_partial
+        self.on_stable = on_stable
+
+        # Detects the short pauses that separate segments
+        self.pause_detector = VoiceActivityDetector(sample_rate=sample_rate, end_of_speech_ms=pause_ms,
+                                                    pre_roll_ms=0)
+
+        # Decodes run one at a time, in the order they were submitted
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr-stream")
+        self._segments = []  # Futures of closed segment transcripts
+        self._open = []  # Chunks of the segment still being spoken
+        self._open_samples = 0
+        self._has_speech = False
+        self._since_partial = 0
+        self._partial_future = None
+        self._finished = False
+        self._stable_lock = threading.Lock()
+        self.partial_text = ""
+
+    def _decode(self, audio):
+        return self.recognizer.transcribe(audio, sample_rate=self.sample_rate)["text"].strip()
+
+    def feed(self, chunk):
+        """Add a chunk of audio
+
+        Returns:
+            The latest partial transcript
+        """
+        self._open.append(chunk)
+        self._open_samples += len(chunk)
+        self._since_partial += len(chunk)
+
+        state = self.pause_detector.process(chunk)
+        if state in (VoiceActivityDetector.SPEECH_START, VoiceActivityDetector.SPEECH):
+            self._has_speech = True
+
+        if state == VoiceActivityDetector.SPEECH_END and self._has_speech:
+            self._close_segment(pause=True)
+        elif self._open_samples >= self.max_segment_samples:
+            self._close_segment()
+        elif self._has_speech and self._since_partial >= self.partial_interval_samples:
+            self._request_partial()
+
+        return self.partial_text
+
+    def _close_segment(self, pause=False):
+        """Submit the open segment for decoding and start a new one"""
+        if self._has_speech:
+            audio = np.concatenate(self._open)
+            future = self._executor.submit(self._decode, audio)
+            self._segments.append(future)
+            if pause and self.on_stable is not None:
+                segments = list(self._segments)
+                future.add_done_callback(lambda _: self._publish_stable(segments))
+        self._open = []
+        self._open_samples = 0
+        self._has_speech = False
+        self._since_partial = 0
+
+    def _request_partial(self):
+        """Decode the open segment in the background unless the decoder is busy"""
+        if self._partial_future is not None and not self._partial_future.done():
+            return
+        if any(not future.done() for future in self._segments):
+            return
+
+        self._since_partial = 0
+        audio = np.concatenate(self._open)
+        committed = [future.result() for future in self._segments]
+        self._partial_future = self._executor.submit(self._decode, audio)
+        self._partial_future.add_done_callback(lambda future: self._publish_partial(committed, future))
+
+    def _publish_partial(self, committed, future):
+        try:
+            text = future.result()
+        except Exception as e:
+            logging.error(f"Partial transcription error: {e}")
+            return
+        self.partial_text = " ".join(t for t in committed + [text] if t)
+        if self.on_partial is not None:
+            self.on_partial(self.partial_text)
+
+    def _publish_stable(self, segments):
+        try:
+            # Decodes run in order, so the earlier segments are done too
+            text = " ".join(t for t in (future.result() for future in segments) if t)
+        except Exception as e:
+            logging.error(f"Stable transcription error: {e}")
+            return
+        with self._stable_lock:
+            if text and not self._finished:
+                self.on_stable(text)
+
+    def finish(self):
+        """Decode what is left and return the final transcript
+
+        Returns:
+            Dictionary with the transcribed text and confidence
+        """
+        self._close_segment()
+        try:
+            texts = [future.result() for future in self._segments]
+        finally:
+            with self._stable_lock:
+                self._finished = True
+            self._executor.shutdown(wait=False)
+        text = " ".join(t for t in texts if t)
+        return {"text": text, "confidence": 1.0 if text else 0.0}
@@ -0,0 +1,219 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+
+class AudioCache:
+    def __init__(self, cache_dir=None, max_memory_bytes=64 * 1024 * 1024,
+                 max_disk_bytes=512 * 1024 * 1024, disk_dtype="float32", persist_all=True):
+        """Two-level cache of synthesized waveforms
+
+        Waveforms are kept in an in-memory LRU and, if cache_dir is set, in
+        .npy files that are memory-mapped on load, so a phrase synthesized in
+        an earlier run costs a page-in rather than a model call.
+
+        Args:
+            cache_dir: Directory for the on-disk cache (None for memory only)
+            max_memory_bytes: Size limit of the in-memory cache
+            max_disk_bytes: Size limit of the on-disk cache
+            disk_dtype: "float32" (memory-mapped as is) or "int16" (half the
+                size, converted back to float32 on load)
+            persist_all: Whether every waveform is written to disk, or only
+                those put with persist=True (e.g. fixed phrases)
+        """
+        if disk_dtype not in ("float32", "int16"):
+            raise ValueError(f"Unsupported disk dtype: {disk_dtype}")
+
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dtype = disk_dtype
+        self.persist_all = persist_all
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        # Files of the disk cache, least recently used first: key -> size
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def make_key(text, model_name, params=None):
+        """Cache key for text synthesized by model_name with the given params"""
+        payload = json.dumps([text, model_name, params or {}], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key):
+        """Return the cached waveform for key, or None"""
+        with self._lock:
+            wav = self._memory.get(key)
+            if wav is not None:
+                self._memory.move_to_end(key)
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                self.hits += 1
+                return wav
+
+        wav = self._load(key)
+        with self._lock:
+            if wav is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, wav)
+        return wav
+
+    def put(self, key, wav, persist=None):
+        """Cache a float32 waveform under key
+
+        Args:
+            key: Cache key (see make_key())
+            wav: Waveform
+            persist: Whether to write it to disk as well (None for persist_all)
+        """
+        wav = np.asarray(wav, dtype=np.float32)
+        if persist is None:
+            persist = self.persist_all
+        if self.cache_dir and persist:
+            self._store(key, wav)
+            # Serve later hits from the memory map rather than the private copy
+            wav = self._load(key) if self.disk_dtype == "float32" else wav
+        with self._lock:
+            self._remember(key, wav)
+
+    def _remember(self, key, wav):
+        """Add wav to the in-memory LRU (lock held)"""
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key).nbytes
+        if wav.nbytes > self.max_memory_bytes:
+            return
+        self._memory[key] = wav
+        self._memory_bytes += wav.nbytes
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _load(self, key):
+        """Load a waveform from disk, memory-mapped where possible"""
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            data = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+        # Mark as recently used for disk eviction, also in later runs
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        if data.dtype == np.int16:
+            return data.astype(np.float32) / 32767.0
+        return data
+
+    def _store(self, key, wav):
+        """Write a waveform to disk atomically and enforce the disk size limit
+
+        The size of the disk cache is tracked in memory, so the directory is
+        only listed once, when the cache is opened.
+        """
+        if self.disk_dtype == "int16":
+            data = (np.clip(wav, -1.0, 1.0) * 32767.0).astype(np.int16)
+        else:
+            data = wav
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, data)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Failed to write audio cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._disk_bytes += size
+            evicted = self._evict_disk()
+        self._delete(evicted)
+
+    def _scan_disk(self):
+        """Index the files left by earlier runs, by last use"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npy"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(".npy")], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        with self._lock:
+            evicted = self._evict_disk()
+        self._delete(evicted)
+
+    def _evict_disk(self):
+        """Drop least recently used files from the index until it fits the limit (lock held)
+
+        Returns:
+            Keys of the files to delete
+        """
+        evicted = []
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(key)
+        return evicted
+
+    def _delete(self, keys):
+        """Delete the files of evicted keys"""
+        for key in keys:
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Hit/miss counters and in-memory and on-disk size"""
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
@@ -1,14 +1,20 @@
 import numpy as np
 import sounddevice as sd
-import queue
 import threading
 import time
 import logging
 import pyaudio
 
+from modules.audio_output import AudioOutputStream
+from modules.vad import VoiceActivityDetector
+from utils.resample import resample
+from utils.ring_buffer import RingBuffer
+from utils.tracing import traced, tracer
+
 
 class AudioHandler:
-    def __init__(self, sample_rate=16000, channels=1, chunk_size=1024, format='int16'):
+    def __init__(self, sample_rate=16000, channels=1, chunk_size=1024, format='int16',
+                 end_of_speech_ms=700, pre_roll_ms=300, buffer_seconds=120):
         self.sample_rate = sample_rate
         self.channels = channels
         self.chunk_size = chunk_size
@@ -25,39 +31,49 @@ class AudioHandler:
         # Initialize PyAudio
         self.p = pyaudio.PyAudio()
 
-        # Recording variables
-        self.buffer_queue = queue.Queue()
+        # Recording variables: the capture callback converts samples straight
+        # into a preallocated ring buffer and notifies the readers, which keep
+        # their own read positions (the recorder and the barge-in monitor can
+        # read the same capture at once)
+        self.ring = RingBuffer(int(buffer_seconds * sample_rate))
+        self.captured = threading.Condition()
         self.is_recording = False
         self.recording = []
 
-        # Auto-stop settings
-        self.silence_threshold = 0.01
-        self.silence_frames = 0
-        self.max_silence_frames = 30  # 30 chunks of silence to auto-stop
+        # Persistent input stream for full-duplex operation (see start_capture)
+        self.capture_stream = None
+
+        # Persistent output stream for gapless playback (see start_output)
+        self.output = None
+
+        # Set to cut the current playback short
+        self.playback_stopped = threading.Event()
+
+        # Scale factors from integer samples to [-1, 1]
+        self.dtype, self.scale = {
+            pyaudio.paInt16: (np.int16, 1.0 / 32767.0),
+            pyaudio.paInt32: (np.int32, 1.0 / 2147483647.0),
+            pyaudio.paFloat32: (np.float32, 1.0),
+        }[self.pa_format]
+
+        # Auto-stop settings: endpointing by voice activity detection
+        self.vad = VoiceActivityDetector(
+            sample_rate=sample_rate,
+            end_of_speech_ms=end_of_speech_ms,
+            pre_roll_ms=pre_roll_ms
+        )
 
     def record_callback(self, in_data, frame_count, time_info, status):
         """Callback for recording"""
         if status:
             logging.warning(f"Recording status: {status}")
-        self.buffer_queue.put(in_data)
+        with self.captured:
+            self.ring.write_converted(in_data, self.dtype, self.scale, self.channels)
+            self.captured.notify_all()
         return (None, pyaudio.paContinue)
 
-    def record(self, duration=None, auto_stop=True):
-        """Record audio from microphone
-
-        Args:
-            duration: Maximum recording duration in seconds (None for unlimited)
-            auto_stop: Whether to automatically stop recording after silence
-
-        Returns:
-            Audio data as numpy array
-        """
-        self.is_recording = True
-        self.recording = []
-        self.silence_frames = 0
-
-        # Open recording stream
-        stream = self.p.open(
+    def _open_input(self):
+        return self.p.open(
             format=self.pa_format,
             channels=self.channels,
             rate=self.sample_rate,
@@ -66,7 +82,63 @@ class AudioHandler:
             stream_callback=self.record_callback
         )
 
-        stream.start_stream()
+    def start_capture(self):
+        """Keep the microphone open, also while audio is being played
+
+        stream() and record() then read from the running capture instead of
+        opening a stream per utterance, and audio captured during playback
+        stays available (e.g. for barge-in detection).
+        """
+        if self.capture_stream is None:
+            self.capture_stream = self._open_input()
+            self.capture_stream.start_stream()
+            logging.info("Continuous capture started")
+
+    def stop_capture(self):
+        """Close the input stream opened by start_capture()"""
+        if self.capture_stream is not None:
+            self.capture_stream.stop_stream()
+            self.capture_stream.close()
+            self.capture_stream = None
+
+    def wait_for_audio(self, read_pos, timeout=0.1):
+        """Wait until audio beyond read_pos has been captured
+
+        Returns:
+            The current write position (equal to read_pos on timeout)
+        """
+        with self.captured:
+            self.captured.wait_for(lambda: self.ring.written > read_pos, timeout)
+            return self.ring.written
+
+    def stream(self, duration=None, auto_stop=True, start_pos=None):
+        """Yield audio chunks from the microphone as they are captured
+
+        Args:
+            duration: Maximum recording duration in seconds (None for unlimited)
+            auto_stop: Whether to stop when the voice activity detector sees
+                the end of speech; audio from before the speech onset (beyond
+                the pre-roll) is then dropped
+            start_pos: Ring buffer position to start reading from, to include
+                audio captured before the call (only with start_capture())
+
+        Yields:
+            Mono float32 chunks, starting with the pre-roll once speech is
+            detected. Chunks are read-only views into the ring buffer, valid
+            until buffer_seconds more audio has been captured.
+        """
+        self.is_recording = True
+        self.vad.reset()
+        speech_started = False
+
+        # Open a recording stream unless the capture is already running
+        stream = None
+        if self.capture_stream is None or start_pos is None:
+            start_pos = self.ring.written
+        if self.capture_stream is None:
+            stream = self._open_input()
+            stream.start_stream()
+        read_pos = start_pos
         logging.info("Recording started...")
         print("Listening... (speak now)")
 
@@ -78,74 +150,213 @@ class AudioHandler:
                     self.is_recording = False
                     break
 
-                # Process recorded data
-                if not self.buffer_queue.empty():
-                    data = self.buffer_queue.get()
-                    self.recording.append(data)
-
-                    # Check for silence to auto-stop
-                    if auto_stop:
-                        # Convert bytes to numpy array
-                        if self.pa_format == pyaudio.paInt16:
-                            data_np = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32767.0
-                        elif self.pa_format == pyaudio.paInt32:
-                            data_np = np.frombuffer(data, dtype=np.int32).astype(np.float32) / 2147483647.0
-                        elif self.pa_format == pyaudio.paFloat32:
-                            data_np = np.frombuffer(data, dtype=np.float32)
-
-                        # Calculate energy
-                        energy = np.sqrt(np.mean(data_np ** 2))
-                        is_speech = energy > self.silence_threshold
-
-                        if not is_speech:
-                            self.silence_frames += 1
-                        else:
-                            self.silence_frames = 0
-
-                        # Stop if silence threshold is exceeded and we have some speech
-                        if self.silence_frames > self.max_silence_frames and len(self.recording) > 5:
-                            self.is_recording = False
-                else:
-                    time.sleep(0.01)
+                # Wait for the next chunk instead of polling
+                write_pos = self.wait_for_audio(read_pos)
+                if write_pos == read_pos:
+                    continue
+                if write_pos - read_pos > self.ring.capacity:
+                    # The reader fell behind by more than the buffer holds
+                    lost = write_pos - self.ring.capacity - read_pos
+                    logging.error(f"Audio reader overrun, {lost / self.sample_rate:.2f}s of audio lost")
+                    read_pos = write_pos - self.ring.capacity
+                chunk_pos = read_pos
+                chunk = self.ring.view(chunk_pos, write_pos)
+                read_pos = write_pos
+
+                if not auto_stop:
+                    yield chunk
+                    continue
+
+                state = self.vad.process(chunk)
+                if state == VoiceActivityDetector.SPEECH_START:
+                    speech_started = True
+                    # The pre-roll is still in the ring buffer
+                    pre_roll_pos = max(chunk_pos - self.vad.pre_roll_samples, start_pos)
+                    if pre_roll_pos < chunk_pos:
+                        yield self.ring.view(pre_roll_pos, chunk_pos)
+
+                if speech_started:
+                    yield chunk
+                    if state == VoiceActivityDetector.SPEECH_END:
+                        tracer.milestone("end_of_speech")
+                        self.is_recording = False
         finally:
-            stream.stop_stream()
-            stream.close()
+            self.is_recording = False
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
+            print("Recording finished.")
+
+    @traced("audio.record")
+    def record(self, duration=None, auto_stop=True):
+        """Record audio from microphone
 
-        print("Recording finished.")
+        Args:
+            duration: Maximum recording duration in seconds (None for unlimited)
+            auto_stop: Whether to automatically stop recording after the end of speech
+
+        Returns:
+            Audio data as numpy array
+        """
+        # The chunks are views into the ring buffer, which would overwrite the
+        # start of a recording longer than the buffer: past half the buffer
+        # the chunks so far are compacted into one copy and the rest copied
+        self.recording = []
+        recorded = 0
+        copying = False
+        for chunk in self.stream(duration, auto_stop):
+            recorded += len(chunk)
+            if copying:
+                chunk = chunk.copy()
+            elif recorded > self.ring.capacity // 2:
+                copying = True
+                self.recording = [np.concatenate(self.recording + [chunk])]
+                continue
+            self.recording.append(chunk)
 
         # Convert recorded data to numpy array
         if not self.recording:
             return np.zeros(0, dtype=np.float32)
 
-        # Concatenate all audio chunks
-        if self.pa_format == pyaudio.paInt16:
-            audio_data = np.frombuffer(b''.join(self.recording), dtype=np.int16).astype(np.float32) / 32767.0
-        elif self.pa_format == pyaudio.paInt32:
-            audio_data = np.frombuffer(b''.join(self.recording), dtype=np.int32).astype(np.float32) / 2147483647.0
-        elif self.pa_format == pyaudio.paFloat32:
-            audio_data = np.frombuffer(b''.join(self.recording), dtype=np.float32)
+        # Concatenate all audio chunks (without a copy of the views so far
+        # for recordings shorter than half the buffer)
+        return np.concatenate(self.recording)
 
-        return audio_data
+    def start_output(self, blocksize=512, crossfade_ms=10):
+        """Keep one output stream open for all playback
 
-    def play(self, audio_data):
-        """Play audio data"""
-        # If audio data is empty, do nothing
-        if len(audio_data) == 0:
-            return
+        play() and play_stream() then queue audio on it instead of opening
+        the device for every call, and consecutive segments are crossfaded.
+        """
+        if self.output is None:
+            self.output = AudioOutputStream(sample_rate=self.sample_rate, blocksize=blocksize,
+                                            crossfade_ms=crossfade_ms)
+            self.output.start()
+
+    def stop_output(self):
+        """Close the output stream opened by start_output()"""
+        if self.output is not None:
+            self.output.close()
+            self.output = None
 
+    def _prepare_playback(self, audio_data, sample_rate=None):
+        """Convert audio to float32 at the output rate, within [-1, 1]"""
         # Ensure audio is in float32 format
         if audio_data.dtype != np.float32:
             audio_data = audio_data.astype(np.float32)
 
+        # Resample to the output rate
+        if sample_rate and sample_rate != self.sample_rate:
+            audio_data = resample(audio_data, sample_rate, self.sample_rate)
+
         # Ensure audio is in the range [-1, 1]
         if np.abs(audio_data).max() > 1.0:
             audio_data = audio_data / np.abs(audio_data).max()
 
-        # Play the audio
+        return audio_data
+
+    def enqueue(self, audio_data, sample_rate=None):
+        """Queue audio on the output stream without waiting for it to play
+
+        Needs start_output(). Blocks only while the output buffer is full.
+
+        Returns:
+            Capture ring position at which the audio is expected to start
+            playing (e.g. as an echo reference for barge-in detection)
+        """
+        if len(audio_data) == 0:
+            return self.ring.written
+        start = self.output.write(self._prepare_playback(audio_data, sample_rate))
+        # Input and output run at the same rate: the audio starts playing
+        # once everything queued before it has been played
+        return self.ring.written + max(start - self.output.read_pos, 0)
+
+    def wait_playback(self, stop_event=None):
+        """Wait until the queued audio has been played
+
+        Args:
+            stop_event: Event that ends the wait early (defaults to the one
+                set by stop_playback())
+
+        Returns:
+            False if the wait was cut short, else True
+        """
+        return self.output.wait(stop_event or self.playback_stopped)
+
+    @traced("audio.play")
+    def play(self, audio_data, sample_rate=None):
+        """Play audio data
+
+        Args:
+            audio_data: Audio samples
+            sample_rate: Sample rate of audio_data if it differs from the handler's
+
+        A stop_playback() since the last start_playback() also stops this
+        call, so a stop that lands between two chunks is not lost.
+
+        Returns:
+            False if the playback was cut short by stop_playback(), else True
+        """
+        # If audio data is empty, do nothing
+        if len(audio_data) == 0:
+            return True
+
+        if self.output is not None:
+            self.enqueue(audio_data, sample_rate)
+            return self.wait_playback()
+
+        audio_data = self._prepare_playback(audio_data, sample_rate)
+
+        # Play the audio, waiting on the stop event rather than in sd.wait()
         sd.play(audio_data, self.sample_rate)
+        if self.playback_stopped.wait(len(audio_data) / self.sample_rate):
+            sd.stop()
+            return False
         sd.wait()
+        return True
+
+    def play_stream(self, blocks, sample_rate=None):
+        """Play audio blocks as they are produced (e.g. by synthesize_stream())
+
+        With an output stream (start_output()) each block is queued as soon
+        as it arrives, so playback starts with the first block and continues
+        without gaps while the rest are produced; otherwise the blocks are
+        played one after another.
+
+        Returns:
+            False if the playback was cut short by stop_playback(), else True
+        """
+        self.start_playback()
+        for block in blocks:
+            if self.playback_stopped.is_set():
+                return False
+            if self.output is not None:
+                self.enqueue(block, sample_rate)
+            elif not self.play(block, sample_rate):
+                return False
+        if self.output is not None:
+            return self.wait_playback()
+        return not self.playback_stopped.is_set()
+
+    def start_playback(self):
+        """Start a new playback session, forgetting earlier stop_playback() calls
+
+        Called once per response, before its first chunk, rather than by
+        play() for every chunk.
+        """
+        self.playback_stopped.clear()
+
+    def stop_playback(self):
+        """Interrupt the current playback from another thread"""
+        self.playback_stopped.set()
+        if self.output is not None:
+            self.output.clear()
 
     def __del__(self):
         """Clean up resources"""
+        if getattr(self, 'capture_stream', None) is not None:
+            self.stop_capture()
+        if getattr(self, 'output', None) is not None:
+            self.stop_output()
         if hasattr(self, 'p'):
             self.p.terminate()
\ No newline at end of file
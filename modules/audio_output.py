@@ -0,0 +1,148 @@
+import threading
+import logging
+
+import numpy as np
+import sounddevice as sd
+
+from utils.ring_buffer import RingBuffer
+
+
+class AudioOutputStream:
+    def __init__(self, sample_rate=16000, channels=1, blocksize=512, crossfade_ms=10, buffer_seconds=30):
+        """Persistent output stream fed with audio segments
+
+        One sounddevice.OutputStream stays open and its callback plays
+        whatever has been written to a ring buffer, so consecutive segments
+        (e.g. synthesized sentences) play back to back without reopening the
+        device. The last crossfade_ms of each segment is held back and
+        overlap-added with the start of the next one, which hides the clicks
+        at the joins. When the buffer runs dry the callback plays silence.
+
+        Args:
+            sample_rate: Output sample rate
+            channels: Output channels (segments are mono and copied to each)
+            blocksize: Frames per callback (smaller means lower latency)
+            crossfade_ms: Overlap between consecutive segments
+            buffer_seconds: Audio that can be queued ahead of playback
+        """
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.ring = RingBuffer(int(buffer_seconds * sample_rate))
+
+        crossfade = int(sample_rate * crossfade_ms / 1000)
+        self._fade_in = np.linspace(0.0, 1.0, crossfade, endpoint=False, dtype=np.float32)
+        self._fade_out = self._fade_in[::-1].copy()
+        self._tail = None
+
+        # Absolute ring position of the next sample to play
+        self.read_pos = 0
+        # Guards read_pos and the ring; signalled whenever either moves
+        self._cond = threading.Condition()
+        self._clear_to = None
+        self.stream = None
+
+    def start(self):
+        """Open the output device"""
+        if self.stream is None:
+            self.stream = sd.OutputStream(samplerate=self.sample_rate, channels=self.channels,
+                                          blocksize=self.blocksize, dtype="float32", callback=self._callback)
+            self.stream.start()
+            logging.info(f"Audio output stream started at {self.sample_rate} Hz")
+
+    def close(self):
+        """Stop playback and close the device"""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def _callback(self, outdata, frames, time_info, status):
+        if status:
+            logging.warning(f"Playback status: {status}")
+        with self._cond:
+            if self._clear_to is not None:
+                # Fade out over this block instead of cutting off mid-waveform,
+                # then skip what was queued before clear()
+                n = min(frames, self._clear_to - self.read_pos)
+                if n > 0:
+                    fade = np.linspace(1.0, 0.0, n, dtype=np.float32)
+                    outdata[:n] = (self.ring.view(self.read_pos, self.read_pos + n) * fade)[:, None]
+                self.read_pos = self._clear_to
+                self._clear_to = None
+            else:
+                n = min(frames, self.ring.written - self.read_pos)
+                if n > 0:
+                    outdata[:n] = self.ring.view(self.read_pos, self.read_pos + n)[:, None]
+                    self.read_pos += n
+            outdata[max(n, 0):] = 0
+            self._cond.notify_all()
+
+    @property
+    def buffered(self):
+        """Samples written but not played yet"""
+        return self.ring.written - self.read_pos
+
+    def write(self, audio):
+        """Queue a mono float32 segment behind what is already playing
+
+        Blocks while the buffer is full.
+
+        Returns:
+            Ring position at which the segment starts playing
+        """
+        audio = np.asarray(audio, dtype=np.float32)
+        crossfade = len(self._fade_in)
+        if self._tail is not None and len(audio) >= crossfade:
+            head = audio[:crossfade] * self._fade_in + self._tail * self._fade_out
+            audio = np.concatenate((head, audio[crossfade:]))
+        elif self._tail is not None:
+            audio = np.concatenate((self._tail, audio))
+        self._tail = None
+
+        if crossfade and len(audio) >= 2 * crossfade:
+            # Hold the end back to overlap it with the next segment
+            self._tail = audio[-crossfade:].copy()
+            audio = audio[:-crossfade]
+
+        start = self.ring.written
+        self._write(audio)
+        return start
+
+    def _write(self, audio):
+        chunk_size = self.ring.capacity // 2
+        for offset in range(0, len(audio), chunk_size):
+            chunk = audio[offset:offset + chunk_size]
+            with self._cond:
+                self._cond.wait_for(lambda: self.ring.capacity - self.buffered >= len(chunk))
+                self.ring.write(chunk)
+
+    def flush(self):
+        """Queue the held-back end of the last segment, faded out"""
+        if self._tail is not None:
+            tail, self._tail = self._tail, None
+            self._write(tail * self._fade_out)
+
+    def wait(self, stop_event=None):
+        """Wait until everything queued has been played
+
+        Returns:
+            False if stop_event was set first, else True
+        """
+        self.flush()
+        with self._cond:
+            while self.buffered > 0:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                self._cond.wait(0.05)
+        return stop_event is None or not stop_event.is_set()
+
+    def clear(self):
+        """Drop the queued audio, fading out what is playing"""
+        with self._cond:
+            self._tail = None
+            if self.stream is None:
+                self.read_pos = self.ring.written
+            else:
+                self._clear_to = self.ring.written
+            self._cond.notify_all()
@@ -0,0 +1,123 @@
+from collections import deque
+
+import numpy as np
+
+from modules.vad import VoiceActivityDetector
+from utils.audio_utils import frame_signal, frame_rms
+
+
+class BargeInDetector:
+    def __init__(self, sample_rate=16000, frame_size=256, min_speech_ms=200, echo_margin=2.0,
+                 max_echo_delay_ms=300, initial_coupling=0.5, speech_fraction=0.75):
+        """Detect the user talking over the assistant's own playback
+
+        Microphone frames must pass a voice activity check and also be
+        clearly louder than the echo expected from the playback signal: the
+        playback energy over the last max_echo_delay_ms (the loudspeaker to
+        microphone path adds a delay) scaled by an estimated coupling factor.
+        The coupling is learned from frames where only the assistant is
+        talking. A barge-in is reported once speech_fraction of the frames in
+        the last min_speech_ms pass both checks.
+
+        Args:
+            sample_rate: Sample rate of the microphone and reference audio
+            frame_size: Samples per analysis frame
+            min_speech_ms: Speech needed over the playback to trigger a barge-in
+            echo_margin: How far above the expected echo the microphone energy must be
+            max_echo_delay_ms: Longest expected delay from playback to microphone
+            initial_coupling: Echo level relative to the playback before any is measured
+            speech_fraction: Share of speech frames within min_speech_ms that triggers
+        """
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.echo_margin = echo_margin
+        self.min_speech_frames = max(1, int(round(min_speech_ms * sample_rate / 1000 / frame_size)))
+        self.speech_fraction = speech_fraction
+        self.delay_frames = max(1, int(round(max_echo_delay_ms * sample_rate / 1000 / frame_size)))
+        self.coupling = initial_coupling
+        self.vad = VoiceActivityDetector(sample_rate=sample_rate, frame_size=frame_size)
+
+        # (start position, echo envelope) of each playback segment
+        self._references = []
+        self.reset()
+
+    def reset(self):
+        """Forget the recent speech frames"""
+        # (position, is speech) of the last min_speech_frames frames
+        self.recent = deque(maxlen=self.min_speech_frames)
+        self.onset_pos = None
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._remainder_pos = 0
+
+    def add_reference(self, audio, start_pos):
+        """Register audio that starts playing when the capture reaches start_pos
+
+        Segments queued back to back can be added ahead of time.
+        """
+        ref_rms = frame_rms(frame_signal(np.asarray(audio, dtype=np.float32), self.frame_size))
+        # Envelope: loudest playback frame within the echo delay before each frame
+        padded = np.concatenate((np.zeros(self.delay_frames, dtype=np.float32), ref_rms,
+                                 np.zeros(self.delay_frames, dtype=np.float32)))
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.delay_frames + 1)
+        self._references.append((start_pos, windows.max(axis=1)))
+
+    def clear_reference(self):
+        """Playback stopped; only voice activity counts from now on"""
+        self._references = []
+
+    def _expected_echo(self, frame_positions):
+        """Expected echo RMS for frames starting at the given capture positions"""
+        echo = np.zeros(len(frame_positions), dtype=np.float32)
+        for start_pos, env in self._references:
+            index = (frame_positions - start_pos) // self.frame_size
+            inside = (index >= 0) & (index < len(env))
+            echo[inside] = np.maximum(echo[inside], env[index[inside]])
+        # Segments that have been heard completely are no longer needed
+        self._references = [(start_pos, env) for start_pos, env in self._references
+                            if start_pos + len(env) * self.frame_size > frame_positions[-1]]
+        return echo * self.coupling
+
+    def process(self, chunk, chunk_pos):
+        """Feed captured audio starting at capture position chunk_pos
+
+        Returns:
+            True once the user has been speaking over the playback for
+            min_speech_ms; onset_pos is then the position where they started
+        """
+        if len(self._remainder):
+            audio = np.concatenate((self._remainder, chunk))
+            start = self._remainder_pos
+        else:
+            audio, start = chunk, chunk_pos
+
+        frames = frame_signal(audio, self.frame_size, pad=False)
+        used = len(frames) * self.frame_size
+        self._remainder = audio[used:]
+        self._remainder_pos = start + used
+        if len(frames) == 0:
+            return False
+
+        mic_rms = frame_rms(frames)
+        positions = start + np.arange(len(frames)) * self.frame_size
+        echo = self._expected_echo(positions)
+        # The echo is not background noise; keep it out of the VAD's noise floor
+        voiced = self.vad.frame_decisions(audio[:used], noise_mask=echo == 0)
+        is_speech = voiced & (mic_rms > self.echo_margin * echo)
+
+        # Learn the echo coupling from frames that are no louder than the
+        # expected echo, and not while the user may be talking; follow drops
+        # quickly and rises slowly
+        if not np.any(is_speech) and not any(speech for _, speech in self.recent):
+            echo_only = (echo > 1e-3) & (mic_rms <= self.echo_margin * echo)
+            for ratio in mic_rms[echo_only] / (echo[echo_only] / self.coupling):
+                rate = 0.05 if ratio < self.coupling else 0.005
+                self.coupling = min(max((1 - rate) * self.coupling + rate * float(ratio), 0.01), 4.0)
+
+        needed = self.speech_fraction * self.min_speech_frames
+        for position, speech in zip(positions, is_speech):
+            self.recent.append((int(position), bool(speech)))
+            if len(self.recent) == self.min_speech_frames \
+                    and sum(speech for _, speech in self.recent) >= needed:
+                self.onset_pos = next(pos for pos, speech in self.recent if speech)
+                return True
+        return False
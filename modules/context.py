@@ -0,0 +1,198 @@
+import math
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Summaries of all context windows (e.g. one per server session) are
+# computed on these threads; each window summarizes one batch at a time
+_SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="context-summary")
+
+
+def estimate_tokens(text):
+    """Roughly estimate the number of tokens in text (~4 characters per token)"""
+    return max(1, math.ceil(len(text) / 4))
+
+
+def extractive_summary(previous_summary, messages, max_tokens=256):
+    """Summarize messages locally by keeping the first sentence of each one
+
+    The result is appended to the previous summary and trimmed from the front
+    so that it stays within max_tokens.
+    """
+    lines = [previous_summary] if previous_summary else []
+    for entry in messages:
+        text = " ".join(entry["parts"][0].split())
+        first_sentence = text.split(". ")[0].rstrip(".")
+        speaker = "User" if entry["role"] == "user" else "Assistant"
+        lines.append(f"{speaker}: {first_sentence}.")
+
+    summary = " ".join(lines)
+    max_chars = max_tokens * 4
+    if len(summary) > max_chars:
+        summary = "..." + summary[-max_chars:]
+    return summary
+
+
+class ContextWindow:
+    def __init__(self, max_tokens=2048, summary_tokens=256, summarizer=None, token_counter=None,
+                 on_summary=None):
+        """Token-budgeted conversation context with a rolling summary
+
+        When the messages exceed max_tokens, the oldest user/model pairs are
+        evicted (never half a pair) until the window is back under a low
+        watermark, so evictions happen in batches rather than every turn.
+        Evicted messages are folded into a compact summary by a background
+        thread, off the hot path of the conversation.
+
+        Args:
+            max_tokens: Token budget for the retained messages
+            summary_tokens: Token budget for the rolling summary
+            summarizer: Callable (previous_summary, evicted_messages, max_tokens)
+                returning the new summary (defaults to extractive_summary)
+            token_counter: Callable returning the token count of a text
+                (defaults to estimate_tokens)
+            on_summary: Optional callable (summary, summarized) called after
+                each summary update, where summarized is the number of
+                messages of the conversation the summary covers
+        """
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.low_watermark = int(max_tokens * 0.75)
+        self.summarizer = summarizer or extractive_summary
+        self.token_counter = token_counter or estimate_tokens
+        self.on_summary = on_summary
+
+        self.messages = []
+        self.token_counts = []
+        self.total_tokens = 0
+        self.summary = ""
+        # Messages of the conversation folded into the summary
+        self.summarized = 0
+
+        self._lock = threading.Lock()
+        # Evicted messages waiting to be summarized, and the task summarizing them
+        self._evicted = []
+        self._summary_task = None
+
+    def add(self, role, text):
+        """Append a message and evict old turns if the budget is exceeded"""
+        tokens = self.token_counter(text)
+        with self._lock:
+            self.messages.append({"role": role, "parts": [text]})
+            self.token_counts.append(tokens)
+            self.total_tokens += tokens
+
+        if self.total_tokens > self.max_tokens:
+            self._evict()
+
+    def _evict(self):
+        """Evict the oldest pairs down to the low watermark and schedule summarization"""
+        with self._lock:
+            count = 0
+            total = self.total_tokens
+            # Keep at least the most recent exchange, however long it is
+            while total > self.low_watermark and count < len(self.messages) - 2:
+                total -= self.token_counts[count]
+                count += 1
+                # Never separate a user message from the model reply that follows it
+                if count < len(self.messages) and self.messages[count]["role"] == "model":
+                    total -= self.token_counts[count]
+                    count += 1
+            if count == 0:
+                return
+
+            self._evicted.extend(self.messages[:count])
+            del self.messages[:count]
+            del self.token_counts[:count]
+            self.total_tokens = total
+            if self._summary_task is None:
+                self._summary_task = _SUMMARY_EXECUTOR.submit(self._summarize_evicted)
+
+        logging.info(f"Evicted {count} messages from context ({self.total_tokens} tokens retained)")
+
+    def _summarize_evicted(self):
+        """Summarize evicted messages until none are left (runs in the background)
+
+        Messages evicted while a summary is being computed are folded into
+        the next one, so the summaries of one window never run concurrently.
+        """
+        while True:
+            with self._lock:
+                evicted, self._evicted = self._evicted, []
+                if not evicted:
+                    self._summary_task = None
+                    return
+            self._summarize(evicted)
+
+    def _summarize(self, evicted):
+        """Fold evicted messages into the rolling summary"""
+        try:
+            summary = self.summarizer(self.summary, evicted, self.summary_tokens)
+        except Exception as e:
+            logging.error(f"Context summarization error: {e}")
+            summary = extractive_summary(self.summary, evicted, self.summary_tokens)
+
+        with self._lock:
+            self.summary = summary
+            self.summarized += len(evicted)
+            summarized = self.summarized
+
+        if self.on_summary is not None:
+            try:
+                self.on_summary(summary, summarized)
+            except Exception as e:
+                logging.error(f"Failed to save context summary: {e}")
+
+    def restore(self, messages, summary="", summarized=0):
+        """Replace the context with saved state (e.g. a resumed session)
+
+        Args:
+            messages: Messages not covered by the summary, oldest first
+            summary: Rolling summary of the earlier messages
+            summarized: Number of messages the summary covers
+        """
+        with self._lock:
+            self.messages = [{"role": entry["role"], "parts": [entry["parts"][0]]} for entry in messages]
+            self.token_counts = [self.token_counter(entry["parts"][0]) for entry in self.messages]
+            self.total_tokens = sum(self.token_counts)
+            self.summary = summary
+            self.summarized = summarized
+
+        if self.total_tokens > self.max_tokens:
+            self._evict()
+
+    def history(self):
+        """Messages to send to the model, preceded by the rolling summary if any
+
+        The summary is sent as a user message. It is acknowledged by a model
+        message unless the kept history starts with one (e.g. a greeting),
+        so user and model turns always alternate.
+        """
+        with self._lock:
+            history = [{"role": entry["role"], "parts": [entry["parts"][0]]} for entry in self.messages]
+            if self.summary:
+                prefix = [{"role": "user", "parts": [f"Summary of our conversation so far: {self.summary}"]}]
+                if not history or history[0]["role"] != "model":
+                    prefix.append({"role": "model", "parts": ["Understood, I'll keep that in mind."]})
+                history = prefix + history
+        return history
+
+    def wait(self):
+        """Block until pending summaries are computed"""
+        while True:
+            with self._lock:
+                task = self._summary_task
+            if task is None:
+                return
+            task.result()
+
+    def clear(self):
+        """Forget all messages and the summary"""
+        with self._lock:
+            self.messages = []
+            self.token_counts = []
+            self.total_tokens = 0
+            self.summary = ""
+            self.summarized = 0
+            self._evicted = []
@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+
+# Tells the writer thread to stop
+_STOP = object()
+
+_SEGMENT_PATTERN = re.compile(r"conversations-(\d{6})\.jsonl$")
+
+
+class ConversationLog:
+    def __init__(self, log_dir, max_file_bytes=16 * 1024 * 1024, max_queue_size=1024,
+                 batch_size=64, flush_interval=0.5):
+        """Append-only conversation log written by a background thread
+
+        Records are JSON lines in numbered segment files
+        (conversations-000001.jsonl, ...); a new segment is started when the
+        current one reaches max_file_bytes. The segment, byte offset and
+        length of every record are kept in an SQLite index (index.sqlite3)
+        keyed by session, so one session's history is read back with a few
+        seeks and sessions are listed without scanning the segments.
+
+        Logging never blocks: records go to a bounded queue and are written
+        in batches, one write and one index transaction per batch. If the
+        disk falls so far behind that the queue is full, records are dropped
+        (and counted in dropped) rather than stalling the conversation.
+        Only one process should write to a log directory at a time.
+
+        Args:
+            log_dir: Directory of the segments and the index
+            max_file_bytes: Size at which a segment is rotated
+            max_queue_size: Records buffered before new ones are dropped
+            batch_size: Maximum records per write
+            flush_interval: Seconds a record may wait for its batch to fill
+        """
+        self.log_dir = log_dir
+        self.max_file_bytes = max_file_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.index_path = os.path.join(log_dir, "index.sqlite3")
+        self.dropped = 0
+
+        os.makedirs(log_dir, exist_ok=True)
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._turns = {}
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-log", daemon=True)
+        self._writer.start()
+
+    def log_turn(self, session_id, user_text, ai_text, latencies=None, **fields):
+        """Queue one conversation turn for writing (returns immediately)
+
+        Args:
+            session_id: Identifier of the conversation
+            user_text: What the user said
+            ai_text: The assistant's response
+            latencies: Optional {stage: seconds}, e.g. from Tracer.end_turn()
+            fields: Extra JSON-serializable values stored with the record
+        """
+        turn = self._turns.get(session_id, 0) + 1
+        self._turns[session_id] = turn
+        record = dict(fields, session=session_id, turn=turn, time=time.time(), user=user_text, ai=ai_text)
+        if latencies:
+            record["latencies"] = latencies
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logging.error(f"Conversation log queue full, {self.dropped} records dropped")
+
+    def flush(self):
+        """Wait until every queued record is written and indexed"""
+        self._queue.join()
+
+    def close(self):
+        """Write the remaining records and stop the writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.index_path, timeout=10)
+        connection.execute("CREATE TABLE IF NOT EXISTS records (session TEXT, turn INTEGER, time REAL, "
+                           "segment INTEGER, offset INTEGER, length INTEGER)")
+        connection.execute("CREATE INDEX IF NOT EXISTS records_session ON records (session, time)")
+        connection.execute("CREATE INDEX IF NOT EXISTS records_time ON records (time)")
+        return connection
+
+    def _segment_path(self, segment):
+        return os.path.join(self.log_dir, f"conversations-{segment:06d}.jsonl")
+
+    def _segments(self):
+        """Numbers of the existing segments, in order"""
+        numbers = []
+        for name in os.listdir(self.log_dir):
+            match = _SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _next_batch(self):
+        """Block for a record, then collect more until the batch is full or the interval ends"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        connection = self._connect()
+        segments = self._segments()
+        segment = segments[-1] if segments else 1
+        f = open(self._segment_path(segment), "ab")
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = batch[-1] is _STOP
+                records = batch[:-1] if stop else batch
+                try:
+                    if f.tell() >= self.max_file_bytes:
+                        f.close()
+                        segment += 1
+                        f = open(self._segment_path(segment), "ab")
+                    self._write_batch(f, segment, records, connection)
+                except Exception as e:
+                    logging.error(f"Failed to write {len(records)} conversation log records: {e}")
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                if stop:
+                    break
+        finally:
+            f.close()
+            connection.close()
+
+    def _write_batch(self, f, segment, records, connection):
+        offset = f.tell()
+        lines = []
+        rows = []
+        for record in records:
+            line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            lines.append(line)
+            rows.append((record["session"], record["turn"], record["time"], segment, offset, len(line)))
+            offset += len(line)
+        f.write(b"".join(lines))
+        f.flush()
+        # Index after the data is written, so every indexed record exists
+        with connection:
+            connection.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def _read(self, rows):
+        """Read the records at the (segment, offset, length) locations"""
+        records = []
+        files = {}
+        try:
+            for segment, offset, length in rows:
+                if segment not in files:
+                    files[segment] = open(self._segment_path(segment), "rb")
+                f = files[segment]
+                f.seek(offset)
+                records.append(json.loads(f.read(length)))
+        finally:
+            for f in files.values():
+                f.close()
+        return records
+
+    def load_session(self, session_id):
+        """All records of a session, in turn order"""
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT segment, offset, length FROM records WHERE session = ? "
+                                      "ORDER BY time, turn", (session_id,)).fetchall()
+        finally:
+            connection.close()
+        return self._read(rows)
+
+    def sessions(self, since=None, until=None):
+        """Sessions with records between two Unix times
+
+        Returns:
+            List of {"session", "turns", "start", "end"}, most recent first
+        """
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT session, COUNT(*), MIN(time), MAX(time) FROM records WHERE time >= ? AND time <= ? "
+                "GROUP BY session ORDER BY MAX(time) DESC",
+                (since if since is not None else 0, until if until is not None else float("inf"))
+            ).fetchall()
+        finally:
+            connection.close()
+        return [{"session": session, "turns": turns, "start": start, "end": end}
+                for session, turns, start, end in rows]
+
+    def rebuild_index(self):
+        """Recreate the index from the segments (e.g. after the index was lost)
+
+        Call it while nothing is being logged.
+        """
+        self.flush()
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM records")
+                for segment in self._segments():
+                    offset = 0
+                    rows = []
+                    with open(self._segment_path(segment), "rb") as f:
+                        for line in f:
+                            try:
+                                record = json.loads(line)
+                                rows.append((record["session"], record["turn"], record["time"],
+                                             segment, offset, len(line)))
+                            except (ValueError, KeyError):
+                                logging.error(f"Skipping unreadable record at {segment}:{offset}")
+                            offset += len(line)
+                    connection.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)", rows)
+        finally:
+            connection.close()
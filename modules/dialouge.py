@@ -1,64 +1,441 @@
-import google.generativeai as genai
-import json
+import asyncio
 import logging
+import threading
 
+from modules.context import ContextWindow, extractive_summary
+from modules.llm_backends import ChatModelBackend, GeminiBackend
+from modules.response_cache import context_hash, normalize_prompt
+from utils.tracing import traced
 
-class DialogueManager:
-    def __init__(self, api_key, model_name="gemini-1.5-flash", system_prompt=None):
-        """Initialize dialogue manager with Gemini API"""
-        self.api_key = api_key
-        genai.configure(api_key=api_key)
 
+class _Speculation:
+    def __init__(self, stream, user_text, turn, on_done=None):
+        """Response generated in a background thread for a transcript that may still change
+
+        Args:
+            stream: Backend stream of the response
+            user_text: Transcript the response was requested for
+            turn: Number of turns in the history when it was requested
+            on_done: Optional callback receiving the speculation once its
+                request has ended (completed, failed or cancelled)
+        """
+        self.normalized = normalize_prompt(user_text)
+        self.turn = turn
+        self.on_done = on_done
+        self.deltas = []
+        self.done = False
+        self.error = None
+        self.cancelled = threading.Event()
+        self._changed = threading.Condition()
+        threading.Thread(target=self._run, args=(stream,), name="llm-speculation", daemon=True).start()
+
+    def _run(self, stream):
         try:
-            self.model = genai.GenerativeModel(model_name)
-            logging.info(f"Initialized Gemini model: {model_name}")
+            for delta in stream:
+                # Closing the stream ends the request
+                if self.cancelled.is_set():
+                    break
+                if delta:
+                    with self._changed:
+                        self.deltas.append(delta)
+                        self._changed.notify_all()
         except Exception as e:
-            logging.error(f"Failed to initialize Gemini model: {e}")
-            raise
+            self.error = e
+        finally:
+            stream.close()
+            with self._changed:
+                self.done = True
+                self._changed.notify_all()
+            if self.on_done is not None:
+                self.on_done(self)
+
+    def cancel(self):
+        """Stop the request after its next delta"""
+        self.cancelled.set()
+
+    def usable(self):
+        return not self.cancelled.is_set() and not (self.done and self.error is not None and not self.deltas)
+
+    def stream(self):
+        """Yield the deltas generated so far, then the others as they arrive"""
+        i = 0
+        try:
+            while True:
+                with self._changed:
+                    self._changed.wait_for(lambda: i < len(self.deltas) or self.done)
+                    if i < len(self.deltas):
+                        delta = self.deltas[i]
+                    elif self.error is not None:
+                        raise self.error
+                    else:
+                        return
+                i += 1
+                yield delta
+        finally:
+            self.cancel()
+
+
+class DialogueManager:
+    def __init__(self, api_key, model_name="gemini-1.5-flash", system_prompt=None, model=None,
+                 max_context_tokens=2048, summary_tokens=256, cache=None, session_store=None, session_id=None,
+                 backend=None, fallback=None):
+        """Initialize dialogue manager
+
+        The conversation is kept here and sent with every request, so the
+        backend holds no per-conversation state and can be shared by many
+        dialogue managers (e.g. all the sessions of a server).
+
+        Args:
+            api_key: Gemini API key
+            model_name: Gemini model name
+            system_prompt: Instructions for the assistant
+            model: Optional object with the GenerativeModel interface (e.g. a
+                StubModel) used instead of the Gemini API
+            max_context_tokens: Token budget for the conversation history sent with each request
+            summary_tokens: Token budget for the summary of turns evicted from the history
+            cache: Optional ResponseCache; hits are answered without calling the model
+            session_store: Optional SessionStore; each turn is saved to it, and
+                a saved conversation with session_id is resumed on first use
+            session_id: Identifier of the conversation in session_store
+            backend: Optional DialogueBackend (e.g. a shared GeminiBackend or
+                a LocalBackend); defaults to a GeminiBackend of its own
+            fallback: Optional DialogueBackend (e.g. a LocalBackend) that
+                answers when the backend fails and the cache has no answer
+        """
+        self.api_key = api_key
+        self.model_name = model_name
+        self.cache = cache
+        self.fallback = fallback
+        self.session_store = session_store if session_id is not None else None
+        self.session_id = session_id
+        self._resumed = self.session_store is None
+
+        # Response started from a partial transcript (see speculate()), and
+        # the newer transcript to speculate on once it has stopped
+        self._speculation = None
+        self._next_speculation = None
+        self._speculation_lock = threading.Lock()
+        self._turns = 0
+        self.speculations = 0
+        self.speculation_hits = 0
 
         self.system_prompt = system_prompt or """
         You are a helpful, intelligent assistant.
         Be concise, friendly, and helpful in your responses.
         """
 
-        # Conversation history
-        self.conversation_history = []
+        if backend is not None:
+            self.backend = backend
+        elif model is not None:
+            self.backend = ChatModelBackend(model)
+        else:
+            # The system prompt is sent as a system instruction with every
+            # request instead of as an extra first message
+            self.backend = GeminiBackend(api_key, model_name, self.system_prompt)
+
+        # Conversation history, bounded by tokens; evicted turns are folded
+        # into a rolling summary in the background
+        self.context = ContextWindow(
+            max_tokens=max_context_tokens,
+            summary_tokens=summary_tokens,
+            summarizer=self._summarize,
+            on_summary=self._save_summary if self.session_store is not None else None
+        )
+
+    @property
+    def conversation_history(self):
+        """Messages currently kept in the context window"""
+        self._resume()
+        return self.context.messages
+
+    def _resume(self):
+        """Load the saved conversation the first time the session is used"""
+        if self._resumed:
+            return
+        self._resumed = True
+        try:
+            state = self.session_store.load(self.session_id)
+        except Exception as e:
+            logging.error(f"Failed to load session {self.session_id}: {e}")
+            return
+        if state is not None:
+            self.context.restore(state["messages"], state["summary"], state["summarized"])
+            logging.info(f"Resumed session {self.session_id} ({state['count']} messages)")
+
+    def _save_summary(self, summary, summarized):
+        self.session_store.set_summary(self.session_id, summary, summarized)
+
+    def reset(self):
+        """Forget the conversation, including its saved session"""
+        self._resumed = True
+        self.cancel_speculation()
+        # A summary still being computed would be saved after the delete
+        self.context.wait()
+        self.context.clear()
+        if self.session_store is not None:
+            self.session_store.delete(self.session_id)
+
+    def _summarize(self, previous_summary, messages, max_tokens):
+        """Summarize evicted turns with the model, for the rolling context summary"""
+        if not self.backend.summarizes:
+            return extractive_summary(previous_summary, messages, max_tokens)
+
+        transcript = "\n".join(
+            f"{'User' if entry['role'] == 'user' else 'Assistant'}: {entry['parts'][0]}"
+            for entry in messages
+        )
+        prompt = (
+            f"Update the summary of a conversation with the new lines below. "
+            f"Keep names, facts and open questions, and use at most {max_tokens * 3 // 4} words.\n\n"
+            f"Current summary: {previous_summary or '(none)'}\n\nNew lines:\n{transcript}"
+        )
+        return self.backend.generate([], prompt).strip()
+
+    def _cache_context(self):
+        """Hash of the context a cached response depends on
+
+        Responses depend on the model, the system prompt and the assistant
+        message the user is replying to, so a follow-up like "why?" is only
+        answered from the cache after the same previous answer.
+        """
+        messages = self.context.messages
+        previous_reply = messages[-1]["parts"][0] if messages and messages[-1]["role"] == "model" else ""
+        return context_hash(self.model_name, self.system_prompt, previous_reply)
+
+    def _cached_response(self, user_text):
+        """Look up user_text in the response cache
+
+        Returns:
+            (cached response or None, cache context)
+        """
+        if self.cache is None:
+            return None, None
+
+        cache_context = self._cache_context()
+        response_text = self.cache.get(user_text, cache_context)
+        if response_text is not None:
+            self._add_turn(user_text, response_text)
+        return response_text, cache_context
 
+    def _fallback_response(self, user_text):
+        """Answer user_text without the backend, after it failed
+
+        Tries the response cache in any context (an answer given to the same
+        question after a different previous reply), then the fallback
+        backend, then a canned reply. Fallback answers are not added to the
+        history, so the model never sees them as its own.
+        """
+        if self.cache is not None:
+            cached = self.cache.get_any(user_text)
+            if cached is not None:
+                return cached
+        if self.fallback is not None:
+            try:
+                return self.fallback.generate(self.context.history(), user_text)
+            except Exception as e:
+                logging.error(f"Fallback dialogue error: {e}")
+        return "I'm having trouble processing that. Could you try again?"
+
+    def _add_turn(self, user_text, response_text):
+        """Add a user message and the AI response to the history (and the session store)"""
+        # Saved before it is added, so a summary never covers unsaved messages
+        if self.session_store is not None:
+            try:
+                self.session_store.append(self.session_id, [("user", user_text), ("model", response_text)])
+            except Exception as e:
+                logging.error(f"Failed to save session {self.session_id}: {e}")
+        self.context.add("user", user_text)
+        self.context.add("model", response_text)
+        self._turns += 1
+
+    def _finish_turn(self, user_text, response_text, cache_context):
+        """Record a completed exchange in the history and the response cache"""
+        self._add_turn(user_text, response_text)
+        if self.cache is not None:
+            self.cache.put(user_text, response_text, cache_context)
+
+    def speculate(self, user_text):
+        """Start generating the response to a transcript the user may not have finished
+
+        Meant for a partial transcript that is unlikely to change, e.g. from
+        StreamingTranscriber's on_stable during the end-of-speech hangover.
+        The response is generated in the background and kept aside: the next
+        get_response() or stream_response() uses it if its text is the same
+        after normalization (case, punctuation and whitespace) and no turn
+        was added meanwhile, and otherwise cancels it and sends a new
+        request.
+
+        At most one speculative request is in flight: calling this again
+        with the same text keeps it, and a different text cancels it and is
+        sent once the cancelled request has stopped (only the latest text
+        of several). Texts the response cache can answer are not sent.
+        """
+        normalized = normalize_prompt(user_text or "")
+        if not normalized:
+            return
+        self._resume()
+        if self.cache is not None and self.cache.get(user_text, self._cache_context(), record=False) is not None:
+            self.cancel_speculation()
+            return
+        with self._speculation_lock:
+            current = self._speculation
+            self._next_speculation = None
+            if current is not None and current.normalized == normalized and current.turn == self._turns \
+                    and current.usable():
+                return
+            if current is not None and not current.done:
+                current.cancel()
+                self._next_speculation = user_text
+                return
+            self._start_speculation(user_text)
+
+    def _start_speculation(self, user_text):
+        """Send a speculative request for user_text (lock held)"""
+        self._speculation = _Speculation(self.backend.stream(self.context.history(), user_text),
+                                         user_text, self._turns, on_done=self._speculation_done)
+        self.speculations += 1
+        logging.info(f"Speculative response started for: {user_text}")
+
+    def _speculation_done(self, speculation):
+        """Send the transcript that arrived while a cancelled speculation was still running"""
+        with self._speculation_lock:
+            if speculation is self._speculation and self._next_speculation is not None:
+                user_text, self._next_speculation = self._next_speculation, None
+                self._start_speculation(user_text)
+
+    def cancel_speculation(self):
+        """Drop the speculative response, if any (e.g. when the turn is abandoned)"""
+        with self._speculation_lock:
+            speculation, self._speculation = self._speculation, None
+            self._next_speculation = None
+        if speculation is not None:
+            speculation.cancel()
+
+    def _take_speculation(self, user_text):
+        """The speculative response to user_text if there is a valid one (any other is cancelled)"""
+        with self._speculation_lock:
+            speculation, self._speculation = self._speculation, None
+            self._next_speculation = None
+        if speculation is None:
+            return None
+        if speculation.normalized != normalize_prompt(user_text) or speculation.turn != self._turns \
+                or not speculation.usable():
+            speculation.cancel()
+            logging.info(f"Speculative response discarded for: {user_text}")
+            return None
+        self.speculation_hits += 1
+        return speculation
+
+    @traced("llm.get_response")
     def get_response(self, user_text):
         """Generate a response to user input"""
         if not user_text:
+            self.cancel_speculation()
             return "I didn't catch that. Could you please repeat?"
 
+        self._resume()
         try:
-            # Add user input to history
-            self.conversation_history.append({"role": "user", "parts": [user_text]})
+            cached, cache_context = self._cached_response(user_text)
+            if cached is not None:
+                self.cancel_speculation()
+                return cached
 
-            # Start chat with the system prompt
-            if len(self.conversation_history) == 1:
-                chat = self.model.start_chat(history=[])
-                chat.send_message(self.system_prompt)
+            speculation = self._take_speculation(user_text)
+            if speculation is not None:
+                response_text = "".join(speculation.stream())
             else:
-                # Format history for Gemini
-                formatted_history = []
-                for entry in self.conversation_history[:-1]:  # Exclude the current user message
-                    formatted_history.append({
-                        "role": entry["role"],
-                        "parts": [entry["parts"][0]]
-                    })
-                chat = self.model.start_chat(history=formatted_history)
-
-            # Get response from Gemini
-            response = chat.send_message(user_text)
-            response_text = response.text
-
-            # Add AI response to history
-            self.conversation_history.append({"role": "model", "parts": [response_text]})
-
-            # Keep history manageable (last 10 exchanges)
-            if len(self.conversation_history) > 20:
-                self.conversation_history = self.conversation_history[-20:]
-
+                response_text = self.backend.generate(self.context.history(), user_text)
+            self._finish_turn(user_text, response_text, cache_context)
             return response_text
         except Exception as e:
             logging.error(f"Dialogue error: {e}")
-            return "I'm having trouble processing that. Could you try again?"
\ No newline at end of file
+            return self._fallback_response(user_text)
+
+    def stream_response(self, user_text):
+        """Generate a response to user input, yielding text deltas as they arrive"""
+        if not user_text:
+            self.cancel_speculation()
+            yield "I didn't catch that. Could you please repeat?"
+            return
+
+        self._resume()
+        cached, cache_context = self._cached_response(user_text)
+        if cached is not None:
+            self.cancel_speculation()
+            yield cached
+            return
+
+        parts = []
+        speculation = self._take_speculation(user_text)
+        if speculation is not None:
+            stream = speculation.stream()
+        else:
+            stream = self.backend.stream(self.context.history(), user_text)
+        try:
+            for delta in stream:
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except GeneratorExit:
+            # The caller stopped reading (e.g. the user interrupted): keep
+            # what was generated so far and drop the unfinished request
+            if parts:
+                self._add_turn(user_text, "".join(parts))
+            raise
+        except Exception as e:
+            logging.error(f"Dialogue error: {e}")
+            if not parts:
+                yield self._fallback_response(user_text)
+                return
+            # Keep the partial response when the stream broke off part way
+            self._add_turn(user_text, "".join(parts))
+            return
+        finally:
+            stream.close()
+
+        self._finish_turn(user_text, "".join(parts), cache_context)
+
+    async def astream_response(self, user_text):
+        """Async iterator version of stream_response
+
+        Uses the backend's async stream, so waiting for the next delta never
+        blocks the event loop and many sessions can share one backend.
+        Speculative responses are only used by the blocking methods.
+        """
+        self.cancel_speculation()
+        if not user_text:
+            yield "I didn't catch that. Could you please repeat?"
+            return
+
+        # Loading and updating a saved session read and write the disk, so
+        # they run off the event loop (and never stall the other sessions)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._resume)
+        cached, cache_context = await loop.run_in_executor(None, self._cached_response, user_text)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        stream = self.backend.astream(self.context.history(), user_text)
+        try:
+            async for delta in stream:
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except (GeneratorExit, asyncio.CancelledError):
+            if parts:
+                # Shielded, so the partial reply is saved even if the task is cancelled again
+                await asyncio.shield(loop.run_in_executor(None, self._add_turn, user_text, "".join(parts)))
+            raise
+        except Exception as e:
+            logging.error(f"Dialogue error: {e}")
+            if not parts:
+                yield await loop.run_in_executor(None, self._fallback_response, user_text)
+                return
+            await loop.run_in_executor(None, self._add_turn, user_text, "".join(parts))
+            return
+        finally:
+            await stream.aclose()
+
+        await loop.run_in_executor(None, self._finish_turn, user_text, "".join(parts), cache_context)
@@ -0,0 +1,291 @@
+import re
+import abc
+import json
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class BackendError(Exception):
+    def __init__(self, message, status=None, transient=False):
+        """Failed LLM request
+
+        Args:
+            message: Description of the failure
+            status: HTTP status code, if the backend answered
+            transient: Whether the same request may succeed if retried
+                (rate limits, overload, timeouts, dropped connections)
+        """
+        super().__init__(message)
+        self.status = status
+        self.transient = transient
+
+
+# Guards the lazy creation of the backends' thread pools
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _close_after(job, stream):
+    """Close a generator once the job advancing it has finished"""
+    wait([job])
+    try:
+        stream.close()
+    except Exception as e:
+        logging.error(f"Failed to close LLM stream: {e}")
+
+
+class DialogueBackend(abc.ABC):
+    """Base class of the LLM backends used by DialogueManager
+
+    Requests are stateless: each call gets the conversation history (a list
+    of {"role": "user" or "model", "parts": [text]}) and the new user
+    message, so one backend can serve any number of conversations at once.
+    Subclasses implement stream(); the other methods are derived from it,
+    and the async ones run the blocking calls on the backend's own bounded
+    thread pool (max_concurrency threads), off the event loop.
+    """
+
+    max_concurrency = 8
+    # Whether the backend is good at summarizing old turns (see ContextWindow)
+    summarizes = False
+
+    @abc.abstractmethod
+    def stream(self, history, message):
+        """Yield the response to message as text deltas"""
+
+    def generate(self, history, message):
+        """Return the whole response to message"""
+        return "".join(self.stream(history, message))
+
+    def _executor(self):
+        executor = getattr(self, "_thread_pool", None)
+        if executor is None:
+            with _EXECUTOR_LOCK:
+                executor = getattr(self, "_thread_pool", None)
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                  thread_name_prefix=type(self).__name__)
+                    self._thread_pool = executor
+        return executor
+
+    async def agenerate(self, history, message):
+        """Async version of generate()"""
+        return await asyncio.wrap_future(self._executor().submit(self.generate, history, message))
+
+    async def astream(self, history, message):
+        """Async version of stream()"""
+        executor = self._executor()
+        stream = self.stream(history, message)
+        end = object()
+        job = None
+        try:
+            while True:
+                job = executor.submit(next, stream, end)
+                delta = await asyncio.wrap_future(job)
+                if delta is end:
+                    break
+                yield delta
+        finally:
+            # Closing releases the connection; it has to wait for the
+            # next() call still running if the consumer was cancelled
+            if job is not None:
+                executor.submit(_close_after, job, stream)
+
+    def close(self):
+        executor = getattr(self, "_thread_pool", None)
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+class GeminiBackend(DialogueBackend):
+    summarizes = True
+
+    def __init__(self, api_key, model_name="gemini-2.0-flash", system_prompt=None, pool_size=16,
+                 timeout=(5.0, 60.0), generation_config=None,
+                 base_url="https://generativelanguage.googleapis.com/v1beta"):
+        """Gemini over its REST API, with a pool of keep-alive connections
+
+        Unlike genai.configure(), nothing is global: several backends with
+        different keys can coexist, and one backend (and its connection
+        pool) can be shared by all the sessions of a server.
+
+        Args:
+            api_key: Gemini API key
+            model_name: Gemini model name
+            system_prompt: System instruction sent with every request
+            pool_size: Connections kept open (and concurrent requests)
+            timeout: (connect, read) timeout in seconds; the read timeout
+                applies to each wait for data, not to the whole response
+            generation_config: Optional generationConfig fields (temperature, ...)
+            base_url: API endpoint
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.model_name = model_name
+        self.system_prompt = system_prompt
+        self.timeout = timeout
+        self.generation_config = generation_config
+        self.max_concurrency = pool_size
+        self.url = f"{base_url}/models/{model_name}"
+
+        self._requests = requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"x-goog-api-key": api_key or "", "Content-Type": "application/json"})
+        logging.info(f"Initialized Gemini backend: {model_name}")
+
+    def _body(self, history, message):
+        contents = [{"role": entry["role"], "parts": [{"text": entry["parts"][0]}]} for entry in history]
+        contents.append({"role": "user", "parts": [{"text": message}]})
+        body = {"contents": contents}
+        if self.system_prompt:
+            body["systemInstruction"] = {"parts": [{"text": self.system_prompt}]}
+        if self.generation_config:
+            body["generationConfig"] = self.generation_config
+        return body
+
+    def _post(self, method, body, stream=False):
+        try:
+            response = self.session.post(f"{self.url}:{method}", params={"alt": "sse"} if stream else None,
+                                         json=body, stream=stream, timeout=self.timeout)
+        except self._requests.RequestException as e:
+            raise BackendError(f"Gemini request failed: {e}", transient=True) from e
+        if response.status_code != 200:
+            try:
+                detail = response.json().get("error", {}).get("message", response.text)
+            except ValueError:
+                detail = response.text
+            response.close()
+            raise BackendError(f"Gemini error {response.status_code}: {detail}", status=response.status_code,
+                               transient=response.status_code in (408, 429, 500, 502, 503, 504))
+        return response
+
+    @staticmethod
+    def _text(payload):
+        candidates = payload.get("candidates")
+        if not candidates:
+            feedback = payload.get("promptFeedback", {})
+            if feedback.get("blockReason"):
+                raise BackendError(f"Gemini blocked the prompt: {feedback['blockReason']}")
+            return ""
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    def generate(self, history, message):
+        response = self._post("generateContent", self._body(history, message))
+        try:
+            return self._text(response.json())
+        finally:
+            response.close()
+
+    def stream(self, history, message):
+        response = self._post("streamGenerateContent", self._body(history, message), stream=True)
+        try:
+            # Server-sent events, one JSON payload per "data:" line
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    text = self._text(json.loads(line[5:]))
+                    if text:
+                        yield text
+        except self._requests.RequestException as e:
+            raise BackendError(f"Gemini stream failed: {e}", transient=True) from e
+        finally:
+            response.close()
+
+    def close(self):
+        super().close()
+        self.session.close()
+
+
+class ChatModelBackend(DialogueBackend):
+    def __init__(self, model):
+        """Backend for objects with the genai.GenerativeModel interface (e.g. StubModel)
+
+        Args:
+            model: Object with start_chat(history) returning a chat with
+                send_message(text, stream=False)
+        """
+        self.model = model
+        self.summarizes = hasattr(model, "generate_content")
+
+    def stream(self, history, message):
+        chat = self.model.start_chat(history=history)
+        for chunk in chat.send_message(message, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    def generate(self, history, message):
+        if not history and hasattr(self.model, "generate_content"):
+            return self.model.generate_content(message).text
+        return self.model.start_chat(history=history).send_message(message).text
+
+
+class LocalBackend(DialogueBackend):
+    def __init__(self, rules=None, first_token_delay=0.0, words_per_second=None, name="Alex"):
+        """Scripted responder that runs offline
+
+        Answers greetings, thanks and questions about the time, the date and
+        itself, and says it is offline otherwise. Useful for running the
+        whole pipeline without network access, and for load tests.
+
+        Args:
+            rules: Optional list of (regex, response) tried before the
+                built-in ones; response is a string or a callable taking the
+                match and returning one
+            first_token_delay: Seconds before the first streamed word
+            words_per_second: Streaming rate (None for no delay)
+            name: Name the assistant introduces itself with
+        """
+        self.first_token_delay = first_token_delay
+        self.words_per_second = words_per_second
+        self.rules = [(re.compile(pattern, re.IGNORECASE), response) for pattern, response in rules or []]
+        self.rules += [
+            (re.compile(r"\b(hello|hi|hey|good (morning|afternoon|evening))\b", re.IGNORECASE),
+             "Hello! How can I help you today?"),
+            (re.compile(r"\b(thanks|thank you)\b", re.IGNORECASE), "You're welcome!"),
+            (re.compile(r"\bwhat time\b|\bthe time\b", re.IGNORECASE),
+             lambda match: time.strftime("It's %I:%M %p.").replace(" 0", " ")),
+            (re.compile(r"\b(what day|the date|today's date)\b", re.IGNORECASE),
+             lambda match: time.strftime("Today is %A, %B %d.")),
+            (re.compile(r"\b(your name|who are you)\b", re.IGNORECASE),
+             f"I'm {name}, your assistant. I'm running in offline mode right now."),
+        ]
+
+    def respond(self, message):
+        """The scripted response to message"""
+        for pattern, response in self.rules:
+            match = pattern.search(message)
+            if match:
+                return response(match) if callable(response) else response
+        return f"I'm offline at the moment, so I can't answer that properly. You said: {message.strip()}"
+
+    def stream(self, history, message):
+        words = re.findall(r"\S+\s*", self.respond(message))
+        for i, word in enumerate(words):
+            if i == 0:
+                time.sleep(self.first_token_delay)
+            elif self.words_per_second:
+                time.sleep(1.0 / self.words_per_second)
+            yield word
+
+    def generate(self, history, message):
+        time.sleep(self.first_token_delay)
+        return self.respond(message)
+
+
+def create_backend(name, api_key=None, model_name="gemini-2.0-flash", system_prompt=None, pool_size=16, **kwargs):
+    """Create the "gemini" or "local" backend
+
+    pool_size only applies to Gemini; other keyword arguments go to the
+    backend's constructor.
+    """
+    if name == "gemini":
+        return GeminiBackend(api_key, model_name, system_prompt, pool_size=pool_size, **kwargs)
+    if name == "local":
+        return LocalBackend(**kwargs)
+    raise ValueError(f"Unknown dialogue backend: {name}")
@@ -0,0 +1,294 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from modules.llm_backends import BackendError, DialogueBackend
+
+
+# Returned by next() when a stream is exhausted
+_END = object()
+
+
+def _close_when_done(job, stream):
+    """Close a stream once the next() call running on it returns"""
+    def close(_):
+        try:
+            stream.close()
+        except Exception as e:
+            logging.error(f"Failed to close LLM stream: {e}")
+    job.add_done_callback(close)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """Stops calling a service that keeps failing
+
+        After failure_threshold consecutive failures the breaker opens and
+        allow() returns False. After reset_timeout seconds one trial call is
+        let through (half open); its success closes the breaker and its
+        failure opens it again.
+
+        Args:
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds the breaker stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may be made now"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logging.info("LLM circuit breaker closed")
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                logging.error(f"LLM circuit breaker open after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class ResilientBackend(DialogueBackend):
+    def __init__(self, backend, timeout=8.0, deadline=15.0, max_retries=2, retry_base_delay=0.25,
+                 retry_max_delay=2.0, hedge=True, hedge_percentile=95, hedge_min_samples=20,
+                 breaker=None):
+        """Deadlines, retries, hedged requests and a circuit breaker around another backend
+
+        Each attempt must produce its first token within timeout seconds,
+        and every later delta must follow within timeout of the previous
+        one. Attempts that fail with a transient BackendError (or time out)
+        before the first token are retried after a jittered exponential
+        backoff, until max_retries or the deadline for the first token is
+        reached. Once text has been streamed the call is never retried, so
+        no text is repeated; a failure then ends the stream with the error.
+
+        With hedge, an attempt that has no first token when the
+        hedge_percentile of recent times to first token has passed gets a
+        second, identical request, and whichever answers first is used. The
+        other one is closed, which drops its connection.
+
+        Calls are refused with a transient BackendError while the circuit
+        breaker is open (after several calls in a row failed, retries
+        included), so a dead API fails fast and DialogueManager can
+        fall back to a cached or local answer.
+
+        Args:
+            backend: DialogueBackend to call
+            timeout: Seconds to wait for each delta of an attempt (None for no limit)
+            deadline: Seconds to get a first token, over all attempts (None for no limit)
+            max_retries: Attempts after the first one
+            retry_base_delay: Upper bound of the first backoff, in seconds;
+                it doubles for each retry (the delay is uniform below it)
+            retry_max_delay: Largest backoff bound, in seconds
+            hedge: Whether to send hedged requests
+            hedge_percentile: Percentile of the time to first token after which a request is hedged
+            hedge_min_samples: First tokens to observe before hedging starts
+            breaker: CircuitBreaker (a default one if None)
+        """
+        self.backend = backend
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.max_concurrency = backend.max_concurrency
+
+        # The inner streams are advanced on their own pool, so the blocking
+        # calls of astream() (which run on the base class pool) never wait
+        # for a thread of the same pool; hedges can double the calls in flight
+        self._calls = ThreadPoolExecutor(max_workers=2 * backend.max_concurrency, thread_name_prefix="llm-call")
+        self._first_token_times = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    @property
+    def summarizes(self):
+        return self.backend.summarizes
+
+    def hedge_delay(self):
+        """Seconds after which an attempt is hedged, or None while there are too few samples"""
+        with self._lock:
+            if not self.hedge or len(self._first_token_times) < self.hedge_min_samples:
+                return None
+            return float(np.percentile(self._first_token_times, self.hedge_percentile))
+
+    def _backoff(self, retry):
+        """Full-jitter exponential backoff before the given retry (1, 2, ...)"""
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (retry - 1)))
+
+    def _attempt(self, history, message, deadline):
+        """Start a request (and maybe its hedge) and wait for the first token
+
+        Returns:
+            (stream, first delta), where the delta is _END for an empty response
+        """
+        attempts = []
+
+        def launch():
+            stream = self.backend.stream(history, message)
+            attempts.append((stream, self._calls.submit(next, stream, _END), time.monotonic()))
+
+        launch()
+        start = attempts[0][2]
+        limit = min(start + self.timeout if self.timeout is not None else float("inf"),
+                    deadline if deadline is not None else float("inf"))
+        hedge_delay = self.hedge_delay()
+        hedge_at = start + hedge_delay if hedge_delay is not None else None
+        try:
+            while True:
+                finished = next((attempt for attempt in attempts if attempt[1].done()), None)
+                if finished is not None:
+                    attempts.remove(finished)
+                    stream, job, started = finished
+                    try:
+                        delta = job.result()
+                    except BackendError as e:
+                        if e.transient and attempts:
+                            # The other request may still answer
+                            continue
+                        raise
+                    with self._lock:
+                        self._first_token_times.append(time.monotonic() - started)
+                        if started != start:
+                            self.hedge_wins += 1
+                    return stream, delta
+
+                now = time.monotonic()
+                if now >= limit:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise BackendError(f"No response from the LLM after {now - start:.1f}s", transient=True)
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    with self._lock:
+                        self.hedges += 1
+                    logging.info(f"Hedging LLM request after {now - start:.2f}s without a first token")
+                    launch()
+                    continue
+                wake = limit if hedge_at is None else min(limit, hedge_at)
+                wait([job for _, job, _ in attempts], timeout=wake - now, return_when=FIRST_COMPLETED)
+        finally:
+            # Requests that lost the race (or all of them, on failure)
+            for stream, job, _ in attempts:
+                _close_when_done(job, stream)
+
+    def _first_token(self, history, message):
+        """Attempt, retry and hedge until a first token arrives
+
+        Returns:
+            (stream, first delta)
+        """
+        deadline = time.monotonic() + self.deadline if self.deadline is not None else None
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise BackendError("LLM circuit breaker is open", transient=True)
+        retry = 0
+        while True:
+            try:
+                result = self._attempt(history, message, deadline)
+            except BackendError as e:
+                if not e.transient:
+                    # The service answered; the request itself was refused
+                    self.breaker.record_success()
+                    raise
+                error = e
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+            retry += 1
+            delay = self._backoff(retry)
+            if retry > self.max_retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                self.breaker.record_failure()
+                raise error
+            logging.error(f"LLM request failed ({error}), retry {retry} in {delay:.2f}s")
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def stream(self, history, message):
+        with self._lock:
+            self.calls += 1
+        stream, delta = self._first_token(history, message)
+        job = None
+        try:
+            while delta is not _END:
+                yield delta
+                job = self._calls.submit(next, stream, _END)
+                done, _ = wait([job], timeout=self.timeout)
+                if not done:
+                    with self._lock:
+                        self.timeouts += 1
+                    self.breaker.record_failure()
+                    raise BackendError(f"LLM stream stalled for {self.timeout}s", transient=True)
+                try:
+                    delta = job.result()
+                except BackendError as e:
+                    if e.transient:
+                        self.breaker.record_failure()
+                    raise
+        finally:
+            if job is not None and not job.done():
+                _close_when_done(job, stream)
+            else:
+                stream.close()
+
+    def stats(self):
+        """Call counters, breaker state and the current hedge delay"""
+        hedge_delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "breaker": self.breaker.state,
+                "hedge_delay": hedge_delay,
+            }
+
+    def close(self):
+        super().close()
+        self._calls.shutdown(wait=False)
+        self.backend.close()
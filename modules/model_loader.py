@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+
+
+class LazyModel:
+    def __init__(self, name, loader, warm_up=None):
+        """A model that is loaded on first use, or ahead of time in the background
+
+        Args:
+            name: Name used in log messages
+            loader: Callable returning the loaded model
+            warm_up: Optional callable run on the model after a background
+                load (e.g. a dummy inference), so the first real request
+                does not pay for lazy initialization inside the libraries
+        """
+        self.name = name
+        self.loader = loader
+        self.warm_up = warm_up
+        self.load_seconds = None
+
+        self._model = None
+        self._error = None
+        self._started = False
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def _load(self, warm_up=False):
+        start = time.perf_counter()
+        try:
+            self._model = self.loader()
+            if warm_up and self.warm_up is not None:
+                try:
+                    self.warm_up(self._model)
+                except Exception as e:
+                    logging.error(f"Warm-up of {self.name} failed: {e}")
+        except Exception as e:
+            logging.error(f"Failed to load {self.name}: {e}")
+            self._error = e
+        finally:
+            self.load_seconds = time.perf_counter() - start
+            self._ready.set()
+
+    def _claim(self):
+        """Return True if the caller should run the load itself"""
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+
+    def start(self):
+        """Start loading (and warming up) in a background thread
+
+        Does nothing if loading has already started.
+        """
+        if self._claim():
+            threading.Thread(target=self._load, args=(True,), name=f"load-{self.name}", daemon=True).start()
+
+    def get(self):
+        """Return the model, loading it now or waiting for the background load"""
+        if self._claim():
+            self._load()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self._model
+
+    @property
+    def loaded(self):
+        return self._ready.is_set() and self._error is None
+
+
+def snapshot_path(snapshot_dir, kind, model_name, params=None):
+    """Path of the snapshot of a model (without extension)"""
+    payload = json.dumps([kind, model_name, params or {}], sort_keys=True, default=str)
+    digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(snapshot_dir, f"{kind}-{digest}")
+
+
+def _library_versions():
+    import torch
+    import espnet
+    return {"torch": torch.__version__, "espnet": espnet.__version__}
+
+
+def read_snapshot_meta(path):
+    """Metadata saved with a snapshot, or None (reading it imports nothing heavy)"""
+    try:
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_snapshot(path):
+    """Load a model pickled by save_snapshot(), or None if there is no usable one
+
+    Snapshots pickled by other torch or ESPnet versions are ignored.
+    Snapshots are full pickles and may run code when loaded; only point
+    the snapshot directory at a local directory you control.
+    """
+    meta = read_snapshot_meta(path)
+    if meta is None or not os.path.exists(path + ".pt"):
+        return None
+    versions = _library_versions()
+    if any(meta.get(name) != version for name, version in versions.items()):
+        logging.info(f"Ignoring model snapshot {path}.pt from other library versions")
+        return None
+
+    import torch
+    try:
+        start = time.perf_counter()
+        model = torch.load(path + ".pt", map_location="cpu", weights_only=False)
+        logging.info(f"Loaded model snapshot {path}.pt in {time.perf_counter() - start:.2f} s")
+        return model
+    except Exception as e:
+        logging.error(f"Ignoring unreadable model snapshot {path}.pt: {e}")
+        return None
+
+
+def save_snapshot(path, model, meta=None):
+    """Pickle a loaded model (and optional metadata) for a faster reload
+
+    Failures are logged and ignored; the model then keeps loading from
+    the pretrained files.
+    """
+    import torch
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, path + ".pt")
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump(dict(meta or {}, **_library_versions()), f)
+        logging.info(f"Saved model snapshot {path}.pt")
+    except Exception as e:
+        logging.error(f"Could not save model snapshot {path}.pt: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def configure_threads(num_threads=None, num_interop_threads=None):
+    """Set torch's intra-op and inter-op thread counts (None leaves a setting as is)
+
+    The inter-op count can only be set before torch runs any parallel
+    work, so call this before loading the models.
+    """
+    import torch
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            logging.error(f"Could not set inter-op threads: {e}")
+
+
+def quantize_dynamic(*modules):
+    """Quantize the Linear and LSTM layers of modules to int8, in place
+
+    Weights are stored as int8 and activations are quantized on the fly,
+    which speeds up the matrix multiplications that dominate CPU decoding.
+    Layers are replaced inside the given modules, so other objects that
+    hold on to their submodules (e.g. the beam search scorers) use the
+    quantized layers too.
+    """
+    import torch
+    try:
+        from torch.ao.quantization import quantize_dynamic as quantize
+    except ImportError:
+        from torch.quantization import quantize_dynamic as quantize
+
+    for module in modules:
+        if module is not None:
+            quantize(module, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8, inplace=True)
+
+
+def inference_mode():
+    """Context manager for running a model without autograd bookkeeping"""
+    import torch
+    return torch.inference_mode()
@@ -0,0 +1,276 @@
+import queue
+import threading
+import logging
+
+from utils.resample import resample
+from utils.text_utils import SentenceSegmenter
+from utils.tracing import tracer
+
+
+# Marks the end of a stream on a stage queue
+_END = object()
+
+
+class TurnPipeline:
+    def __init__(self, recognizer, dialogue, synthesizer, audio_handler, max_queue_size=4, barge_in=None,
+                 speculative=False):
+        """Pipelined conversation turn: ASR -> dialogue -> TTS -> playback
+
+        The dialogue, synthesis and playback stages each run in their own
+        worker thread connected by bounded queues, so synthesis starts on the
+        first complete sentence and playback starts on the first synthesized
+        chunk. Any objects with the same methods as SpeechRecognizer,
+        DialogueManager, SpeechSynthesizer and AudioHandler can be used, which
+        makes it possible to drive the pipeline with a fake LLM and a fake
+        audio device.
+
+        Args:
+            recognizer: Object with transcribe(audio, sample_rate)
+            dialogue: Object with get_response(text), and optionally
+                stream_response(text) yielding text deltas
+            synthesizer: Object with synthesize(text), and optionally
+                get_sample_rate() if its rate differs from the audio handler's
+            audio_handler: Object with record(), play(audio_data) and sample_rate;
+                with an open output stream (AudioHandler.start_output()) the
+                chunks are queued with enqueue() and play back gaplessly
+            max_queue_size: Maximum number of items buffered between stages
+            barge_in: Optional BargeInDetector; the microphone is then monitored
+                during playback and the user talking over the response cancels
+                it. Needs an AudioHandler with a running capture
+                (start_capture()).
+            speculative: Start the LLM request on the stable partial
+                transcript while the end of speech is still being confirmed
+                (DialogueManager.speculate()); needs streaming transcription
+        """
+        self.recognizer = recognizer
+        self.dialogue = dialogue
+        self.synthesizer = synthesizer
+        self.audio_handler = audio_handler
+        self.max_queue_size = max_queue_size
+        self.barge_in = barge_in
+        self.speculative = speculative and hasattr(dialogue, "speculate")
+
+        self.cancelled = threading.Event()
+        # Ring buffer position where the user interrupted the last response
+        self.interrupted_at = None
+        self._dialogue_thread = None
+
+    def listen(self, audio=None, on_partial=None, start_pos=None):
+        """Record (unless audio is given) and transcribe one user utterance
+
+        When the audio handler can stream chunks and the recognizer can
+        transcribe a stream, decoding runs while the user is still speaking.
+
+        Args:
+            audio: Already recorded audio to transcribe instead of recording
+            on_partial: Optional callback receiving partial transcripts
+            start_pos: Ring buffer position to start from, e.g. interrupted_at
+                after a barge-in so the interrupting words are transcribed
+
+        Returns:
+            Transcribed text ("" if nothing was understood)
+        """
+        tracer.begin_turn()
+        sample_rate = self.audio_handler.sample_rate
+        if audio is None and hasattr(self.audio_handler, "stream") \
+                and hasattr(self.recognizer, "transcribe_stream"):
+            chunks = self.audio_handler.stream(start_pos=start_pos) if start_pos is not None \
+                else self.audio_handler.stream()
+            kwargs = {"on_stable": self.dialogue.speculate} if self.speculative else {}
+            result = self.recognizer.transcribe_stream(chunks, sample_rate=sample_rate, on_partial=on_partial,
+                                                       **kwargs)
+            tracer.milestone("transcript")
+            if self.speculative and not result["text"].strip():
+                self.dialogue.cancel_speculation()
+            return result["text"].strip()
+
+        if audio is None:
+            audio = self.audio_handler.record()
+            tracer.milestone("end_of_speech")
+        if len(audio) == 0:
+            return ""
+
+        result = self.recognizer.transcribe(audio, sample_rate=sample_rate)
+        tracer.milestone("transcript")
+        return result["text"].strip()
+
+    def respond(self, user_text):
+        """Generate, synthesize and play a response with overlapped stages
+
+        If the response is cancelled (by cancel() or a barge-in), this
+        returns as soon as playback has stopped; interrupted_at is then set
+        when it was a barge-in.
+
+        Returns:
+            Response text generated so far
+        """
+        # A cancelled LLM stream may still be waiting for its next chunk;
+        # let it finish updating the history before the next request
+        if self._dialogue_thread is not None:
+            self._dialogue_thread.join()
+
+        if tracer.turn is None:
+            tracer.begin_turn()
+        self.cancelled.clear()
+        self.interrupted_at = None
+        # Once per turn: a cancel() between two chunks must stop all the later ones
+        if hasattr(self.audio_handler, "start_playback"):
+            self.audio_handler.start_playback()
+        sentence_queue = queue.Queue(maxsize=self.max_queue_size)
+        audio_queue = queue.Queue(maxsize=self.max_queue_size)
+        response_parts = []
+
+        self._dialogue_thread = threading.Thread(target=self._dialogue_worker,
+                                                 args=(user_text, sentence_queue, response_parts),
+                                                 name="pipeline-dialogue", daemon=True)
+        workers = [
+            threading.Thread(target=self._synthesis_worker, args=(sentence_queue, audio_queue),
+                             name="pipeline-tts", daemon=True),
+            threading.Thread(target=self._playback_worker, args=(audio_queue,),
+                             name="pipeline-playback", daemon=True),
+        ]
+        self._dialogue_thread.start()
+        for worker in workers:
+            worker.start()
+
+        playback_done = threading.Event()
+        monitor = None
+        if self.barge_in is not None:
+            monitor = threading.Thread(target=self._barge_in_monitor, args=(playback_done,),
+                                       name="pipeline-barge-in", daemon=True)
+            monitor.start()
+
+        for worker in workers:
+            worker.join()
+        playback_done.set()
+        if monitor is not None:
+            monitor.join()
+        if not self.cancelled.is_set():
+            self._dialogue_thread.join()
+        tracer.end_turn()
+
+        return "".join(response_parts).strip()
+
+    def cancel(self):
+        """Stop the current response: playback, pending synthesis and the LLM stream
+
+        Safe to call from any thread. Sentences already queued are dropped,
+        a synthesis call in progress is allowed to finish but its audio is
+        discarded, and the LLM stream is closed after its next chunk.
+        """
+        self.cancelled.set()
+        if hasattr(self.audio_handler, "stop_playback"):
+            self.audio_handler.stop_playback()
+
+    def _barge_in_monitor(self, playback_done):
+        """Watch the microphone during the response and cancel it if the user talks"""
+        detector = self.barge_in
+        detector.reset()
+        read_pos = self.audio_handler.ring.written
+        while not playback_done.is_set() and not self.cancelled.is_set():
+            write_pos = self.audio_handler.wait_for_audio(read_pos, timeout=0.05)
+            if write_pos == read_pos:
+                continue
+            chunk = self.audio_handler.ring.view(read_pos, write_pos)
+            chunk_pos, read_pos = read_pos, write_pos
+            if detector.process(chunk, chunk_pos):
+                logging.info("Barge-in detected, cancelling the response")
+                self.interrupted_at = detector.onset_pos
+                self.cancel()
+        detector.clear_reference()
+
+    def run_turn(self, audio=None):
+        """Run a full turn: listen, then respond
+
+        Returns:
+            Dictionary with the user transcript and the response text
+        """
+        user_text = self.listen(audio)
+        if not user_text:
+            return {"transcript": "", "response": ""}
+        return {"transcript": user_text, "response": self.respond(user_text)}
+
+    def _stream_text(self, user_text):
+        """Yield response text deltas, falling back to a single blocking reply"""
+        stream_response = getattr(self.dialogue, "stream_response", None)
+        if stream_response is None:
+            yield self.dialogue.get_response(user_text)
+        else:
+            yield from stream_response(user_text)
+
+    def _dialogue_worker(self, user_text, sentence_queue, response_parts):
+        """Stream the LLM response and forward each complete sentence"""
+        segmenter = SentenceSegmenter()
+        stream = self._stream_text(user_text)
+        try:
+            for delta in stream:
+                if self.cancelled.is_set():
+                    break
+                tracer.milestone("first_token")
+                response_parts.append(delta)
+                for sentence in segmenter.push(delta):
+                    sentence_queue.put(sentence)
+            if not self.cancelled.is_set():
+                for sentence in segmenter.flush():
+                    sentence_queue.put(sentence)
+        except Exception as e:
+            logging.error(f"Pipeline dialogue error: {e}")
+        finally:
+            # Closing the generator ends the LLM request (the dialogue
+            # manager keeps the partial response in the history)
+            stream.close()
+            sentence_queue.put(_END)
+
+    def _synthesis_worker(self, sentence_queue, audio_queue):
+        """Synthesize sentences as they arrive"""
+        if hasattr(self.synthesizer, "get_sample_rate"):
+            synthesis_rate = self.synthesizer.get_sample_rate()
+        else:
+            synthesis_rate = self.audio_handler.sample_rate
+        try:
+            while True:
+                sentence = sentence_queue.get()
+                if sentence is _END:
+                    break
+                if self.cancelled.is_set():
+                    continue
+                audio = self.synthesizer.synthesize(sentence)
+                if len(audio) > 0 and not self.cancelled.is_set():
+                    # Resample here rather than on the playback thread
+                    audio_queue.put(resample(audio, synthesis_rate, self.audio_handler.sample_rate))
+        except Exception as e:
+            logging.error(f"Pipeline synthesis error: {e}")
+            # Keep draining so the dialogue worker never blocks on a full queue
+            while sentence_queue.get() is not _END:
+                pass
+        finally:
+            audio_queue.put(_END)
+
+    def _playback_worker(self, audio_queue):
+        """Play synthesized chunks in order"""
+        # With a persistent output stream, chunks are queued back to back
+        # instead of being played one blocking call at a time
+        streaming = getattr(self.audio_handler, "output", None) is not None
+        try:
+            while True:
+                audio = audio_queue.get()
+                if audio is _END:
+                    break
+                if self.cancelled.is_set():
+                    continue
+                tracer.milestone("first_audio")
+                if streaming:
+                    start_pos = self.audio_handler.enqueue(audio)
+                else:
+                    start_pos = self.audio_handler.ring.written if self.barge_in is not None else None
+                if self.barge_in is not None:
+                    # Reference for telling the user's voice from the echo of the playback
+                    self.barge_in.add_reference(audio, start_pos)
+                if not streaming:
+                    self.audio_handler.play(audio)
+            if streaming and not self.cancelled.is_set():
+                self.audio_handler.wait_playback(self.cancelled)
+        except Exception as e:
+            logging.error(f"Pipeline playback error: {e}")
+            while audio_queue.get() is not _END:
+                pass
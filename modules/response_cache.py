@@ -0,0 +1,248 @@
+import re
+import time
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_prompt(text):
+    """Normalize a prompt for cache lookups (case, punctuation and whitespace)"""
+    text = re.sub(r"[^\w\s']", " ", text.lower())
+    return " ".join(text.split())
+
+
+# Numbers a near-duplicate prompt must share ("5 minutes" vs "15 minutes")
+_NUMBER_WORDS = {
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven",
+    "twelve", "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen", "nineteen", "twenty",
+    "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety", "hundred", "thousand", "million",
+    "half", "quarter", "first", "second", "third",
+}
+
+# Prompts whose answer depends on when they are asked
+_TIME_SENSITIVE_PROMPT = re.compile(
+    r"\b(time|date|day|today|tonight|tomorrow|yesterday|now|current|currently|latest|news|weather|"
+    r"this (morning|afternoon|evening|week|weekend|month|year))\b",
+    re.IGNORECASE
+)
+
+# Replies that state a clock time or a day
+_DATED_REPLY = re.compile(
+    r"\b\d{1,2}:\d{2}\b|\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday|january|february|march|"
+    r"april|may|june|july|august|september|october|november|december|today|tonight|tomorrow|yesterday)\b",
+    re.IGNORECASE
+)
+
+
+def prompt_numbers(normalized):
+    """Digits and number words of a normalized prompt, in order"""
+    return [word for word in normalized.split() if word.isdigit() or word in _NUMBER_WORDS]
+
+
+def is_time_sensitive(prompt, response):
+    """Whether a response depends on the time it was given ("what time is it", "Today is Monday")"""
+    return bool(_TIME_SENSITIVE_PROMPT.search(prompt) or _DATED_REPLY.search(response))
+
+
+def context_hash(*parts):
+    """Hash the context a response depends on (system prompt, previous reply, ...)"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class HashingEmbedder:
+    def __init__(self, dim=512, ngram=3):
+        """Local, CPU-only text embedding from hashed character n-grams
+
+        Cheap enough to run on every lookup and good at matching rephrasings
+        that share most of their words ("what's the weather like" vs "what is
+        the weather like").
+        """
+        self.dim = dim
+        self.ngram = ngram
+
+    def __call__(self, text):
+        padded = f" {text} "
+        vector = np.zeros(self.dim, dtype=np.float32)
+        grams = [padded[i:i + self.ngram] for i in range(len(padded) - self.ngram + 1)]
+        if not grams:
+            return vector
+        indices = np.fromiter((zlib.crc32(g.encode("utf-8")) % self.dim for g in grams),
+                              dtype=np.int64, count=len(grams))
+        np.add.at(vector, indices, 1.0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512, max_bytes=2 * 1024 * 1024, ttl=24 * 3600,
+                 similarity_threshold=None, embedder=None):
+        """LRU + TTL cache of LLM responses keyed on normalized prompt and context
+
+        Args:
+            max_entries: Maximum number of cached responses
+            max_bytes: Maximum total size of the cached responses (text, keys and embeddings)
+            ttl: Seconds after which an entry expires (None for no expiry)
+            similarity_threshold: Cosine similarity above which a non-identical
+                prompt with the same context counts as a hit (None for exact
+                matches only)
+            embedder: Callable mapping normalized text to a unit vector
+                (defaults to HashingEmbedder when similarity_threshold is set)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        if similarity_threshold is not None and embedder is None:
+            embedder = HashingEmbedder()
+        self.embedder = embedder
+
+        # key -> (response, context, embedding, created_at, size)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, normalized, context):
+        return f"{context}:{normalized}"
+
+    def get(self, prompt, context="", record=True):
+        """Return the cached response for prompt in context, or None
+
+        Args:
+            prompt: User text
+            context: Context hash the response depends on
+            record: Whether the lookup counts as a hit or miss and refreshes the entry
+        """
+        normalized = normalize_prompt(prompt)
+        key = self._key(normalized, context)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(key)
+                entry = None
+
+            if entry is not None:
+                if record:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                return entry[0]
+
+            if self.embedder is not None:
+                match = self._nearest(normalized, context, now)
+                if match is not None:
+                    if record:
+                        self._entries.move_to_end(match)
+                        self.hits += 1
+                        self.similar_hits += 1
+                    return self._entries[match][0]
+
+            if record:
+                self.misses += 1
+            return None
+
+    def get_any(self, prompt):
+        """Return the most recent cached response for prompt in any context, or None
+
+        For degraded answers while the model is unavailable; exact
+        (normalized) matches only, and the hit counters are not updated.
+        """
+        normalized = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            for key in reversed(self._entries):
+                entry = self._entries[key]
+                if key.split(":", 1)[1] == normalized and not self._expired(entry, now):
+                    return entry[0]
+        return None
+
+    def put(self, prompt, response, context=""):
+        """Cache response for prompt in context
+
+        Time- and date-dependent responses are not cached, as they would be
+        wrong when replayed later.
+        """
+        if is_time_sensitive(prompt, response):
+            return
+        normalized = normalize_prompt(prompt)
+        key = self._key(normalized, context)
+        embedding = self.embedder(normalized) if self.embedder is not None else None
+        size = len(key.encode("utf-8")) + len(response.encode("utf-8"))
+        if embedding is not None:
+            size += embedding.nbytes
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (response, context, embedding, time.time(), size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry[3] > self.ttl
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[4]
+
+    def _nearest(self, normalized, context, now):
+        """Key of the most similar live entry with the same context, if above the threshold
+
+        Only entries with the same numbers as the prompt are candidates:
+        prompts that differ by a number are close in characters but not in
+        meaning.
+        """
+        numbers = prompt_numbers(normalized)
+        keys = [key for key, entry in self._entries.items()
+                if entry[1] == context and not self._expired(entry, now)
+                and prompt_numbers(key.split(":", 1)[1]) == numbers]
+        if not keys:
+            return None
+
+        query = self.embedder(normalized)
+        matrix = np.stack([self._entries[key][2] for key in keys])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return keys[best]
+        return None
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,274 @@
+import os
+import mmap
+import json
+import time
+import struct
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# Length prefix of a record in a session file
+_LENGTH = struct.Struct("<I")
+
+
+class SQLiteSessionBackend:
+    def __init__(self, path):
+        """Sessions in one SQLite database (WAL mode, safe to share between processes)
+
+        Args:
+            path: Database file
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS messages (session TEXT, seq INTEGER, role TEXT, "
+                                 "text TEXT, time REAL, PRIMARY KEY (session, seq))")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS summaries (session TEXT PRIMARY KEY, "
+                                 "summary TEXT, summarized INTEGER)")
+        self._connection.commit()
+
+    def append(self, session_id, messages):
+        """Append [(role, text), ...] to a session"""
+        with self._lock, self._connection:
+            start = self._count(session_id)
+            now = time.time()
+            self._connection.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                [(session_id, start + i, role, text, now) for i, (role, text) in enumerate(messages)]
+            )
+
+    def set_summary(self, session_id, summary, summarized):
+        """Store the summary of the first summarized messages of a session"""
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)",
+                                     (session_id, summary, summarized))
+
+    def _count(self, session_id):
+        row = self._connection.execute("SELECT MAX(seq) FROM messages WHERE session = ?", (session_id,)).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def count(self, session_id):
+        """Number of messages stored for a session"""
+        with self._lock:
+            return self._count(session_id)
+
+    def load(self, session_id):
+        """Summary and the messages it does not cover, or None for an unknown session"""
+        with self._lock:
+            row = self._connection.execute("SELECT summary, summarized FROM summaries WHERE session = ?",
+                                           (session_id,)).fetchone()
+            summary, summarized = row if row else ("", 0)
+            rows = self._connection.execute("SELECT role, text FROM messages WHERE session = ? AND seq >= ? "
+                                            "ORDER BY seq", (session_id, summarized)).fetchall()
+            count = self._count(session_id)
+        if count == 0 and not summary:
+            return None
+        return {
+            "summary": summary,
+            "summarized": summarized,
+            "messages": [{"role": role, "parts": [text]} for role, text in rows],
+            "count": count,
+        }
+
+    def delete(self, session_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM messages WHERE session = ?", (session_id,))
+            self._connection.execute("DELETE FROM summaries WHERE session = ?", (session_id,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class MmapSessionBackend:
+    def __init__(self, directory):
+        """Sessions as append-only files of length-prefixed JSON records, read through mmap
+
+        Each session has a .log file of messages and a .json file with its
+        summary (replaced atomically). Files are named after a hash of the
+        session id, so any string can be used as an id.
+
+        Args:
+            directory: Directory of the session files
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, session_id, extension):
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{extension}")
+
+    def append(self, session_id, messages):
+        """Append [(role, text), ...] to a session"""
+        now = time.time()
+        records = []
+        for role, text in messages:
+            payload = json.dumps({"role": role, "text": text, "time": now}, ensure_ascii=False).encode("utf-8")
+            records.append(_LENGTH.pack(len(payload)) + payload)
+        with self._lock, open(self._path(session_id, "log"), "ab") as f:
+            # One write per call, so a session file never holds half a turn
+            f.write(b"".join(records))
+
+    def set_summary(self, session_id, summary, summarized):
+        """Store the summary of the first summarized messages of a session"""
+        path = self._path(session_id, "json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "summarized": summarized}, f)
+        os.replace(tmp_path, path)
+
+    def _records(self, session_id, start=0):
+        """(message count, messages from index start) of a session file"""
+        try:
+            f = open(self._path(session_id, "log"), "rb")
+        except FileNotFoundError:
+            return 0, []
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return 0, []
+            messages = []
+            count = 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                offset = 0
+                # Only the headers of the summarized records are read
+                while offset + _LENGTH.size <= size:
+                    length, = _LENGTH.unpack_from(data, offset)
+                    end = offset + _LENGTH.size + length
+                    if end > size:
+                        # Torn write at the end of the file
+                        break
+                    if count >= start:
+                        record = json.loads(data[offset + _LENGTH.size:end])
+                        messages.append({"role": record["role"], "parts": [record["text"]]})
+                    count += 1
+                    offset = end
+            return count, messages
+
+    def count(self, session_id):
+        """Number of messages stored for a session"""
+        return self._records(session_id, start=float("inf"))[0]
+
+    def load(self, session_id):
+        """Summary and the messages it does not cover, or None for an unknown session"""
+        try:
+            with open(self._path(session_id, "json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {"summary": "", "summarized": 0}
+        count, messages = self._records(session_id, start=meta["summarized"])
+        if count == 0 and not meta["summary"]:
+            return None
+        return {"summary": meta["summary"], "summarized": meta["summarized"], "messages": messages, "count": count}
+
+    def delete(self, session_id):
+        with self._lock:
+            for extension in ("log", "json"):
+                try:
+                    os.remove(self._path(session_id, extension))
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        pass
+
+
+class SessionStore:
+    def __init__(self, backend, cache_size=256):
+        """Persistent conversation sessions with an in-process LRU cache
+
+        Messages are appended to the backend as each turn completes, so a
+        session survives restarts and can be resumed by any worker sharing
+        the backend. Loaded sessions are cached; a cached session is only
+        used while the backend holds the same number of messages, so a
+        session that continued on another worker is read again.
+
+        Args:
+            backend: SQLiteSessionBackend, MmapSessionBackend or an object
+                with the same methods
+            cache_size: Number of sessions kept in memory
+        """
+        self.backend = backend
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, session_id):
+        """Saved state of a session, or None if it has none
+
+        Returns:
+            {"summary", "summarized", "messages", "count"}, where messages
+            are the ones not folded into the summary, in the format of
+            ContextWindow.messages
+        """
+        with self._lock:
+            state = self._cache.get(session_id)
+        if state is not None and state["count"] == self.backend.count(session_id):
+            with self._lock:
+                self._cache.move_to_end(session_id)
+                self.hits += 1
+            return self._copy(state)
+
+        state = self.backend.load(session_id)
+        with self._lock:
+            self.misses += 1
+            if state is not None:
+                self._remember(session_id, state)
+        return self._copy(state) if state is not None else None
+
+    def append(self, session_id, messages):
+        """Save new messages [(role, text), ...] of a session"""
+        self.backend.append(session_id, messages)
+        with self._lock:
+            state = self._cache.get(session_id)
+            if state is not None:
+                state["messages"].extend({"role": role, "parts": [text]} for role, text in messages)
+                state["count"] += len(messages)
+
+    def set_summary(self, session_id, summary, summarized):
+        """Save the summary of the first summarized messages of a session"""
+        self.backend.set_summary(session_id, summary, summarized)
+        with self._lock:
+            state = self._cache.get(session_id)
+            if state is not None:
+                del state["messages"][:max(summarized - state["summarized"], 0)]
+                state["summary"] = summary
+                state["summarized"] = summarized
+
+    def delete(self, session_id):
+        self.backend.delete(session_id)
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def close(self):
+        self.backend.close()
+
+    def _remember(self, session_id, state):
+        self._cache[session_id] = state
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _copy(state):
+        return dict(state, messages=[{"role": m["role"], "parts": list(m["parts"])} for m in state["messages"]])
+
+
+def open_session_store(backend, directory, cache_size=256):
+    """Create a SessionStore with the "sqlite" or "mmap" backend, kept in directory"""
+    if backend == "sqlite":
+        return SessionStore(SQLiteSessionBackend(os.path.join(directory, "sessions.sqlite3")), cache_size=cache_size)
+    if backend == "mmap":
+        return SessionStore(MmapSessionBackend(directory), cache_size=cache_size)
+    raise ValueError(f"Unknown session store backend: {backend}")
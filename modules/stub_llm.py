@@ -0,0 +1,141 @@
+import re
+import time
+import random
+import logging
+import threading
+
+from modules.llm_backends import BackendError, DialogueBackend
+
+
+class StubChunk:
+    def __init__(self, text):
+        """One streamed piece of a stub response"""
+        self.text = text
+
+
+class StubResponse:
+    def __init__(self, text, chunk_size=4, first_chunk_delay=0.0, chunk_delay=0.0):
+        """Response that can be read whole (.text) or iterated as delayed chunks"""
+        self._text = text
+        self.chunk_size = chunk_size
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+
+    @property
+    def text(self):
+        return self._text
+
+    def __iter__(self):
+        # Split into words while keeping their trailing whitespace
+        words = re.findall(r'\S+\s*', self._text)
+        for i in range(0, len(words), self.chunk_size):
+            time.sleep(self.first_chunk_delay if i == 0 else self.chunk_delay)
+            yield StubChunk("".join(words[i:i + self.chunk_size]))
+
+
+class StubChat:
+    def __init__(self, model, history=None):
+        """Chat session for StubModel, mirroring the Gemini ChatSession interface"""
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False):
+        """Reply to content with the model's next scripted response"""
+        text = self.model.next_response(content)
+        self.history.append({"role": "user", "parts": [content]})
+        self.history.append({"role": "model", "parts": [text]})
+
+        if not stream:
+            time.sleep(self.model.first_chunk_delay)
+        return StubResponse(
+            text,
+            chunk_size=self.model.chunk_size,
+            first_chunk_delay=self.model.first_chunk_delay,
+            chunk_delay=self.model.chunk_delay
+        )
+
+
+class StubModel:
+    def __init__(self, responses=None, chunk_size=4, first_chunk_delay=0.0, chunk_delay=0.0):
+        """Local stand-in for genai.GenerativeModel that needs no network
+
+        Args:
+            responses: List of responses returned in turn (cycled), or a callable
+                mapping the user text to a response. Defaults to echoing the input.
+            chunk_size: Number of words per streamed chunk
+            first_chunk_delay: Seconds before the first chunk (time to first token)
+            chunk_delay: Seconds between subsequent chunks
+        """
+        self.responses = responses
+        self.chunk_size = chunk_size
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        logging.info("Initialized stub LLM")
+
+    def next_response(self, content):
+        """Pick the response for content"""
+        self.calls += 1
+        if callable(self.responses):
+            return self.responses(content)
+        if self.responses:
+            return self.responses[(self.calls - 1) % len(self.responses)]
+        return f"You said: {content}"
+
+    def start_chat(self, history=None):
+        return StubChat(self, history)
+
+
+class FaultInjectingBackend(DialogueBackend):
+    def __init__(self, backend, error_rate=0.0, stall_rate=0.0, stall_time=30.0, break_rate=0.0, seed=None):
+        """Wraps a backend and makes some of its calls fail, for testing retry and fallback policies
+
+        Each call independently fails with a transient BackendError (HTTP 503)
+        before its first token, hangs for stall_time seconds before its first
+        token, or breaks off with a BackendError after its first delta.
+
+        Args:
+            backend: DialogueBackend answering the calls that do not fail
+            error_rate: Probability that a call fails immediately
+            stall_rate: Probability that a call hangs before its first token
+            stall_time: Seconds a stalled call hangs
+            break_rate: Probability that a call fails after its first delta
+            seed: Seed of the fault generator, for reproducible runs
+        """
+        self.backend = backend
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.break_rate = break_rate
+        self.max_concurrency = backend.max_concurrency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.errors = 0
+        self.stalls = 0
+        self.breaks = 0
+
+    @property
+    def summarizes(self):
+        return self.backend.summarizes
+
+    def stream(self, history, message):
+        with self._lock:
+            self.calls += 1
+            draw = self._random.random()
+        if draw < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise BackendError("Injected fault: service unavailable", status=503, transient=True)
+        if draw < self.error_rate + self.stall_rate:
+            with self._lock:
+                self.stalls += 1
+            time.sleep(self.stall_time)
+        broken = 0 <= draw - self.error_rate - self.stall_rate < self.break_rate
+        for i, delta in enumerate(self.backend.stream(history, message)):
+            if i == 1 and broken:
+                with self._lock:
+                    self.breaks += 1
+                raise BackendError("Injected fault: connection reset", transient=True)
+            yield delta
@@ -1,38 +1,202 @@
 import numpy as np
-from espnet2.bin.tts_inference import Text2Speech
 import logging
+import queue
+import threading
+
+from modules.audio_cache import AudioCache
+from modules.model_loader import (LazyModel, inference_mode, load_snapshot, quantize_dynamic, read_snapshot_meta,
+                                  save_snapshot, snapshot_path)
+from utils.text_utils import split_sentences
+from utils.tracing import traced
 
 
 class SpeechSynthesizer:
-    def __init__(self, model_name):
-        """Initialize the speech synthesizer with a pre-trained model"""
-        try:
-            self.model = Text2Speech.from_pretrained(model_name)
-            self.sample_rate = self.model.fs
-            logging.info(f"Loaded TTS model: {model_name}")
-        except Exception as e:
-            logging.error(f"Failed to load TTS model: {e}")
-            raise
+    def __init__(self, model_name, cache=None, lazy=False, snapshot_dir=None, quantize=False, **synthesis_params):
+        """Initialize the speech synthesizer with a pre-trained model
+
+        Args:
+            model_name: ESPnet TTS model tag
+            cache: Optional AudioCache for synthesized waveforms
+            lazy: Load the model on first use (or in the background with
+                start_loading()) instead of now; cached phrases can be
+                played before it is loaded
+            snapshot_dir: Optional directory for a pickled snapshot of the
+                loaded model, which reloads faster than the pretrained files
+            quantize: Quantize the Linear/LSTM layers of the acoustic model
+                to int8 for faster CPU synthesis
+            **synthesis_params: Extra Text2Speech options (e.g. speed_control_alpha)
+        """
+        self.model_name = model_name
+        self.cache = cache
+        self.synthesis_params = synthesis_params
+        self.snapshot_dir = snapshot_dir
+        self.quantize = quantize
+        self.sample_rate = None
+
+        # Quantized output differs slightly, so it is cached separately
+        self.cache_params = dict(synthesis_params, quantize=True) if quantize else synthesis_params
+
+        self._snapshot_path = None
+        if snapshot_dir:
+            self._snapshot_path = snapshot_path(snapshot_dir, "tts", model_name, synthesis_params)
+            # The sample rate is known from the last run without loading the model
+            meta = read_snapshot_meta(self._snapshot_path)
+            if meta is not None:
+                self.sample_rate = meta.get("sample_rate")
+
+        # The model is not safe to run from several threads at once
+        self._lock = threading.Lock()
+        self._model = LazyModel(f"TTS model {model_name}", self._load_model, warm_up=self._warm_up)
+        if not lazy:
+            self._model.get()
+
+    @property
+    def model(self):
+        """The Text2Speech model (waits for it to be loaded)"""
+        return self._model.get()
+
+    def _load_model(self):
+        # Imported here so that importing this module does not pull in espnet and torch
+        from espnet2.bin.tts_inference import Text2Speech
+
+        path = self._snapshot_path
+        model = load_snapshot(path) if path else None
+        if model is None:
+            model = Text2Speech.from_pretrained(self.model_name, **self.synthesis_params)
+            if path:
+                save_snapshot(path, model, meta={"sample_rate": model.fs})
+        self.sample_rate = model.fs
+
+        # Snapshots hold the fp32 model; quantization is cheap to redo
+        if self.quantize and str(model.device) == "cpu":
+            quantize_dynamic(model.model)
+            logging.info("Quantized TTS model to int8")
+        logging.info(f"Loaded TTS model: {self.model_name}")
+        return model
+
+    def _warm_up(self, model):
+        # A short utterance initializes the kernels and allocator before the first response
+        with self._lock, inference_mode():
+            model("Hello.")
+
+    def start_loading(self):
+        """Load and warm up the model in a background thread"""
+        self._model.start()
+
+    @property
+    def load_seconds(self):
+        """Time taken to load the model, or None while it is not loaded yet"""
+        return self._model.load_seconds
 
-    def synthesize(self, text):
-        """Convert text to speech"""
+    @traced("tts.synthesize")
+    def synthesize(self, text, persist=None):
+        """Convert text to speech
+
+        Args:
+            text: Text to speak
+            persist: Whether to keep the waveform in the on-disk cache as
+                well (None for the cache's default)
+        """
         try:
             if not text:
                 return np.zeros(0, dtype=np.float32)
 
+            if self.cache is not None:
+                key = AudioCache.make_key(text, self.model_name, self.cache_params)
+                wav = self.cache.get(key)
+                if wav is not None:
+                    return wav
+
             # Generate speech
-            with_duration = self.model(text)
+            model = self.model
+            with self._lock, inference_mode():
+                with_duration = model(text)
             wav = with_duration["wav"]
 
             # Convert to numpy array if it's a tensor
             if hasattr(wav, "numpy"):
                 wav = wav.numpy()
 
+            if self.cache is not None:
+                self.cache.put(key, wav, persist=persist)
+
             return wav
         except Exception as e:
             logging.error(f"Speech synthesis error: {e}")
             return np.zeros(0, dtype=np.float32)
 
+    def synthesize_stream(self, text, lookahead=2):
+        """Convert text to speech one sentence at a time
+
+        The text is split into sentences (long ones at clause boundaries) and
+        a background thread synthesizes up to lookahead of them ahead of the
+        one being consumed, so the first block is ready after the first
+        sentence and later ones keep up with playback.
+
+        Args:
+            text: Text to speak, or an iterable of already split text units
+                (e.g. sentences from a SentenceSegmenter as they arrive)
+            lookahead: Number of synthesized blocks buffered ahead
+
+        Yields:
+            Waveform of each text unit, in order
+        """
+        units = split_sentences(text) if isinstance(text, str) else text
+        blocks = queue.Queue(maxsize=lookahead)
+        stopped = threading.Event()
+        end = object()
+
+        def put(item):
+            # Give up when the consumer has gone away
+            while not stopped.is_set():
+                try:
+                    blocks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker():
+            try:
+                for unit in units:
+                    if not put(self.synthesize(unit)):
+                        return
+            except Exception as e:
+                logging.error(f"Streaming synthesis error: {e}")
+            finally:
+                put(end)
+
+        thread = threading.Thread(target=worker, name="tts-stream", daemon=True)
+        thread.start()
+        try:
+            while True:
+                wav = blocks.get()
+                if wav is end:
+                    break
+                if len(wav):
+                    yield wav
+        finally:
+            stopped.set()
+
+    def prewarm(self, phrases):
+        """Synthesize phrases into the cache ahead of time
+
+        Each phrase is cached whole and sentence by sentence, since streamed
+        responses are synthesized one sentence at a time. The phrases are
+        kept on disk, so later runs start without synthesizing them.
+        """
+        if self.cache is None:
+            return
+        for phrase in phrases:
+            self.synthesize(phrase, persist=True)
+            sentences = split_sentences(phrase)
+            if len(sentences) > 1:
+                for sentence in sentences:
+                    self.synthesize(sentence, persist=True)
+        logging.info(f"Pre-warmed TTS cache with {len(phrases)} phrases")
+
     def get_sample_rate(self):
         """Get the sample rate of the model"""
-        return self.sample_rate
\ No newline at end of file
+        if self.sample_rate is None:
+            self.sample_rate = self.model.fs
+        return self.sample_rate
@@ -0,0 +1,144 @@
+import numpy as np
+
+from utils.audio_utils import frame_signal, frame_rms
+
+
+class VoiceActivityDetector:
+    # States returned by process()
+    SILENCE = "silence"
+    SPEECH_START = "speech_start"
+    SPEECH = "speech"
+    SPEECH_END = "speech_end"
+
+    def __init__(self, sample_rate=16000, frame_size=256, end_of_speech_ms=700, min_speech_ms=90,
+                 pre_roll_ms=300, min_energy=0.005, snr_factor=3.0, speech_band=(300, 3400),
+                 band_ratio_threshold=0.5, noise_adapt_rate=0.05):
+        """Streaming voice activity detector with an adaptive noise floor
+
+        Audio is split into short frames; a frame counts as speech when its
+        RMS energy is well above the tracked noise floor and most of its
+        spectral energy lies in the speech band. Speech starts after
+        min_speech_ms of consecutive speech frames and ends after
+        end_of_speech_ms without any (the hangover).
+
+        Args:
+            sample_rate: Sample rate of the audio in Hz
+            frame_size: Samples per analysis frame
+            end_of_speech_ms: Silence after speech that ends the utterance
+            min_speech_ms: Consecutive speech needed to start an utterance
+            pre_roll_ms: Audio the caller should keep from before the speech onset
+            min_energy: Absolute RMS floor below which a frame is never speech
+            snr_factor: How far above the noise floor a frame's energy must be
+            speech_band: (low, high) frequency range of speech in Hz
+            band_ratio_threshold: Minimum fraction of energy in the speech band
+            noise_adapt_rate: Smoothing factor for noise floor updates
+        """
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.min_energy = min_energy
+        self.snr_factor = snr_factor
+        self.band_ratio_threshold = band_ratio_threshold
+        self.noise_adapt_rate = noise_adapt_rate
+
+        frame_ms = 1000.0 * frame_size / sample_rate
+        self.end_of_speech_frames = max(1, int(round(end_of_speech_ms / frame_ms)))
+        self.min_speech_frames = max(1, int(round(min_speech_ms / frame_ms)))
+        self.pre_roll_samples = int(sample_rate * pre_roll_ms / 1000)
+
+        # FFT bins inside the speech band
+        freqs = np.fft.rfftfreq(frame_size, 1.0 / sample_rate)
+        self._band = (freqs >= speech_band[0]) & (freqs <= speech_band[1])
+        self._window = np.hanning(frame_size).astype(np.float32)
+
+        self.reset()
+
+    def reset(self):
+        """Start a new utterance (the noise floor estimate is kept)"""
+        if not hasattr(self, "noise_floor"):
+            self.noise_floor = None
+        self.in_speech = False
+        self.speech_run = 0
+        self.silence_run = 0
+        self._remainder = np.zeros(0, dtype=np.float32)
+        # Set when speech started and ended within one chunk
+        self._pending_end = False
+
+    def frame_decisions(self, audio, noise_mask=None):
+        """Classify complete frames of audio as speech or not (vectorized)
+
+        Args:
+            audio: Float32 audio; a trailing partial frame is ignored
+            noise_mask: Optional boolean array, one entry per frame; only
+                frames where it is True may update the noise floor (e.g. to
+                keep the echo of our own playback out of it)
+
+        Returns:
+            Boolean array with one entry per frame
+        """
+        frames = frame_signal(audio, self.frame_size, pad=False)
+        if len(frames) == 0:
+            return np.zeros(0, dtype=bool)
+
+        energy = frame_rms(frames)
+        power = np.abs(np.fft.rfft(frames * self._window, axis=1)) ** 2
+        band_ratio = power[:, self._band].sum(axis=1) / np.maximum(power.sum(axis=1), 1e-12)
+
+        if self.noise_floor is None:
+            # Assume the stream starts with background noise
+            self.noise_floor = max(float(np.median(energy)), 1e-4)
+
+        threshold = max(self.min_energy, self.noise_floor * self.snr_factor)
+        is_speech = (energy > threshold) & (band_ratio > self.band_ratio_threshold)
+
+        # Track the noise floor on non-speech frames: follow drops quickly and rises slowly
+        noise_frames = ~is_speech if noise_mask is None else ~is_speech & noise_mask
+        noise = energy[noise_frames]
+        if len(noise):
+            level = float(np.mean(noise))
+            rate = 0.5 if level < self.noise_floor else self.noise_adapt_rate
+            self.noise_floor = max((1 - rate) * self.noise_floor + rate * level, 1e-4)
+
+        return is_speech
+
+    def process(self, chunk):
+        """Feed a float32 chunk and return the detector state after it
+
+        Every SPEECH_END follows a SPEECH_START: when a chunk holds both the
+        onset and the end of an utterance, SPEECH_START is returned for it
+        and SPEECH_END for the next chunk, which is analyzed on the call
+        after that.
+
+        Returns:
+            One of SILENCE, SPEECH_START, SPEECH or SPEECH_END
+        """
+        if self._pending_end:
+            self._pending_end = False
+            self._remainder = np.concatenate((self._remainder, chunk))
+            return self.SPEECH_END
+
+        audio = np.concatenate((self._remainder, chunk)) if len(self._remainder) else chunk
+        decisions = self.frame_decisions(audio)
+        self._remainder = audio[len(decisions) * self.frame_size:]
+
+        started = False
+        for is_speech in decisions:
+            if is_speech:
+                self.speech_run += 1
+                self.silence_run = 0
+            else:
+                self.speech_run = 0
+                self.silence_run += 1
+
+            if not self.in_speech and self.speech_run >= self.min_speech_frames:
+                self.in_speech = True
+                started = True
+            elif self.in_speech and self.silence_run >= self.end_of_speech_frames:
+                self.in_speech = False
+                if started:
+                    self._pending_end = True
+                    return self.SPEECH_START
+                return self.SPEECH_END
+
+        if started:
+            return self.SPEECH_START
+        return self.SPEECH if self.in_speech else self.SILENCE
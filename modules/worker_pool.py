@@ -0,0 +1,236 @@
+import os
+import time
+import queue
+import itertools
+import threading
+import logging
+import multiprocessing as mp
+from concurrent.futures import Future
+
+
+# Job kinds
+ASR = "asr"
+TTS = "tts"
+INFO = "info"
+
+
+def _collect_batch(job_queue, first_job, max_batch_size, max_wait):
+    """Gather jobs that arrive within max_wait of the first one, up to max_batch_size"""
+    batch = [first_job]
+    deadline = time.monotonic() + max_wait
+    while len(batch) < max_batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            job = job_queue.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if job is None:
+            # Put the shutdown marker back so it is seen after this batch
+            job_queue.put(None)
+            break
+        batch.append(job)
+    return batch
+
+
+def _run_batch(batch, recognizer, synthesizer):
+    """Run one batch of jobs and return (job_id, result, error) tuples
+
+    ASR jobs go through the model as one batch per sample rate. TTS jobs are
+    batched only if the synthesizer has synthesize_batch(): the ESPnet TTS
+    models decode autoregressively, one utterance at a time, so for them
+    the jobs are synthesized one after another (identical texts once).
+    """
+    results = []
+
+    # Group transcriptions by sample rate so each group goes through the model as one batch
+    asr_groups = {}
+    for job in batch:
+        if job[1] == ASR:
+            asr_groups.setdefault(job[2][1], []).append(job)
+
+    for sample_rate, jobs in asr_groups.items():
+        audios = [job[2][0] for job in jobs]
+        try:
+            if hasattr(recognizer, "transcribe_batch"):
+                outputs = recognizer.transcribe_batch(audios, sample_rate=sample_rate)
+            else:
+                outputs = [recognizer.transcribe(audio, sample_rate=sample_rate) for audio in audios]
+            results.extend((job[0], output, None) for job, output in zip(jobs, outputs))
+        except Exception as e:
+            results.extend((job[0], None, repr(e)) for job in jobs)
+
+    tts_jobs = [job for job in batch if job[1] == TTS]
+    if tts_jobs and hasattr(synthesizer, "synthesize_batch"):
+        try:
+            outputs = synthesizer.synthesize_batch([job[2] for job in tts_jobs])
+            results.extend((job[0], output, None) for job, output in zip(tts_jobs, outputs))
+        except Exception as e:
+            results.extend((job[0], None, repr(e)) for job in tts_jobs)
+    else:
+        # Many sessions speak the same phrases; each text is synthesized once per batch
+        waveforms = {}
+        for job_id, _, text in tts_jobs:
+            try:
+                if text not in waveforms:
+                    waveforms[text] = synthesizer.synthesize(text)
+                results.append((job_id, waveforms[text], None))
+            except Exception as e:
+                results.append((job_id, None, repr(e)))
+
+    for job_id, kind, payload in batch:
+        try:
+            if kind == INFO:
+                results.append((job_id, {
+                    "pid": os.getpid(),
+                    "tts_sample_rate": synthesizer.get_sample_rate() if synthesizer is not None else None,
+                }, None))
+        except Exception as e:
+            results.append((job_id, None, repr(e)))
+
+    return results
+
+
+def _worker_main(job_queue, result_queue, recognizer, synthesizer, asr_factory, tts_factory,
+                 max_batch_size, max_wait, num_threads):
+    """Worker process loop: take jobs, batch them dynamically, post results"""
+    if num_threads:
+        try:
+            import torch
+            torch.set_num_threads(num_threads)
+        except ImportError:
+            pass
+
+    # Models are inherited from the parent when forked; load them otherwise
+    if recognizer is None and asr_factory is not None:
+        recognizer = asr_factory()
+    if synthesizer is None and tts_factory is not None:
+        synthesizer = tts_factory()
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        batch = _collect_batch(job_queue, job, max_batch_size, max_wait)
+        for result in _run_batch(batch, recognizer, synthesizer):
+            result_queue.put(result)
+
+
+class ModelWorkerPool:
+    def __init__(self, asr_factory=None, tts_factory=None, num_workers=2, max_batch_size=8,
+                 max_wait_ms=20, threads_per_worker=None, start_method=None):
+        """Pool of worker processes serving ASR and TTS jobs for many sessions
+
+        The models are loaded once in the parent and the workers are forked
+        afterwards, so the weights are shared copy-on-write between them
+        instead of being loaded N times (with the "spawn" start method each
+        worker loads its own copy). Jobs go over a local multiprocessing
+        queue; a worker that picks up a job waits up to max_wait_ms for
+        more, and runs the ASR jobs it collected through the model as one
+        batch. TTS jobs are batched only by synthesizers with
+        synthesize_batch(); others synthesize them one at a time.
+
+        Args:
+            asr_factory: Callable returning a SpeechRecognizer (or stub)
+            tts_factory: Callable returning a SpeechSynthesizer (or stub)
+            num_workers: Number of worker processes
+            max_batch_size: Maximum jobs a worker handles at once
+            max_wait_ms: How long a worker waits to fill a batch
+            threads_per_worker: Torch intra-op threads per worker (None to leave as is)
+            start_method: multiprocessing start method (defaults to "fork" where available)
+        """
+        if start_method is None:
+            start_method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        context = mp.get_context(start_method)
+
+        recognizer = synthesizer = None
+        if start_method == "fork":
+            recognizer = asr_factory() if asr_factory is not None else None
+            synthesizer = tts_factory() if tts_factory is not None else None
+
+        self.job_queue = context.Queue()
+        self.result_queue = context.Queue()
+        self._futures = {}
+        self._futures_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._tts_sample_rate = synthesizer.get_sample_rate() if synthesizer is not None else None
+
+        self.workers = []
+        for i in range(num_workers):
+            worker = context.Process(
+                target=_worker_main,
+                args=(self.job_queue, self.result_queue, recognizer, synthesizer, asr_factory, tts_factory,
+                      max_batch_size, max_wait_ms / 1000.0, threads_per_worker),
+                name=f"model-worker-{i}",
+                daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+        self._collector = threading.Thread(target=self._collect_results, name="model-pool-results", daemon=True)
+        self._collector.start()
+        logging.info(f"Started model worker pool with {num_workers} {start_method}ed workers")
+
+    def _submit(self, kind, payload):
+        future = Future()
+        job_id = next(self._ids)
+        with self._futures_lock:
+            self._futures[job_id] = future
+        self.job_queue.put((job_id, kind, payload))
+        return future
+
+    def _collect_results(self):
+        """Resolve futures as results come back from the workers"""
+        while True:
+            item = self.result_queue.get()
+            if item is None:
+                break
+            job_id, result, error = item
+            with self._futures_lock:
+                future = self._futures.pop(job_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(f"Worker job failed: {error}"))
+            else:
+                future.set_result(result)
+
+    def submit_transcription(self, audio, sample_rate=16000):
+        """Queue audio for transcription; returns a Future of the result dict"""
+        return self._submit(ASR, (audio, sample_rate))
+
+    def submit_synthesis(self, text):
+        """Queue text for synthesis; returns a Future of the waveform"""
+        return self._submit(TTS, text)
+
+    def transcribe(self, audio, sample_rate=16000):
+        """Blocking transcription through the pool (SpeechRecognizer interface)"""
+        return self.submit_transcription(audio, sample_rate).result()
+
+    def synthesize(self, text):
+        """Blocking synthesis through the pool (SpeechSynthesizer interface)"""
+        return self.submit_synthesis(text).result()
+
+    def get_sample_rate(self):
+        """Sample rate of the synthesized audio"""
+        if self._tts_sample_rate is None:
+            self._tts_sample_rate = self._submit(INFO, None).result()["tts_sample_rate"]
+        return self._tts_sample_rate
+
+    def shutdown(self, timeout=5.0):
+        """Stop the workers after the queued jobs are done"""
+        for _ in self.workers:
+            self.job_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self.result_queue.put(None)
+        self._collector.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""Asyncio WebSocket server for many concurrent voice sessions
+
+Protocol (one WebSocket connection per session):
+    client -> server  binary: 16-bit little-endian mono PCM at the input rate
+    client -> server  text:   {"type": "end_of_utterance"}  force the endpoint
+                              {"type": "text", "text": ...}  send a typed turn
+                              {"type": "reset"}             clear the history
+                              {"type": "resume", "session_id": ...}  continue a saved session
+    server -> client  text:   {"type": "ready", ...}, {"type": "transcript", ...},
+                              {"type": "response_text", ...}, {"type": "response_end", ...},
+                              {"type": "interrupted"}, {"type": "error", ...}
+    server -> client  binary: 16-bit PCM of the spoken response at the output rate
+
+Speech that starts while a response is still being sent cancels it
+(barge-in) and the server sends {"type": "interrupted"}; the client should
+then drop the response audio it has buffered. Clients are expected to
+remove the echo of the response from their microphone signal (e.g. the
+browser's echoCancellation constraint).
+
+The "ready" message carries a new session id. With a session store
+(SESSION_STORE_BACKEND), every turn is saved under it, and a client that
+reconnects, to this or any other server sharing the store, sends "resume"
+with that id to continue the conversation.
+
+    python server.py --port 8765 --workers 2
+"""
+import sys
+import json
+import uuid
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import websockets
+
+import config
+from modules.dialouge import DialogueManager
+from modules.llm_backends import ChatModelBackend, LocalBackend, create_backend
+from modules.llm_policy import CircuitBreaker, ResilientBackend
+from modules.session_store import open_session_store
+from modules.stub_llm import StubModel
+from modules.vad import VoiceActivityDetector
+from utils.resample import resample
+from utils.text_utils import SentenceSegmenter
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+# Samples per binary audio message sent to the client
+OUTPUT_FRAME_SIZE = 4096
+
+
+class Session:
+    def __init__(self, session_id, dialogue, sample_rate, end_of_speech_ms, pre_roll_ms):
+        """State of one connected client"""
+        self.session_id = session_id
+        self.dialogue = dialogue
+        self.vad = VoiceActivityDetector(sample_rate=sample_rate, end_of_speech_ms=end_of_speech_ms,
+                                         pre_roll_ms=pre_roll_ms)
+        self.chunks = []
+        self.pre_roll = []
+        self.pre_roll_samples = 0
+        self.in_speech = False
+        self.turn_task = None
+
+    def add_audio(self, chunk):
+        """Add a chunk of input audio
+
+        Returns:
+            The complete utterance when the end of speech was detected, else None
+        """
+        state = self.vad.process(chunk)
+        if state == VoiceActivityDetector.SPEECH_START:
+            self.in_speech = True
+            self.chunks = self.pre_roll
+            self.pre_roll = []
+            self.pre_roll_samples = 0
+
+        if self.in_speech:
+            self.chunks.append(chunk)
+            if state == VoiceActivityDetector.SPEECH_END:
+                return self.take_utterance()
+        else:
+            # Keep a bounded pre-roll from before the speech onset
+            self.pre_roll.append(chunk)
+            self.pre_roll_samples += len(chunk)
+            while self.pre_roll and self.pre_roll_samples - len(self.pre_roll[0]) >= self.vad.pre_roll_samples:
+                self.pre_roll_samples -= len(self.pre_roll.pop(0))
+        return None
+
+    def take_utterance(self):
+        """Return the buffered utterance and start listening for the next one"""
+        audio = np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=np.float32)
+        self.chunks = []
+        self.in_speech = False
+        self.vad.reset()
+        return audio
+
+
+class VoiceServer:
+    def __init__(self, recognizer, synthesizer, dialogue_factory, input_sample_rate=16000,
+                 output_sample_rate=16000, end_of_speech_ms=700, pre_roll_ms=300, max_queue_size=4):
+        """Serve voice sessions over WebSocket
+
+        ASR and TTS run off the event loop, either in a worker pool (if the
+        recognizer/synthesizer is a ModelWorkerPool) or in one executor
+        thread per model, shared by all sessions. Each session gets its own
+        DialogueManager from dialogue_factory.
+
+        Args:
+            recognizer: SpeechRecognizer, ModelWorkerPool or compatible stub
+            synthesizer: SpeechSynthesizer, ModelWorkerPool or compatible stub
+            dialogue_factory: Callable taking a session id and returning a
+                DialogueManager for it (which resumes the session if it is saved)
+            input_sample_rate: Rate of the PCM audio sent by clients
+            output_sample_rate: Rate of the PCM audio sent to clients
+            end_of_speech_ms: Silence that ends an utterance
+            pre_roll_ms: Audio kept from before the speech onset
+            max_queue_size: Sentences buffered between the LLM and TTS per turn
+        """
+        self.recognizer = recognizer
+        self.synthesizer = synthesizer
+        self.dialogue_factory = dialogue_factory
+        self.input_sample_rate = input_sample_rate
+        self.output_sample_rate = output_sample_rate
+        self.end_of_speech_ms = end_of_speech_ms
+        self.pre_roll_ms = pre_roll_ms
+        self.max_queue_size = max_queue_size
+
+        # Models are not safe to call from several threads at once
+        self.asr_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="server-asr")
+        self.tts_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="server-tts")
+
+    async def transcribe(self, audio):
+        if hasattr(self.recognizer, "submit_transcription"):
+            future = self.recognizer.submit_transcription(audio, self.input_sample_rate)
+            return await asyncio.wrap_future(future)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.asr_executor, self.recognizer.transcribe, audio,
+                                          self.input_sample_rate)
+
+    async def synthesize(self, text):
+        if hasattr(self.synthesizer, "submit_synthesis"):
+            wav = await asyncio.wrap_future(self.synthesizer.submit_synthesis(text))
+        else:
+            loop = asyncio.get_running_loop()
+            wav = await loop.run_in_executor(self.tts_executor, self.synthesizer.synthesize, text)
+        return resample(wav, self.synthesizer.get_sample_rate(), self.output_sample_rate)
+
+    async def handle(self, websocket, path=None):
+        """Serve one client connection"""
+        session_id = uuid.uuid4().hex
+        session = Session(session_id, self.dialogue_factory(session_id), self.input_sample_rate,
+                          self.end_of_speech_ms, self.pre_roll_ms)
+        logging.info(f"Session {session.session_id} connected")
+
+        await websocket.send(json.dumps({
+            "type": "ready",
+            "session_id": session.session_id,
+            "input_sample_rate": self.input_sample_rate,
+            "output_sample_rate": self.output_sample_rate,
+        }))
+
+        try:
+            async for message in websocket:
+                if isinstance(message, bytes):
+                    chunk = np.frombuffer(message, dtype="<i2").astype(np.float32) / 32767.0
+                    was_speaking = session.in_speech
+                    audio = session.add_audio(chunk)
+                    if session.in_speech and not was_speaking \
+                            and session.turn_task is not None and not session.turn_task.done():
+                        # The user started talking over the response
+                        session.turn_task.cancel()
+                        await websocket.send(json.dumps({"type": "interrupted"}))
+                    if audio is not None:
+                        self.start_turn(websocket, session, audio=audio)
+                    continue
+
+                try:
+                    control = json.loads(message)
+                except ValueError:
+                    await websocket.send(json.dumps({"type": "error", "message": "Invalid JSON"}))
+                    continue
+
+                kind = control.get("type")
+                if kind == "end_of_utterance":
+                    audio = session.take_utterance()
+                    if len(audio):
+                        self.start_turn(websocket, session, audio=audio)
+                elif kind == "text":
+                    self.start_turn(websocket, session, text=control.get("text", ""))
+                elif kind == "reset":
+                    # Deletes the saved session and waits for a summary in
+                    # progress, so it runs off the event loop
+                    await asyncio.get_running_loop().run_in_executor(None, session.dialogue.reset)
+                elif kind == "resume":
+                    session_id = control.get("session_id")
+                    if not isinstance(session_id, str) or not session_id:
+                        await websocket.send(json.dumps({"type": "error", "message": "Missing session_id"}))
+                        continue
+                    if session.turn_task is not None:
+                        session.turn_task.cancel()
+                    # The saved history is loaded on the first turn, off the event loop
+                    session.session_id = session_id
+                    session.dialogue = self.dialogue_factory(session_id)
+                    logging.info(f"Session {session_id} resumed")
+                else:
+                    await websocket.send(json.dumps({"type": "error", "message": f"Unknown type: {kind}"}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if session.turn_task is not None:
+                session.turn_task.cancel()
+                await asyncio.gather(session.turn_task, return_exceptions=True)
+            logging.info(f"Session {session.session_id} disconnected")
+
+    def start_turn(self, websocket, session, audio=None, text=None):
+        """Run a turn in the background so the session keeps receiving audio
+
+        A new turn supersedes one that is still running.
+        """
+        if session.turn_task is not None and not session.turn_task.done():
+            session.turn_task.cancel()
+        session.turn_task = asyncio.ensure_future(self.run_turn(websocket, session, audio, text))
+
+    async def run_turn(self, websocket, session, audio=None, text=None):
+        """Transcribe, then stream the response text and audio back to the client"""
+        try:
+            if audio is not None:
+                result = await self.transcribe(audio)
+                text = result["text"].strip()
+                await websocket.send(json.dumps({"type": "transcript", "text": text}))
+            if not text:
+                return
+
+            # LLM deltas -> sentences -> synthesized audio, overlapped through a bounded queue
+            sentences = asyncio.Queue(maxsize=self.max_queue_size)
+            producer = asyncio.ensure_future(self._produce_sentences(session, text, sentences))
+            try:
+                while True:
+                    sentence = await sentences.get()
+                    if sentence is None:
+                        break
+                    await websocket.send(json.dumps({"type": "response_text", "text": sentence}))
+                    wav = await self.synthesize(sentence)
+                    pcm = (np.clip(wav, -1.0, 1.0) * 32767.0).astype("<i2")
+                    for start in range(0, len(pcm), OUTPUT_FRAME_SIZE):
+                        await websocket.send(pcm[start:start + OUTPUT_FRAME_SIZE].tobytes())
+                response_text = await producer
+            finally:
+                producer.cancel()
+                # Wait for it to wind down, so no task outlives the turn
+                await asyncio.gather(producer, return_exceptions=True)
+
+            await websocket.send(json.dumps({"type": "response_end", "text": response_text}))
+        except asyncio.CancelledError:
+            raise
+        except websockets.ConnectionClosed:
+            pass
+        except Exception as e:
+            logging.error(f"Session {session.session_id} turn error: {e}")
+            try:
+                await websocket.send(json.dumps({"type": "error", "message": str(e)}))
+            except websockets.ConnectionClosed:
+                pass
+
+    async def _produce_sentences(self, session, text, sentences):
+        """Stream the LLM response into the sentence queue; returns the full text"""
+        segmenter = SentenceSegmenter()
+        parts = []
+        try:
+            async for delta in session.dialogue.astream_response(text):
+                parts.append(delta)
+                for sentence in segmenter.push(delta):
+                    await sentences.put(sentence)
+            for sentence in segmenter.flush():
+                await sentences.put(sentence)
+        except asyncio.CancelledError:
+            # The turn is over and nothing reads the queue any more, which
+            # may be full: waiting to put the end marker would never return
+            raise
+        except Exception:
+            await sentences.put(None)
+            raise
+        await sentences.put(None)
+        return "".join(parts).strip()
+
+    async def serve(self, host, port):
+        """Serve until cancelled"""
+        async with websockets.serve(self.handle, host, port, max_size=2 ** 22):
+            logging.info(f"Voice server listening on ws://{host}:{port}")
+            await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket voice assistant server")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="ASR/TTS worker processes (0 to run the models in this process)")
+    parser.add_argument("--stub-llm", action="store_true", help="Answer with a local stub instead of Gemini")
+    parser.add_argument("--local-llm", action="store_true",
+                        help="Answer with the scripted offline responder instead of Gemini")
+    args = parser.parse_args()
+
+    if args.workers > 0:
+        from functools import partial
+        from modules.asr import SpeechRecognizer
+        from modules.tts import SpeechSynthesizer
+        from modules.worker_pool import ModelWorkerPool
+        pool = ModelWorkerPool(partial(SpeechRecognizer, config.ASR_MODEL, quantize=config.ASR_QUANTIZE,
+                                       beam_size=config.ASR_BEAM_SIZE),
+                               partial(SpeechSynthesizer, config.TTS_MODEL, quantize=config.TTS_QUANTIZE),
+                               num_workers=args.workers, threads_per_worker=config.TORCH_NUM_THREADS)
+        recognizer = synthesizer = pool
+    else:
+        from modules.asr import SpeechRecognizer
+        from modules.model_loader import configure_threads
+        from modules.tts import SpeechSynthesizer
+        if config.TORCH_NUM_THREADS or config.TORCH_INTEROP_THREADS:
+            configure_threads(config.TORCH_NUM_THREADS, config.TORCH_INTEROP_THREADS)
+        recognizer = SpeechRecognizer(config.ASR_MODEL, quantize=config.ASR_QUANTIZE, beam_size=config.ASR_BEAM_SIZE)
+        synthesizer = SpeechSynthesizer(config.TTS_MODEL, quantize=config.TTS_QUANTIZE)
+
+    session_store = None
+    if config.SESSION_STORE_BACKEND:
+        session_store = open_session_store(config.SESSION_STORE_BACKEND, config.SESSION_STORE_DIR,
+                                           cache_size=config.SESSION_CACHE_SIZE)
+
+    # One backend serves every session, so all of them share its connection pool
+    if args.stub_llm:
+        backend = ChatModelBackend(StubModel())
+    elif args.local_llm:
+        backend = LocalBackend()
+    else:
+        backend = create_backend(config.LLM_BACKEND, config.GEMINI_API_KEY, config.MODEL_NAME, config.SYSTEM_PROMPT,
+                                 pool_size=config.LLM_POOL_SIZE)
+
+    # Retries, hedges and the circuit breaker also work across sessions:
+    # an API outage seen by one session makes the others fail fast
+    backend = ResilientBackend(backend, timeout=config.LLM_TIMEOUT, deadline=config.LLM_DEADLINE,
+                               max_retries=config.LLM_MAX_RETRIES, hedge=config.LLM_HEDGE,
+                               breaker=CircuitBreaker(config.LLM_BREAKER_FAILURES, config.LLM_BREAKER_RESET))
+    fallback = LocalBackend() if config.LLM_FALLBACK_LOCAL else None
+
+    def dialogue_factory(session_id):
+        return DialogueManager(config.GEMINI_API_KEY, config.MODEL_NAME, config.SYSTEM_PROMPT,
+                               backend=backend, fallback=fallback,
+                               max_context_tokens=config.CONTEXT_TOKEN_BUDGET,
+                               summary_tokens=config.SUMMARY_TOKEN_BUDGET,
+                               session_store=session_store, session_id=session_id)
+
+    server = VoiceServer(recognizer, synthesizer, dialogue_factory,
+                         input_sample_rate=config.SAMPLE_RATE,
+                         output_sample_rate=config.SAMPLE_RATE,
+                         end_of_speech_ms=config.VAD_END_OF_SPEECH_MS,
+                         pre_roll_ms=config.VAD_PRE_ROLL_MS)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 
 import os
 import time
-import google.generativeai as genai
+import uuid
 import pyttsx3
 
+import config
+from modules.conversation_log import ConversationLog
+from modules.dialouge import DialogueManager
+from modules.llm_backends import LocalBackend
+
 
 def main():
     # Check for API key
@@ -12,9 +17,13 @@ def main():
         print("Please set the GEMINI_API_KEY environment variable and try again.")
         return
 
-    # Initialize Gemini
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.0-flash")
+    # The system prompt is sent as a system instruction with every request
+    # instead of as an extra first message; with LLM_BACKEND = "local" the
+    # assistant answers offline instead of calling Gemini
+    dialogue = DialogueManager(
+        api_key, "gemini-2.0-flash",
+        "You are a helpful, intelligent assistant. Be concise, friendly, and helpful in your responses.",
+        backend=LocalBackend() if config.LLM_BACKEND == "local" else None)
 
     # Initialize speech synthesizer
     engine = pyttsx3.init()
@@ -22,8 +31,9 @@ def main():
     print("\n==== Text-Based Conversational AI System ====")
     print("Type your messages. Type 'exit' to quit.")
 
-    # Conversation history for context
-    conversation_history = []
+    # Turns are written to the log by a background thread
+    conversation_log = ConversationLog(config.CONVERSATION_LOG_DIR, max_file_bytes=config.CONVERSATION_LOG_MAX_BYTES)
+    session_id = uuid.uuid4().hex
 
     try:
         while True:
@@ -33,37 +43,11 @@ def main():
             if user_text.lower() == 'exit':
                 break
 
-            # Add to conversation history
-            conversation_history.append({"role": "user", "parts": [user_text]})
-
             # Generate AI response
             print("Thinking...")
-
-            if len(conversation_history) == 1:
-                # First message, create a new chat
-                chat = model.start_chat(history=[])
-                # Set system prompt
-                chat.send_message(
-                    "You are a helpful, intelligent assistant. Be concise, friendly, and helpful in your responses.")
-            else:
-                # Format history for Gemini
-                formatted_history = []
-                for entry in conversation_history[:-1]:  # Exclude the current user message
-                    formatted_history.append({
-                        "role": entry["role"],
-                        "parts": [entry["parts"][0]]
-                    })
-                chat = model.start_chat(history=formatted_history)
-
-            response = chat.send_message(user_text)
-            ai_text = response.text
-
-            # Add AI response to history
-            conversation_history.append({"role": "model", "parts": [ai_text]})
-
-            # Keep history manageable
-            if len(conversation_history) > 20:
-                conversation_history = conversation_history[-20:]
+            request_start = time.perf_counter()
+            ai_text = dialogue.get_response(user_text)
+            latencies = {"done": time.perf_counter() - request_start}
 
             print(f"\n> AI: {ai_text}")
 
@@ -72,16 +56,15 @@ def main():
             engine.say(ai_text)
             engine.runAndWait()
 
-            # Optional: Save the conversation
-            with open("conversation_log.txt", "a") as f:
-                f.write(f"User: {user_text}\n")
-                f.write(f"AI: {ai_text}\n\n")
+            # Save the conversation
+            conversation_log.log_turn(session_id, user_text, ai_text, latencies=latencies)
 
     except KeyboardInterrupt:
         print("\nConversation ended by user.")
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
+        conversation_log.close()
         print("Thank you for using the conversational AI system.")
 
 
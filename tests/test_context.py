@@ -0,0 +1,47 @@
+import threading
+
+from modules.context import ContextWindow
+
+
+def roles(history):
+    return [entry["role"] for entry in history]
+
+
+def alternates(history):
+    return all(a != b for a, b in zip(roles(history), roles(history)[1:]))
+
+
+def test_summary_keeps_turns_alternating_after_a_greeting():
+    context = ContextWindow(max_tokens=50, summary_tokens=64)
+    context.add("model", "Hi there! I'm Alex, your assistant.")
+    for i in range(20):
+        context.add("user", f"question number {i} about something rather long")
+        context.add("model", f"answer number {i} with quite a few words in it")
+    context.wait()
+
+    history = context.history()
+    assert context.summary and history[0]["parts"][0].startswith("Summary of our conversation")
+    assert alternates(history)
+    assert context.summarized + len(context.messages) == 41
+
+
+def test_summary_is_not_acknowledged_before_a_model_turn():
+    context = ContextWindow()
+    context.restore([{"role": "model", "parts": ["Hello!"]}, {"role": "user", "parts": ["Hi"]}],
+                    summary="User asked about the weather.", summarized=2)
+
+    assert roles(context.history()) == ["user", "model", "user"]
+    assert context.history()[1]["parts"] == ["Hello!"]
+
+
+def test_windows_share_the_summary_threads():
+    windows = [ContextWindow(max_tokens=20) for _ in range(20)]
+    for window in windows:
+        for i in range(4):
+            window.add("user", f"message {i} that is long enough to be evicted")
+            window.add("model", f"reply {i} that is long enough to be evicted")
+    for window in windows:
+        window.wait()
+
+    assert all(window.summary for window in windows)
+    assert len([t for t in threading.enumerate() if t.name.startswith("context-summary")]) <= 4
@@ -0,0 +1,110 @@
+import time
+import asyncio
+
+import pytest
+
+from modules.dialouge import DialogueManager
+from modules.llm_backends import DialogueBackend
+from modules.response_cache import ResponseCache
+from modules.stub_llm import StubModel
+
+
+RESPONSE = "Hello there. How can I help?"
+
+
+class SlowSessionStore:
+    def __init__(self, delay=0.2):
+        """Session store whose disk access takes delay seconds"""
+        self.delay = delay
+        self.appended = []
+
+    def load(self, session_id):
+        time.sleep(self.delay)
+        return None
+
+    def append(self, session_id, messages):
+        time.sleep(self.delay)
+        self.appended.extend(messages)
+
+    def set_summary(self, session_id, summary, summarized):
+        time.sleep(self.delay)
+
+    def delete(self, session_id):
+        time.sleep(self.delay)
+
+
+def make_dialogue(store, chunk_delay=0.0):
+    return DialogueManager(None, model=StubModel([RESPONSE], chunk_delay=chunk_delay), cache=ResponseCache(),
+                           session_store=store, session_id="session")
+
+
+async def longest_stall(coroutine):
+    """Run coroutine and return the longest time the event loop was blocked meanwhile"""
+    gaps = []
+    done = asyncio.Event()
+
+    async def tick():
+        last = time.monotonic()
+        while not done.is_set():
+            await asyncio.sleep(0.01)
+            now = time.monotonic()
+            gaps.append(now - last)
+            last = now
+
+    ticker = asyncio.create_task(tick())
+    try:
+        await coroutine
+    finally:
+        done.set()
+        await ticker
+    return max(gaps)
+
+
+async def collect(dialogue, text):
+    return "".join([delta async for delta in dialogue.astream_response(text)])
+
+
+def test_finished_and_cached_turns_are_saved_off_the_event_loop():
+    store = SlowSessionStore()
+    dialogue = make_dialogue(store)
+
+    async def turns():
+        assert await collect(dialogue, "hello") == RESPONSE
+        # The same question after a reset of the history is answered from the cache
+        dialogue.context.clear()
+        assert await collect(dialogue, "hello") == RESPONSE
+
+    assert asyncio.run(longest_stall(turns())) < 0.1
+    assert store.appended == [("user", "hello"), ("model", RESPONSE)] * 2
+    assert dialogue.cache.stats()["hits"] == 1
+
+
+def test_cancelled_turn_keeps_the_partial_reply_off_the_event_loop():
+    store = SlowSessionStore()
+    dialogue = make_dialogue(store, chunk_delay=0.05)
+
+    async def cancelled_turn():
+        started = asyncio.Event()
+
+        async def consume():
+            async for _ in dialogue.astream_response("hello"):
+                started.set()
+
+        task = asyncio.create_task(consume())
+        await started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert asyncio.run(longest_stall(cancelled_turn())) < 0.1
+    assert len(store.appended) == 2
+    role, partial = store.appended[1]
+    assert role == "model" and partial and RESPONSE.startswith(partial)
+
+
+def test_backend_without_stream_fails_when_created():
+    class IncompleteBackend(DialogueBackend):
+        def generate(self, history, message):
+            return RESPONSE
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
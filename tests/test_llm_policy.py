@@ -0,0 +1,130 @@
+import time
+import random
+
+import pytest
+
+from modules.llm_backends import BackendError, ChatModelBackend
+from modules.llm_policy import CircuitBreaker, ResilientBackend
+from modules.stub_llm import FaultInjectingBackend, StubModel
+
+
+RESPONSE = "Hello there. How can I help?"
+
+
+def seed_with(*checks):
+    """Seed of a FaultInjectingBackend whose successive draws pass the given checks"""
+    for seed in range(10000):
+        rng = random.Random(seed)
+        if all(check(rng.random()) for check in checks):
+            return seed
+    raise AssertionError("No seed found")
+
+
+def make_backend(error_rate=0.0, stall_rate=0.0, stall_time=1.0, seed=None, **policy):
+    fault = FaultInjectingBackend(ChatModelBackend(StubModel([RESPONSE], first_chunk_delay=0.01)),
+                                  error_rate=error_rate, stall_rate=stall_rate, stall_time=stall_time,
+                                  seed=seed)
+    policy.setdefault("retry_base_delay", 0.01)
+    policy.setdefault("hedge", False)
+    return fault, ResilientBackend(fault, **policy)
+
+
+def test_transient_error_is_retried():
+    fault, backend = make_backend(error_rate=0.5, seed=seed_with(lambda d: d < 0.5, lambda d: d >= 0.5))
+    try:
+        assert backend.generate([], "hi") == RESPONSE
+        assert (fault.calls, fault.errors) == (2, 1)
+        assert backend.stats()["retries"] == 1
+        assert backend.breaker.state == "closed"
+    finally:
+        backend.close()
+
+
+def test_retries_stop_at_max_retries():
+    fault, backend = make_backend(error_rate=1.0, max_retries=2)
+    try:
+        with pytest.raises(BackendError):
+            backend.generate([], "hi")
+        assert fault.calls == 3
+        assert backend.stats()["retries"] == 2
+    finally:
+        backend.close()
+
+
+def test_stalled_attempt_times_out():
+    fault, backend = make_backend(stall_rate=1.0, stall_time=0.5, timeout=0.1, max_retries=0)
+    try:
+        start = time.monotonic()
+        with pytest.raises(BackendError):
+            backend.generate([], "hi")
+        assert time.monotonic() - start < 0.4
+        assert backend.stats()["timeouts"] == 1
+    finally:
+        backend.close()
+
+
+def test_stalled_request_is_hedged():
+    # Three calls answer normally, then the fourth request stalls and its hedge does not
+    seed = seed_with(*[lambda d: True] * 3, lambda d: d < 0.5, lambda d: d >= 0.5)
+    fault, backend = make_backend(seed=seed, stall_time=1.0, hedge=True, hedge_min_samples=3)
+    try:
+        for _ in range(3):
+            assert backend.generate([], "hi") == RESPONSE
+        assert backend.stats()["hedges"] == 0
+
+        fault.stall_rate = 0.5
+        start = time.monotonic()
+        assert backend.generate([], "hi") == RESPONSE
+        assert time.monotonic() - start < 0.5
+        stats = backend.stats()
+        assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+        assert fault.stalls == 1
+    finally:
+        backend.close()
+
+
+def test_breaker_opens_rejects_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    fault, backend = make_backend(error_rate=1.0, max_retries=1, breaker=breaker)
+    try:
+        # Failures are counted per call, after the retries
+        for _ in range(2):
+            with pytest.raises(BackendError):
+                backend.generate([], "hi")
+        assert fault.calls == 4
+        assert breaker.state == "open"
+
+        # Open: refused without calling the backend
+        with pytest.raises(BackendError) as error:
+            backend.generate([], "hi")
+        assert error.value.transient
+        assert fault.calls == 4
+        assert backend.stats()["rejected"] == 1
+
+        # Half open after the reset timeout: a successful trial closes it
+        time.sleep(0.25)
+        fault.error_rate = 0.0
+        assert backend.generate([], "hi") == RESPONSE
+        assert breaker.state == "closed"
+    finally:
+        backend.close()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    fault, backend = make_backend(error_rate=1.0, max_retries=0, breaker=breaker)
+    try:
+        with pytest.raises(BackendError):
+            backend.generate([], "hi")
+        assert breaker.state == "open"
+
+        time.sleep(0.15)
+        assert breaker.allow()
+        assert breaker.state == "half_open"
+        # Only one trial call while half open
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+    finally:
+        backend.close()
@@ -0,0 +1,219 @@
+import time
+import threading
+
+import numpy as np
+
+from modules.dialouge import DialogueManager
+from modules.pipeline import TurnPipeline
+from modules.stub_llm import StubModel
+from utils.ring_buffer import RingBuffer
+from utils.text_utils import split_sentences
+
+
+SAMPLE_RATE = 16000
+
+LONG_RESPONSE = " ".join(f"This is sentence number {i}." for i in range(1, 13))
+
+
+class StubRecognizer:
+    def __init__(self, text="what is the weather"):
+        self.text = text
+
+    def transcribe(self, audio, sample_rate=16000):
+        return {"text": self.text, "confidence": 1.0}
+
+
+class StubDialogue:
+    def __init__(self, text=LONG_RESPONSE, delay=0.0):
+        """Streams text word by word and records how far the stream got"""
+        self.words = text.split(" ")
+        self.delay = delay
+        self.requests = []
+        self.sent = 0
+        self.closed = threading.Event()
+        self.finished_at = None
+
+    def stream_response(self, user_text):
+        self.requests.append(user_text)
+        try:
+            for i, word in enumerate(self.words):
+                time.sleep(self.delay)
+                self.sent += 1
+                yield word if i == 0 else " " + word
+            self.finished_at = time.monotonic()
+        finally:
+            self.closed.set()
+
+
+class StubSynthesizer:
+    def __init__(self, delay=0.0, fail=False):
+        """Returns audio whose samples hold the index of the synthesized sentence"""
+        self.delay = delay
+        self.fail = fail
+        self.sentences = []
+
+    def synthesize(self, text):
+        if self.fail:
+            raise RuntimeError("Synthesis failed")
+        time.sleep(self.delay)
+        self.sentences.append(text)
+        return np.full(160, len(self.sentences) - 1, dtype=np.float32)
+
+
+class StubAudio:
+    def __init__(self, play_time=0.0):
+        """Audio device that plays instantly (or for play_time seconds) and captures silence"""
+        self.sample_rate = SAMPLE_RATE
+        self.play_time = play_time
+        self.played = []
+        self.played_at = []
+        self.cut = []
+        self.stopped = threading.Event()
+        self.ring = RingBuffer(SAMPLE_RATE)
+
+    def record(self):
+        return np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+    def play(self, audio_data, sample_rate=None):
+        self.played.append(int(audio_data[0]))
+        self.played_at.append(time.monotonic())
+        self.cut.append(self.stopped.wait(self.play_time))
+
+    def start_playback(self):
+        self.stopped.clear()
+
+    def stop_playback(self):
+        self.stopped.set()
+
+    def wait_for_audio(self, read_pos, timeout=0.1):
+        # The microphone delivers a chunk whenever it is polled
+        time.sleep(0.01)
+        self.ring.write(np.zeros(160, dtype=np.float32))
+        return self.ring.written
+
+
+class StubBargeIn:
+    def __init__(self, after_chunks):
+        """Reports the user talking after after_chunks captured chunks during playback"""
+        self.after_chunks = after_chunks
+        self.references = 0
+        self.chunks = 0
+        self.onset_pos = None
+
+    def reset(self):
+        self.chunks = 0
+
+    def add_reference(self, audio, start_pos):
+        self.references += 1
+
+    def clear_reference(self):
+        pass
+
+    def process(self, chunk, chunk_pos):
+        if self.references:
+            self.chunks += 1
+        if self.chunks >= self.after_chunks:
+            self.onset_pos = chunk_pos
+            return True
+        return False
+
+
+def test_turn_plays_every_sentence_in_order():
+    synthesizer = StubSynthesizer(delay=0.005)
+    audio = StubAudio()
+    dialogue = DialogueManager(None, model=StubModel([LONG_RESPONSE], chunk_delay=0.002))
+    pipeline = TurnPipeline(StubRecognizer(), dialogue, synthesizer, audio, max_queue_size=2)
+
+    result = pipeline.run_turn()
+
+    assert result == {"transcript": "what is the weather", "response": LONG_RESPONSE}
+    assert synthesizer.sentences == split_sentences(LONG_RESPONSE)
+    assert audio.played == list(range(len(synthesizer.sentences)))
+    assert dialogue.conversation_history[-1]["parts"][0] == LONG_RESPONSE
+
+
+def test_playback_starts_before_the_response_is_complete():
+    dialogue = StubDialogue(delay=0.01)
+    audio = StubAudio()
+    pipeline = TurnPipeline(StubRecognizer(), dialogue, StubSynthesizer(), audio)
+
+    pipeline.respond("hello")
+
+    assert audio.played_at[0] < dialogue.finished_at
+    assert len(audio.played) == len(split_sentences(LONG_RESPONSE))
+
+
+def test_empty_transcript_gets_no_response():
+    dialogue = StubDialogue()
+    pipeline = TurnPipeline(StubRecognizer(""), dialogue, StubSynthesizer(), StubAudio())
+
+    assert pipeline.run_turn() == {"transcript": "", "response": ""}
+    assert dialogue.requests == []
+
+
+def test_cancel_stops_playback_and_the_llm_stream():
+    dialogue = StubDialogue(delay=0.01)
+    audio = StubAudio(play_time=5.0)
+    pipeline = TurnPipeline(StubRecognizer(), dialogue, StubSynthesizer(), audio)
+
+    timer = threading.Timer(0.2, pipeline.cancel)
+    timer.start()
+    start = time.monotonic()
+    response = pipeline.respond("hello")
+
+    assert time.monotonic() - start < 1.0
+    assert len(audio.played) == 1
+    assert dialogue.closed.wait(1.0)
+    assert dialogue.sent < len(dialogue.words)
+    assert response and response != LONG_RESPONSE
+
+
+def test_cancel_before_a_chunk_is_played_is_not_lost():
+    class CancellingSynthesizer(StubSynthesizer):
+        def synthesize(self, text):
+            audio = super().synthesize(text)
+            if len(self.sentences) == 2:
+                # Stop lands after the first chunk was handed to playback
+                pipeline.audio_handler.stop_playback()
+            return audio
+
+    audio = StubAudio(play_time=0.05)
+    pipeline = TurnPipeline(StubRecognizer(), StubDialogue(), CancellingSynthesizer(), audio)
+    pipeline.respond("hello")
+
+    assert audio.cut and all(audio.cut[1:])
+
+
+def test_stop_from_an_earlier_turn_does_not_cut_the_next_one():
+    audio = StubAudio(play_time=0.01)
+    pipeline = TurnPipeline(StubRecognizer(), StubDialogue(), StubSynthesizer(), audio)
+    audio.stop_playback()
+
+    pipeline.respond("hello")
+
+    assert audio.cut == [False] * len(split_sentences(LONG_RESPONSE))
+
+
+def test_barge_in_cancels_the_response():
+    dialogue = StubDialogue(delay=0.01)
+    audio = StubAudio(play_time=5.0)
+    barge_in = StubBargeIn(after_chunks=3)
+    pipeline = TurnPipeline(StubRecognizer(), dialogue, StubSynthesizer(), audio, barge_in=barge_in)
+
+    start = time.monotonic()
+    pipeline.respond("hello")
+
+    assert time.monotonic() - start < 1.0
+    assert audio.stopped.is_set()
+    assert pipeline.cancelled.is_set()
+    assert pipeline.interrupted_at == barge_in.onset_pos is not None
+    assert dialogue.closed.wait(1.0)
+
+
+def test_synthesis_failure_ends_the_turn():
+    dialogue = StubDialogue()
+    audio = StubAudio()
+    pipeline = TurnPipeline(StubRecognizer(), dialogue, StubSynthesizer(fail=True), audio, max_queue_size=1)
+
+    assert pipeline.respond("hello") == LONG_RESPONSE
+    assert audio.played == []
@@ -0,0 +1,172 @@
+import json
+import time
+import asyncio
+
+import numpy as np
+import websockets
+
+from server import VoiceServer
+from modules.dialouge import DialogueManager
+from modules.stub_llm import StubModel
+
+
+SAMPLE_RATE = 16000
+
+LONG_RESPONSE = " ".join(f"This is sentence number {i}." for i in range(1, 13))
+
+
+class StubRecognizer:
+    def transcribe(self, audio, sample_rate=16000):
+        return {"text": f"heard {len(audio)} samples", "confidence": 1.0}
+
+
+class StubSynthesizer:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def synthesize(self, text):
+        time.sleep(self.delay)
+        return np.full(len(text) * 50, 0.1, dtype=np.float32)
+
+    def get_sample_rate(self):
+        return SAMPLE_RATE
+
+
+def utterance(seed=0):
+    """Noise, one second of a tone, then enough silence to end the utterance, as PCM"""
+    rng = np.random.default_rng(seed)
+    tone = 0.3 * np.sin(2 * np.pi * 440 * np.arange(SAMPLE_RATE) / SAMPLE_RATE)
+    signal = np.concatenate([rng.standard_normal(SAMPLE_RATE // 2) * 0.003, tone,
+                             rng.standard_normal(SAMPLE_RATE) * 0.003])
+    return (signal * 32767).astype("<i2")
+
+
+async def receive_turn(ws):
+    """Messages of one turn, up to its response_end; binary frames are counted"""
+    messages = []
+    audio_bytes = 0
+    while True:
+        message = await asyncio.wait_for(ws.recv(), timeout=10)
+        if isinstance(message, bytes):
+            audio_bytes += len(message)
+            continue
+        message = json.loads(message)
+        messages.append(message)
+        if message["type"] == "response_end":
+            return messages, audio_bytes
+
+
+def sentence_tasks():
+    return [task for task in asyncio.all_tasks() if "_produce_sentences" in repr(task.get_coro())]
+
+
+def run_with_server(server, client):
+    async def main():
+        async with websockets.serve(server.handle, "127.0.0.1", 0) as ws_server:
+            port = list(ws_server.sockets)[0].getsockname()[1]
+            return await client(f"ws://127.0.0.1:{port}")
+    return asyncio.run(main())
+
+
+def make_server(responses, synthesis_delay=0.0, chunk_delay=0.0, max_queue_size=4):
+    return VoiceServer(
+        StubRecognizer(), StubSynthesizer(synthesis_delay),
+        lambda session_id: DialogueManager(None, model=StubModel(responses, chunk_delay=chunk_delay)),
+        input_sample_rate=SAMPLE_RATE, output_sample_rate=SAMPLE_RATE, max_queue_size=max_queue_size
+    )
+
+
+def test_spoken_and_typed_turns():
+    async def client(url):
+        async with websockets.connect(url) as ws:
+            ready = json.loads(await ws.recv())
+            pcm = utterance()
+            for start in range(0, len(pcm), 1024):
+                await ws.send(pcm[start:start + 1024].tobytes())
+            spoken, audio_bytes = await receive_turn(ws)
+
+            await ws.send(json.dumps({"type": "text", "text": "typed"}))
+            typed, _ = await receive_turn(ws)
+            return ready, spoken, audio_bytes, typed
+
+    ready, spoken, audio_bytes, typed = run_with_server(make_server(["Hi there. How can I help?"]), client)
+
+    assert ready["type"] == "ready" and ready["session_id"]
+    assert [m["type"] for m in spoken] == ["transcript", "response_text", "response_text", "response_end"]
+    assert spoken[0]["text"].startswith("heard ")
+    assert [m["text"] for m in spoken[1:3]] == ["Hi there.", "How can I help?"]
+    assert spoken[-1]["text"] == "Hi there. How can I help?"
+    assert audio_bytes > 0
+    assert [m["type"] for m in typed] == ["response_text", "response_text", "response_end"]
+
+
+def test_superseded_turn_leaves_no_tasks():
+    # Slow synthesis with a fast LLM keeps the sentence queue full
+    server = make_server([LONG_RESPONSE, "Second answer."], synthesis_delay=0.05, max_queue_size=2)
+
+    async def client(url):
+        async with websockets.connect(url) as ws:
+            await ws.recv()
+            await ws.send(json.dumps({"type": "text", "text": "first"}))
+            while True:
+                message = await ws.recv()
+                if isinstance(message, str) and json.loads(message)["type"] == "response_text":
+                    break
+            await asyncio.sleep(0.2)
+            # A new turn cancels the one still being sent
+            await ws.send(json.dumps({"type": "text", "text": "second"}))
+            messages, _ = await receive_turn(ws)
+        # Let the server notice the disconnect
+        for _ in range(50):
+            if not sentence_tasks():
+                break
+            await asyncio.sleep(0.02)
+        return messages, sentence_tasks()
+
+    messages, leftover = run_with_server(server, client)
+    assert messages[-1]["text"] == "Second answer."
+    assert leftover == []
+
+
+def test_disconnect_mid_turn_leaves_no_tasks():
+    server = make_server([LONG_RESPONSE], synthesis_delay=0.05, max_queue_size=2)
+
+    async def client(url):
+        async with websockets.connect(url) as ws:
+            await ws.recv()
+            await ws.send(json.dumps({"type": "text", "text": "talk"}))
+            await ws.recv()
+            await asyncio.sleep(0.2)
+        for _ in range(50):
+            if not sentence_tasks():
+                break
+            await asyncio.sleep(0.02)
+        return sentence_tasks()
+
+    assert run_with_server(server, client) == []
+
+
+def test_reset_clears_the_history():
+    server = make_server(["Noted."])
+    dialogues = []
+
+    def factory(session_id):
+        dialogue = DialogueManager(None, model=StubModel(["Noted."]))
+        dialogues.append(dialogue)
+        return dialogue
+    server.dialogue_factory = factory
+
+    async def client(url):
+        async with websockets.connect(url) as ws:
+            await ws.recv()
+            await ws.send(json.dumps({"type": "text", "text": "remember this"}))
+            await receive_turn(ws)
+            history = list(dialogues[0].conversation_history)
+            await ws.send(json.dumps({"type": "reset"}))
+            await ws.send(json.dumps({"type": "text", "text": "again"}))
+            await receive_turn(ws)
+            return history, dialogues[0].conversation_history
+
+    before, after = run_with_server(server, client)
+    assert [m["parts"][0] for m in before] == ["remember this", "Noted."]
+    assert [m["parts"][0] for m in after] == ["again", "Noted."]
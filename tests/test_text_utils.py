@@ -0,0 +1,67 @@
+import pytest
+
+from utils.text_utils import SentenceSegmenter, split_sentences
+
+
+def stream(text, step):
+    """Feed text to a segmenter in deltas of step characters"""
+    segmenter = SentenceSegmenter()
+    chunks = []
+    for i in range(0, len(text), step):
+        chunks.extend(segmenter.push(text[i:i + step]))
+    return chunks + segmenter.flush()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Hello there. How are you?", ["Hello there.", "How are you?"]),
+    ("Who am I? I am your assistant.", ["Who am I?", "I am your assistant."]),
+    ("The answer is no. But ask again later.", ["The answer is no.", "But ask again later."]),
+    ("Neither do I. That is fine.", ["Neither do I.", "That is fine."]),
+    ("Take vitamin C. It helps.", ["Take vitamin C.", "It helps."]),
+    ("Plan B. A fresh start.", ["Plan B.", "A fresh start."]),
+    ("Wow!! Really? Yes.", ["Wow!!", "Really?", "Yes."]),
+    ('He said "stop." Then he left.', ['He said "stop."', "Then he left."]),
+    ("First line\nSecond line", ["First line", "Second line"]),
+])
+def test_sentence_ends(text, expected):
+    assert split_sentences(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Dr. Smith will see you. Please wait.", ["Dr. Smith will see you.", "Please wait."]),
+    ("Bring fruit, bread, etc. and water.", ["Bring fruit, bread, etc. and water."]),
+    ("J. R. R. Tolkien wrote it. Read it.", ["J. R. R. Tolkien wrote it.", "Read it."]),
+    ("Ask J. Smith. He knows.", ["Ask J. Smith.", "He knows."]),
+    ("It was on Oct. 5 this year.", ["It was on Oct. 5 this year."]),
+])
+def test_abbreviations_and_initials(text, expected):
+    assert split_sentences(text) == expected
+
+
+@pytest.mark.parametrize("step", [1, 2, 3, 7])
+def test_streamed_deltas_split_like_the_whole_text(step):
+    text = "Take vitamin C. It helps. Ask J. Smith about Dr. Jones. The answer is no. Who am I? I am here."
+    assert stream(text, step) == split_sentences(text)
+
+
+def test_sentence_waits_for_the_word_after_an_initial():
+    segmenter = SentenceSegmenter()
+    assert segmenter.push("Take vitamin C. ") == []
+    assert segmenter.push("It") == []
+    assert segmenter.push(" helps. ") == ["Take vitamin C.", "It helps."]
+
+
+def test_long_sentence_is_split_at_a_clause_boundary():
+    text = ("This sentence keeps going for quite a while, adding clause after clause; "
+            "it never seems to reach its end, and it goes on and on without a full stop in sight")
+    segmenter = SentenceSegmenter(max_chars=80, min_clause_chars=20)
+    chunks = segmenter.push(text)
+    assert chunks and all(chunk[-1] in ",;" for chunk in chunks)
+    assert " ".join(chunks + segmenter.flush()) == text
+
+
+def test_flush_returns_the_unterminated_rest():
+    segmenter = SentenceSegmenter()
+    assert segmenter.push("Done. And then") == ["Done."]
+    assert segmenter.flush() == ["And then"]
+    assert segmenter.flush() == []
@@ -0,0 +1,36 @@
+import numpy as np
+
+from modules.vad import VoiceActivityDetector
+
+
+SAMPLE_RATE = 16000
+
+
+def utterance(seed=0):
+    """Background noise, half a second of a tone in the speech band, then a second of noise"""
+    rng = np.random.default_rng(seed)
+    tone = 0.3 * np.sin(np.arange(SAMPLE_RATE // 2) * 2 * np.pi * 440 / SAMPLE_RATE)
+    return np.concatenate([
+        rng.standard_normal(SAMPLE_RATE // 2) * 0.003, tone, rng.standard_normal(SAMPLE_RATE) * 0.003,
+    ]).astype(np.float32)
+
+
+def events(vad, audio, chunk_size):
+    states = [vad.process(audio[i:i + chunk_size]) for i in range(0, len(audio), chunk_size)]
+    return [state for state in states if state in (vad.SPEECH_START, vad.SPEECH_END)]
+
+
+def test_small_chunks_start_and_end_once():
+    vad = VoiceActivityDetector(sample_rate=SAMPLE_RATE)
+    assert events(vad, utterance(), 1024) == [vad.SPEECH_START, vad.SPEECH_END]
+
+
+def test_onset_and_end_in_one_chunk_are_reported_in_order():
+    vad = VoiceActivityDetector(sample_rate=SAMPLE_RATE)
+    audio = utterance()
+    vad.frame_decisions(audio[:SAMPLE_RATE // 4])  # Learn the noise floor
+    vad.reset()
+
+    assert vad.process(audio) == vad.SPEECH_START
+    assert vad.process(np.zeros(1024, dtype=np.float32)) == vad.SPEECH_END
+    assert vad.process(np.zeros(1024, dtype=np.float32)) == vad.SILENCE
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+
+from modules.worker_pool import ModelWorkerPool
+
+
+class StubRecognizer:
+    def transcribe_batch(self, audios, sample_rate=16000):
+        return [{"text": f"{len(audio)} samples", "confidence": 1.0, "batch_size": len(audios), "pid": os.getpid()}
+                for audio in audios]
+
+
+class StubSynthesizer:
+    def synthesize(self, text):
+        if text == "fail":
+            raise ValueError("cannot say that")
+        return np.full(len(text), 0.5, dtype=np.float32)
+
+    def get_sample_rate(self):
+        return 22050
+
+
+def make_pool(**kwargs):
+    kwargs.setdefault("num_workers", 1)
+    return ModelWorkerPool(StubRecognizer, StubSynthesizer, start_method="fork", **kwargs)
+
+
+def test_concurrent_jobs_are_batched_and_returned_to_their_callers():
+    with make_pool(max_batch_size=8, max_wait_ms=500) as pool:
+        futures = [pool.submit_transcription(np.zeros(1000 + i, dtype=np.float32)) for i in range(4)]
+        results = [future.result(timeout=10) for future in futures]
+
+    assert [result["text"] for result in results] == [f"{1000 + i} samples" for i in range(4)]
+    assert [result["batch_size"] for result in results] == [4] * 4
+    assert results[0]["pid"] != os.getpid()
+
+
+def test_batch_size_is_capped():
+    with make_pool(max_batch_size=2, max_wait_ms=500) as pool:
+        futures = [pool.submit_transcription(np.zeros(100, dtype=np.float32)) for _ in range(4)]
+        assert [future.result(timeout=10)["batch_size"] for future in futures] == [2] * 4
+
+
+def test_failed_job_gets_the_error_and_the_others_their_results():
+    with make_pool(max_wait_ms=200) as pool:
+        ok = pool.submit_synthesis("hello")
+        failed = pool.submit_synthesis("fail")
+        same = pool.submit_synthesis("hello")
+
+        assert len(ok.result(timeout=10)) == 5
+        with pytest.raises(RuntimeError, match="cannot say that"):
+            failed.result(timeout=10)
+        assert len(same.result(timeout=10)) == 5
+        assert pool.get_sample_rate() == 22050
+
+
+def test_shutdown_finishes_queued_jobs_and_stops_the_workers():
+    pool = make_pool(num_workers=2)
+    futures = [pool.submit_synthesis(f"sentence {i}") for i in range(6)]
+    pool.shutdown()
+
+    assert all(future.done() for future in futures)
+    assert [len(future.result()) for future in futures] == [len(f"sentence {i}") for i in range(6)]
+    assert not any(worker.is_alive() for worker in pool.workers)
+    assert not pool._collector.is_alive()
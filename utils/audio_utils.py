@@ -1,5 +1,7 @@
 import numpy as np
 
+from utils.resample import resample
+
 
 def preprocess_audio(audio, target_sr=16000, input_sr=None):
     """Preprocess audio for ASR"""
@@ -11,7 +13,9 @@ def preprocess_audio(audio, target_sr=16000, input_sr=None):
     if len(audio.shape) > 1:
         audio = audio.mean(axis=1)
 
-    # TODO: Add resampling if input_sr is provided and different from target_sr
+    # Resample if the input rate differs from the target rate
+    if input_sr and input_sr != target_sr:
+        audio = resample(audio, input_sr, target_sr)
 
     # Normalize audio
     if np.abs(audio).max() > 1.0:
@@ -20,44 +24,113 @@ def preprocess_audio(audio, target_sr=16000, input_sr=None):
     return audio
 
 
-def detect_silence(audio, threshold=0.01, window_size=1024):
-    """Detect silence in audio"""
-    # Calculate energy in windows
-    energy = []
-    for i in range(0, len(audio), window_size):
-        window = audio[i:i + window_size]
-        if len(window) == window_size:  # Only process full windows
-            energy.append(np.sqrt(np.mean(window ** 2)))
-
-    # Determine which windows are silent
-    is_silent = [e < threshold for e in energy]
-
-    return is_silent
-
-
-def trim_silence(audio, threshold=0.01, window_size=1024):
+def frame_signal(audio, frame_length, hop_length=None, pad=True):
+    """Split audio into (possibly overlapping) frames without copying
+
+    Args:
+        audio: 1-D array of samples
+        frame_length: Samples per frame
+        hop_length: Samples between frame starts (defaults to frame_length)
+        pad: Whether to zero-pad a trailing partial frame instead of dropping it
+            (padding copies the audio once)
+
+    Returns:
+        Read-only array of shape (n_frames, frame_length); a strided view of
+        audio unless padding was needed
+    """
+    hop_length = hop_length or frame_length
+    audio = np.ascontiguousarray(audio)
+
+    if pad:
+        n_frames = max(0, -(-(len(audio) - frame_length) // hop_length) + 1) if len(audio) else 0
+        padded_length = (n_frames - 1) * hop_length + frame_length if n_frames else 0
+        if padded_length > len(audio):
+            audio = np.concatenate((audio, np.zeros(padded_length - len(audio), dtype=audio.dtype)))
+    else:
+        n_frames = max(0, (len(audio) - frame_length) // hop_length + 1)
+
+    stride = audio.strides[0]
+    return np.lib.stride_tricks.as_strided(
+        audio,
+        shape=(n_frames, frame_length),
+        strides=(hop_length * stride, stride),
+        writeable=False
+    )
+
+
+def frame_lengths(n_samples, n_frames, frame_length, hop_length=None):
+    """Number of real (unpadded) samples in each frame from frame_signal"""
+    hop_length = hop_length or frame_length
+    starts = np.arange(n_frames) * hop_length
+    return np.clip(n_samples - starts, 1, frame_length)
+
+
+def frame_rms(frames, lengths=None):
+    """RMS energy of each frame
+
+    Args:
+        frames: Array of shape (n_frames, frame_length)
+        lengths: Optional number of real samples per frame, so zero-padding
+            does not lower the energy of a trailing partial frame
+    """
+    if len(frames) == 0:
+        return np.zeros(0, dtype=np.float32)
+    power = np.einsum("ij,ij->i", frames, frames, dtype=np.float64)
+    return np.sqrt(power / (frames.shape[1] if lengths is None else lengths)).astype(np.float32)
+
+
+def frame_log_energy(frames, lengths=None, eps=1e-10):
+    """Log energy (dB relative to full scale) of each frame"""
+    return 20.0 * np.log10(np.maximum(frame_rms(frames, lengths), eps))
+
+
+def frame_zero_crossing_rate(frames):
+    """Fraction of adjacent sample pairs in each frame that change sign"""
+    if len(frames) == 0:
+        return np.zeros(0, dtype=np.float32)
+    signs = np.signbit(frames)
+    return np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+
+
+def frame_features(audio, frame_length=1024, hop_length=None):
+    """Per-frame RMS, log energy and zero-crossing rate of audio
+
+    Returns:
+        Dictionary of 1-D arrays with one entry per frame
+    """
+    frames = frame_signal(audio, frame_length, hop_length)
+    lengths = frame_lengths(len(audio), len(frames), frame_length, hop_length)
+    rms = frame_rms(frames, lengths)
+    return {
+        "rms": rms,
+        "log_energy": 20.0 * np.log10(np.maximum(rms, 1e-10)),
+        "zcr": frame_zero_crossing_rate(frames),
+    }
+
+
+def detect_silence(audio, threshold=0.01, window_size=1024, hop_length=None):
+    """Detect silence in audio
+
+    Returns:
+        Boolean array with one entry per window (including a trailing partial
+        window), True where the window's RMS energy is below threshold
+    """
+    frames = frame_signal(audio, window_size, hop_length)
+    lengths = frame_lengths(len(audio), len(frames), window_size, hop_length)
+    return frame_rms(frames, lengths) < threshold
+
+
+def trim_silence(audio, threshold=0.01, window_size=1024, hop_length=None):
     """Trim silence from the beginning and end of audio"""
-    is_silent = detect_silence(audio, threshold, window_size)
+    hop_length = hop_length or window_size
+    is_silent = detect_silence(audio, threshold, window_size, hop_length)
 
-    if all(is_silent):  # All silence
+    voiced = np.flatnonzero(~is_silent)
+    if len(voiced) == 0:  # All silence
         return np.zeros(0, dtype=audio.dtype)
 
-    # Find first non-silent window
-    start = 0
-    for i, silent in enumerate(is_silent):
-        if not silent:
-            start = i
-            break
-
-    # Find last non-silent window
-    end = len(is_silent) - 1
-    for i in range(len(is_silent) - 1, -1, -1):
-        if not is_silent[i]:
-            end = i
-            break
-
     # Convert window indices to sample indices
-    start_sample = start * window_size
-    end_sample = min((end + 1) * window_size, len(audio))
+    start_sample = voiced[0] * hop_length
+    end_sample = min(voiced[-1] * hop_length + window_size, len(audio))
 
-    return audio[start_sample:end_sample]
\ No newline at end of file
+    return audio[start_sample:end_sample]
@@ -0,0 +1,144 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+
+# Number of input-rate zero crossings of the interpolation filter on each side
+HALF_WIDTH = 16
+
+# Kaiser window shape (~80 dB stopband) and cutoff relative to the lower Nyquist rate
+KAISER_BETA = 8.6
+ROLLOFF = 0.94
+
+# Outputs computed per vectorized block, bounding the size of the gathered windows
+BLOCK_SIZE = 8192
+
+
+def rate_ratio(src_rate, dst_rate):
+    """Reduce dst_rate / src_rate to (up, down)"""
+    g = math.gcd(int(src_rate), int(dst_rate))
+    return int(dst_rate) // g, int(src_rate) // g
+
+
+@lru_cache(maxsize=32)
+def get_filter_bank(up, down, half_width=HALF_WIDTH, beta=KAISER_BETA, rolloff=ROLLOFF):
+    """Design (once per rate pair) the polyphase filter bank for up/down resampling
+
+    A Kaiser-windowed sinc low-pass at the upsampled rate is split into `up`
+    phases, reversed so that each row can be applied directly to a window of
+    input samples in time order.
+
+    Returns:
+        (bank, delay): bank has shape (up, taps_per_phase); delay is the
+        filter's group delay in upsampled samples
+    """
+    factor = max(up, down)
+    delay = half_width * factor
+    n = np.arange(2 * delay + 1) - delay
+    cutoff = 0.5 * rolloff / factor  # Cycles per upsampled sample
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(len(n), beta)
+    h *= up / h.sum()
+
+    taps = -(-len(h) // up)
+    h = np.concatenate((h, np.zeros(taps * up - len(h))))
+    bank = h.reshape(taps, up).T[:, ::-1]
+    bank = np.ascontiguousarray(bank, dtype=np.float32)
+    bank.flags.writeable = False
+    return bank, delay
+
+
+class Resampler:
+    def __init__(self, src_rate, dst_rate):
+        """Streaming polyphase resampler that keeps filter state between blocks
+
+        Args:
+            src_rate: Input sample rate in Hz
+            dst_rate: Output sample rate in Hz
+        """
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.up, self.down = rate_ratio(src_rate, dst_rate)
+        self.bank, self.delay = get_filter_bank(self.up, self.down)
+        self.taps = self.bank.shape[1]
+        self.reset()
+
+    def reset(self):
+        """Forget the stream history"""
+        # Input history, starting taps - 1 zeros before the first sample
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._history_start = -(self.taps - 1)
+        self._n_input = 0
+        self._n_output = 0
+
+    def _available_outputs(self, n_input):
+        """Number of outputs computable from the first n_input input samples"""
+        # Output m needs input index (m * down + delay) // up < n_input
+        last_t = n_input * self.up - 1 - self.delay
+        if last_t < 0:
+            return 0
+        return last_t // self.down + 1
+
+    def process(self, chunk):
+        """Resample the next block of the stream
+
+        Returns:
+            The output samples that can be produced so far (the filter delay
+            is held back until more input arrives or flush() is called)
+        """
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if self.up == self.down:
+            return chunk
+
+        buffer = np.concatenate((self._history, chunk))
+        self._n_input += len(chunk)
+        end = self._available_outputs(self._n_input)
+        output = self._compute(buffer, self._n_output, end)
+        self._n_output = end
+
+        # Keep only the input still needed by future outputs
+        next_index = (end * self.down + self.delay) // self.up
+        keep_from = max(0, next_index - (self.taps - 1) - self._history_start)
+        self._history = buffer[keep_from:]
+        self._history_start += keep_from
+        return output
+
+    def flush(self):
+        """Return the remaining output at the end of the stream
+
+        The total output length is ceil(n_input * dst_rate / src_rate).
+        """
+        if self.up == self.down:
+            return np.zeros(0, dtype=np.float32)
+        total = -(-self._n_input * self.up // self.down)
+        n_pad = -(-self.delay // self.up) + 1
+        buffer = np.concatenate((self._history, np.zeros(n_pad, dtype=np.float32)))
+        output = self._compute(buffer, self._n_output, total)
+        self.reset()
+        return output
+
+    def _compute(self, buffer, start, end):
+        """Compute outputs [start, end) from buffer, which begins at input index _history_start"""
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps)
+        output = np.empty(end - start, dtype=np.float32)
+        for block_start in range(start, end, BLOCK_SIZE):
+            m = np.arange(block_start, min(block_start + BLOCK_SIZE, end))
+            t = m * self.down + self.delay
+            # Window ending at input index t // up, filtered by phase t % up
+            first = t // self.up - (self.taps - 1) - self._history_start
+            output[block_start - start:block_start - start + len(m)] = np.einsum(
+                "ij,ij->i", windows[first], self.bank[t % self.up])
+        return output
+
+
+def resample(audio, src_rate, dst_rate):
+    """Resample a complete signal from src_rate to dst_rate"""
+    audio = np.asarray(audio, dtype=np.float32)
+    if src_rate == dst_rate or len(audio) == 0:
+        return audio
+    resampler = Resampler(src_rate, dst_rate)
+    head = resampler.process(audio)
+    return np.concatenate((head, resampler.flush()))
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class RingBuffer:
+    def __init__(self, capacity, dtype=np.float32):
+        """Preallocated ring buffer of audio samples with zero-copy reads
+
+        The storage is mirrored (every sample is kept at i and i + capacity),
+        so any window of up to capacity recent samples is a contiguous slice
+        and can be handed out as a numpy view, even across the wrap point.
+        Positions are absolute sample counts since the buffer was created.
+
+        Args:
+            capacity: Number of most recent samples that stay readable
+            dtype: Sample type of the buffer
+        """
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self._data = np.zeros(2 * capacity, dtype=self.dtype)
+        self.written = 0
+
+    def _commit(self, start, n):
+        """Mirror n samples just written at storage offset start and advance"""
+        end = start + n
+        if end <= self.capacity:
+            self._data[start + self.capacity:end + self.capacity] = self._data[start:end]
+        else:
+            # Part of the write landed in the mirror half; copy it to the front
+            self._data[start + self.capacity:] = self._data[start:self.capacity]
+            self._data[:end - self.capacity] = self._data[self.capacity:end]
+        self.written += n
+
+    def write(self, samples):
+        """Append an array of samples"""
+        samples = samples[-self.capacity:]
+        start = self.written % self.capacity
+        self._data[start:start + len(samples)] = samples
+        self._commit(start, len(samples))
+
+    def write_converted(self, data, src_dtype, scale=1.0, channels=1):
+        """Append raw interleaved sample bytes, converting in place
+
+        The bytes are read through a view and converted straight into the
+        buffer storage (downmixed to mono and scaled to [-1, 1]), with no
+        intermediate arrays.
+
+        Args:
+            data: Raw bytes from the audio stream
+            src_dtype: Sample type of the bytes (e.g. np.int16)
+            scale: Factor that maps the samples to [-1, 1]
+            channels: Number of interleaved channels
+        """
+        src = np.frombuffer(data, dtype=src_dtype)
+        n = len(src) // channels
+        if n > self.capacity:
+            src = src[-self.capacity * channels:]
+            n = self.capacity
+        start = self.written % self.capacity
+        out = self._data[start:start + n]
+
+        if channels > 1:
+            np.mean(src.reshape(n, channels), axis=1, out=out)
+            if scale != 1.0:
+                out *= scale
+        elif scale != 1.0:
+            np.multiply(src, scale, out=out, casting="unsafe")
+        else:
+            np.copyto(out, src, casting="unsafe")
+
+        self._commit(start, n)
+
+    def view(self, start, stop):
+        """Return a read-only view of the samples at absolute positions [start, stop)
+
+        The view stays valid until the samples are overwritten, i.e. until
+        capacity more samples have been written after them.
+        """
+        if stop - start > self.capacity or start < self.written - self.capacity or stop > self.written:
+            raise IndexError(f"Samples [{start}, {stop}) are not in the buffer "
+                             f"(written={self.written}, capacity={self.capacity})")
+        offset = start % self.capacity
+        view = self._data[offset:offset + (stop - start)]
+        view.flags.writeable = False
+        return view
+
+    def latest(self, n):
+        """Return a view of the n most recent samples"""
+        n = min(n, self.written, self.capacity)
+        return self.view(self.written - n, self.written)
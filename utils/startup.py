@@ -0,0 +1,43 @@
+import time
+import logging
+
+
+class StartupTimer:
+    def __init__(self, start=None):
+        """Record how long each step of the application startup takes
+
+        Args:
+            start: time.perf_counter() value startup is measured from
+                (defaults to now)
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.marks = []
+
+    def mark(self, name):
+        """Record that a step finished now
+
+        Returns:
+            Seconds since the start
+        """
+        elapsed = time.perf_counter() - self.start
+        self.marks.append((name, elapsed))
+        return elapsed
+
+    def report(self, background=None):
+        """Log and return a report of the recorded steps
+
+        Args:
+            background: Optional {name: seconds or None} of work running in
+                the background (None while it is still running)
+        """
+        lines = ["Startup time:"]
+        previous = 0.0
+        for name, elapsed in self.marks:
+            lines.append(f"  {name:<28} {elapsed:7.2f} s  (+{elapsed - previous:.2f} s)")
+            previous = elapsed
+        for name, seconds in (background or {}).items():
+            status = f"{seconds:7.2f} s" if seconds is not None else "  still running"
+            lines.append(f"  {name:<28} {status}  (background)")
+        report = "\n".join(lines)
+        logging.info(report)
+        return report
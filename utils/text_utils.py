@@ -0,0 +1,161 @@
+import re
+
+
+# Sentence end: terminal punctuation, optional closing quotes/brackets, then whitespace
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+|\n+')
+
+# Clause end: soft punctuation followed by whitespace
+_CLAUSE_END = re.compile(r'[,;:—]\s+|\s+-\s+')
+
+# Words ending in "." that do not end a sentence
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e",
+    "approx", "fig", "inc", "ltd", "co", "jan", "feb", "mar", "apr", "jun",
+    "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+}
+
+# Capitalized words that start a new sentence rather than a name after an initial
+_SENTENCE_STARTERS = {
+    "i", "i'm", "i'll", "i've", "i'd", "a", "an", "the", "it", "it's", "its", "he", "she", "we", "they",
+    "you", "this", "that", "that's", "these", "those", "there", "there's", "here", "here's", "my", "your",
+    "our", "their", "his", "her", "but", "and", "or", "so", "then", "if", "what", "who", "how", "why",
+    "when", "where", "which", "in", "on", "at", "for", "to", "of", "as", "with", "is", "are", "was",
+    "do", "does", "did", "can", "not", "no", "yes", "please", "let", "let's", "also", "however", "now",
+}
+
+# The next word, complete once a delimiter follows it
+_NEXT_WORD = re.compile(r'["\'(]*([^\s.,;:!?"\')]+)([.,;:!?"\')]|\s)')
+
+
+def _ends_with_abbreviation(text, following):
+    """Check whether the "." ending text belongs to an abbreviation or an initial
+
+    A single capital letter is an initial when another initial or a name
+    follows ("J. R. R. Tolkien", "J. Smith"), not when a new sentence
+    starts ("Take vitamin C. It helps.").
+
+    Args:
+        text: Text up to and including the "."
+        following: Text after the whitespace that follows the "."
+
+    Returns:
+        True or False, or None while the word after an initial is incomplete
+    """
+    words = text.rstrip(".\"') ]").split()
+    if not words:
+        return False
+    last = words[-1].lstrip("(\"'")
+    if last.lower() in ABBREVIATIONS:
+        return True
+    if len(last) != 1 or not last.isupper():
+        return False
+
+    match = _NEXT_WORD.match(following)
+    if match is None:
+        return None
+    word, delimiter = match.groups()
+    if len(word) == 1 and word.isupper() and delimiter == ".":
+        return True
+    return word[0].isupper() and word.lower() not in _SENTENCE_STARTERS
+
+
+class SentenceSegmenter:
+    def __init__(self, max_chars=150, min_clause_chars=40):
+        """Incrementally split streamed text into speakable chunks
+
+        Complete sentences are emitted as soon as their terminating
+        punctuation and the following whitespace have arrived. Sentences that
+        grow beyond max_chars are split at the last clause boundary so that
+        speech can start before a very long sentence is finished.
+
+        Args:
+            max_chars: Length after which a pending sentence is split at a clause boundary
+            min_clause_chars: Minimum length of a clause emitted on its own
+        """
+        self.max_chars = max_chars
+        self.min_clause_chars = min_clause_chars
+        self.buffer = ""
+
+    def push(self, delta):
+        """Add a text delta and return the chunks it completed"""
+        self.buffer += delta
+        chunks = []
+
+        start = 0
+        for match in _SENTENCE_END.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()]
+            # "Dr. Smith" or "J. R. R. Tolkien" should not end a sentence
+            if match.group()[0] == ".":
+                abbreviation = _ends_with_abbreviation(self.buffer[start:match.start() + 1],
+                                                       self.buffer[match.end():])
+                if abbreviation is None:
+                    # Wait for the next word to decide
+                    break
+                if abbreviation:
+                    continue
+            chunk = candidate.strip()
+            if chunk:
+                chunks.append(chunk)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+
+        if len(self.buffer) > self.max_chars:
+            chunks.extend(self._split_clauses())
+
+        return chunks
+
+    def flush(self):
+        """Return whatever text is left at the end of the stream"""
+        chunk = self.buffer.strip()
+        self.buffer = ""
+        return [chunk] if chunk else []
+
+    def _split_clauses(self):
+        """Emit the pending text up to its last clause boundary"""
+        cut = None
+        for match in _CLAUSE_END.finditer(self.buffer):
+            if match.end() >= self.min_clause_chars:
+                cut = match.end()
+        if cut is None:
+            return []
+        chunk = self.buffer[:cut].strip()
+        self.buffer = self.buffer[cut:]
+        return [chunk] if chunk else []
+
+
+def split_sentences(text, max_chars=150):
+    """Split a complete text into speakable chunks"""
+    segmenter = SentenceSegmenter(max_chars=max_chars)
+    return segmenter.push(text) + segmenter.flush()
+
+
+def normalize_words(text):
+    """Lowercase words without punctuation, for comparing transcripts"""
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """Word-level edit distance between two transcripts
+
+    Returns:
+        (number of substitutions + deletions + insertions, number of reference words)
+    """
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    # One row of the Levenshtein table at a time
+    row = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        previous, row[0] = row[0], i
+        for j, hyp_word in enumerate(hyp, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (ref_word != hyp_word))
+    return row[-1], len(ref)
+
+
+def word_error_rate(references, hypotheses):
+    """Corpus word error rate: total word errors over total reference words"""
+    errors = words = 0
+    for reference, hypothesis in zip(references, hypotheses):
+        e, n = word_errors(reference, hypothesis)
+        errors += e
+        words += n
+    return errors / max(words, 1)
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# Milestones of a conversation turn, in the order they normally happen
+TURN_MILESTONES = ("end_of_speech", "transcript", "first_token", "first_audio", "done")
+
+
+class Tracer:
+    def __init__(self, max_events=100000, max_samples=10000):
+        """Per-stage timing of the voice pipeline
+
+        Spans (timed sections of code) and turn milestones are recorded
+        only while the tracer is enabled; when it is disabled, every entry
+        point returns after checking a single attribute. Durations are
+        kept per name for percentile histograms, and all events can be
+        written as a Chrome trace (chrome://tracing or ui.perfetto.dev).
+
+        Args:
+            max_events: Trace events kept for export (oldest are dropped)
+            max_samples: Durations kept per histogram (oldest are dropped)
+        """
+        self.enabled = False
+        self.max_events = max_events
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self.events = []
+            self.samples = {}
+            self.thread_names = {}
+            self.turn = None
+            self.last_turn = None
+            self.turn_count = 0
+            self._start = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def _now_us(self):
+        return (time.perf_counter() - self._start) * 1e6
+
+    def _record(self, event, name=None, seconds=None):
+        with self._lock:
+            self.events.append(event)
+            if event["tid"] not in self.thread_names:
+                self.thread_names[event["tid"]] = threading.current_thread().name
+            if len(self.events) > self.max_events:
+                del self.events[:len(self.events) - self.max_events]
+            if name is not None:
+                samples = self.samples.setdefault(name, [])
+                samples.append(seconds)
+                if len(samples) > self.max_samples:
+                    del samples[:len(samples) - self.max_samples]
+
+    @contextmanager
+    def _span(self, name, args):
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            duration = self._now_us() - start
+            if self.turn is not None:
+                args = dict(args, turn=self.turn["id"])
+            self._record({"name": name, "ph": "X", "ts": start, "dur": duration, "pid": os.getpid(),
+                          "tid": threading.get_ident(), "args": args}, name, duration / 1e6)
+
+    def span(self, name, **args):
+        """Context manager timing a section of code (no-op when disabled)"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name, args)
+
+    def event(self, name, **args):
+        """Record an instant event"""
+        if not self.enabled:
+            return
+        self._record({"name": name, "ph": "i", "s": "p", "ts": self._now_us(), "pid": os.getpid(),
+                      "tid": threading.get_ident(), "args": args})
+
+    def begin_turn(self):
+        """Start timing a conversation turn
+
+        A turn that was never ended (e.g. nothing was understood) is dropped.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.turn_count += 1
+            self.turn = {"id": self.turn_count, "start": time.perf_counter(), "milestones": {}}
+
+    def milestone(self, name):
+        """Record a turn milestone; only its first occurrence in a turn counts"""
+        if not self.enabled:
+            return
+        turn = self.turn
+        if turn is None or name in turn["milestones"]:
+            return
+        turn["milestones"][name] = time.perf_counter()
+        self.event(f"turn.{name}", turn=turn["id"])
+
+    def end_turn(self):
+        """Close the current turn and add its latencies to the histograms
+
+        Latencies are measured from the end of the user's speech (or from
+        the start of the turn if no end of speech was seen), which is the
+        delay the user perceives.
+
+        Returns:
+            {milestone: seconds} of the turn (also kept as last_turn), or
+            None when disabled
+        """
+        if not self.enabled or self.turn is None:
+            return None
+        self.milestone("done")
+        turn, self.turn = self.turn, None
+        milestones = turn["milestones"]
+        origin = milestones.get("end_of_speech", turn["start"])
+        latencies = {name: max(at - origin, 0.0) for name, at in milestones.items() if name != "end_of_speech"}
+        with self._lock:
+            for name, seconds in latencies.items():
+                samples = self.samples.setdefault(f"turn.{name}", [])
+                samples.append(seconds)
+                if len(samples) > self.max_samples:
+                    del samples[:len(samples) - self.max_samples]
+            self.last_turn = latencies
+        return latencies
+
+    def histograms(self, percentiles=(50, 95, 99)):
+        """Summary statistics of every recorded span and turn latency, in seconds"""
+        with self._lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+        summary = {}
+        for name, values in sorted(samples.items()):
+            values = np.asarray(values)
+            stats = {"count": len(values), "mean": float(values.mean())}
+            for p, value in zip(percentiles, np.percentile(values, percentiles)):
+                stats[f"p{p}"] = float(value)
+            summary[name] = stats
+        return summary
+
+    def report(self):
+        """Log and return a table of the histograms"""
+        lines = [f"{'stage':<28} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+        for name, stats in self.histograms().items():
+            lines.append(f"{name:<28} {stats['count']:>6} {stats['p50'] * 1000:9.1f} "
+                         f"{stats['p95'] * 1000:9.1f} {stats['p99'] * 1000:9.1f}")
+        report = "\n".join(lines)
+        logging.info(f"Latency report:\n{report}")
+        return report
+
+    def write_json(self, path):
+        """Write the histograms as JSON"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.histograms(), f, indent=2)
+
+    def write_chrome_trace(self, path):
+        """Write all recorded events in the Chrome trace event format"""
+        with self._lock:
+            events = list(self.events)
+            names = dict(self.thread_names)
+        # Name the threads so the pipeline stages are labelled in the viewer
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                    for tid, name in names.items()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+# Process-wide tracer used by the pipeline modules
+tracer = Tracer()
+
+
+def traced(name):
+    """Decorator recording each call of a function as a span named name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer._span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+import sys
+import time
+import uuid
+import logging
+import threading
+
+# Startup is timed from here, before the project modules are imported
+STARTUP_BEGIN = time.perf_counter()
+
+import config
+from modules.asr import SpeechRecognizer
+from modules.audio_cache import AudioCache
+from modules.audio_handler import AudioHandler
+from modules.barge_in import BargeInDetector
+from modules.conversation_log import ConversationLog
+from modules.dialouge import DialogueManager
+from modules.llm_backends import LocalBackend, create_backend
+from modules.llm_policy import CircuitBreaker, ResilientBackend
+from modules.model_loader import configure_threads
+from modules.pipeline import TurnPipeline
+from modules.response_cache import ResponseCache
+from modules.tts import SpeechSynthesizer
+from utils.startup import StartupTimer
+from utils.tracing import tracer
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+
+def main():
+    startup = StartupTimer(start=STARTUP_BEGIN)
+    startup.mark("imports")
+    if config.TRACING_ENABLED:
+        tracer.enable()
+
+    # Check for API key
+    if not config.GEMINI_API_KEY:
+        print("Please set the GEMINI_API_KEY environment variable and try again.")
+        return
+
+    # Initialize the pipeline components
+    audio_handler = AudioHandler(
+        sample_rate=config.SAMPLE_RATE,
+        channels=config.CHANNELS,
+        chunk_size=config.CHUNK_SIZE,
+        format=config.FORMAT,
+        end_of_speech_ms=config.VAD_END_OF_SPEECH_MS,
+        pre_roll_ms=config.VAD_PRE_ROLL_MS
+    )
+    startup.mark("audio devices")
+
+    # With lazy loading, the models load and warm up in background threads
+    # while the greeting is played from the TTS cache
+    if config.TORCH_NUM_THREADS or config.TORCH_INTEROP_THREADS:
+        configure_threads(config.TORCH_NUM_THREADS, config.TORCH_INTEROP_THREADS)
+    recognizer = SpeechRecognizer(config.ASR_MODEL, lazy=config.LAZY_MODEL_LOADING,
+                                  snapshot_dir=config.MODEL_SNAPSHOT_DIR, quantize=config.ASR_QUANTIZE,
+                                  beam_size=config.ASR_BEAM_SIZE)
+    synthesizer = SpeechSynthesizer(
+        config.TTS_MODEL,
+        cache=AudioCache(
+            cache_dir=config.TTS_CACHE_DIR,
+            max_memory_bytes=config.TTS_CACHE_MEMORY_BYTES,
+            max_disk_bytes=config.TTS_CACHE_DISK_BYTES,
+            persist_all=config.TTS_CACHE_PERSIST_ALL
+        ),
+        lazy=config.LAZY_MODEL_LOADING,
+        snapshot_dir=config.MODEL_SNAPSHOT_DIR,
+        quantize=config.TTS_QUANTIZE
+    )
+    recognizer.start_loading()
+    synthesizer.start_loading()
+    # Fixed phrases are played from the cache without running the model
+    threading.Thread(target=synthesizer.prewarm, args=(config.CANNED_PHRASES,), name="tts-prewarm",
+                     daemon=True).start()
+    dialogue = DialogueManager(
+        config.GEMINI_API_KEY,
+        config.MODEL_NAME,
+        config.SYSTEM_PROMPT,
+        backend=ResilientBackend(
+            create_backend(config.LLM_BACKEND, config.GEMINI_API_KEY, config.MODEL_NAME, config.SYSTEM_PROMPT,
+                           pool_size=config.LLM_POOL_SIZE),
+            timeout=config.LLM_TIMEOUT,
+            deadline=config.LLM_DEADLINE,
+            max_retries=config.LLM_MAX_RETRIES,
+            hedge=config.LLM_HEDGE,
+            breaker=CircuitBreaker(config.LLM_BREAKER_FAILURES, config.LLM_BREAKER_RESET)
+        ),
+        fallback=LocalBackend() if config.LLM_FALLBACK_LOCAL else None,
+        max_context_tokens=config.CONTEXT_TOKEN_BUDGET,
+        summary_tokens=config.SUMMARY_TOKEN_BUDGET,
+        cache=ResponseCache(
+            max_bytes=config.RESPONSE_CACHE_MAX_BYTES,
+            ttl=config.RESPONSE_CACHE_TTL,
+            similarity_threshold=config.RESPONSE_CACHE_SIMILARITY
+        )
+    )
+    # Responses are played gaplessly through one output stream
+    audio_handler.start_output(blocksize=config.OUTPUT_BLOCK_SIZE, crossfade_ms=config.PLAYBACK_CROSSFADE_MS)
+    barge_in = None
+    if config.BARGE_IN_ENABLED:
+        # Full duplex: the microphone stays open while the response is played
+        audio_handler.start_capture()
+        barge_in = BargeInDetector(
+            sample_rate=config.SAMPLE_RATE,
+            min_speech_ms=config.BARGE_IN_MIN_SPEECH_MS,
+            echo_margin=config.BARGE_IN_ECHO_MARGIN
+        )
+    pipeline = TurnPipeline(recognizer, dialogue, synthesizer, audio_handler, barge_in=barge_in,
+                            speculative=config.SPECULATIVE_LLM)
+    conversation_log = ConversationLog(config.CONVERSATION_LOG_DIR, max_file_bytes=config.CONVERSATION_LOG_MAX_BYTES)
+    session_id = uuid.uuid4().hex
+    startup.mark("components")
+
+    print("\n==== Streaming Voice Conversational AI System ====")
+    print("Speak when prompted. Press Ctrl+C at any time to exit.")
+
+    def speak(text):
+        # Playback starts as soon as the first sentence is synthesized
+        audio_handler.play_stream(synthesizer.synthesize_stream(text), sample_rate=synthesizer.get_sample_rate())
+
+    try:
+        # Start with a greeting
+        print(f"AI: \"{config.GREETING}\"")
+        speak(config.GREETING)
+        startup.mark("greeting played")
+        startup.report(background={
+            "ASR model load": recognizer.load_seconds,
+            "TTS model load": synthesizer.load_seconds,
+        })
+
+        start_pos = None
+        while True:
+            print("\n> Your turn (speak now)...")
+            # After a barge-in, start from where the user interrupted
+            user_text = pipeline.listen(start_pos=start_pos)
+            start_pos = None
+
+            if not user_text:
+                print("Could not understand audio. Please try again.")
+                speak(config.NOT_UNDERSTOOD_PHRASE)
+                continue
+
+            print(f"You said: \"{user_text}\"")
+
+            if user_text.lower() in ["exit", "quit", "goodbye", "bye"]:
+                print("Ending conversation...")
+                dialogue.cancel_speculation()
+                speak(config.GOODBYE_PHRASE)
+                break
+
+            # Response text is spoken sentence by sentence while it is generated
+            ai_text = pipeline.respond(user_text)
+            print(f"AI: \"{ai_text}\"")
+            if pipeline.interrupted_at is not None:
+                print("(interrupted)")
+                start_pos = pipeline.interrupted_at
+
+            # Written by a background thread, off the conversation loop
+            conversation_log.log_turn(session_id, user_text, ai_text,
+                                      latencies=tracer.last_turn if tracer.enabled else None,
+                                      interrupted=pipeline.interrupted_at is not None)
+
+    except KeyboardInterrupt:
+        print("\nConversation ended by user.")
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
+    finally:
+        audio_handler.stop_capture()
+        audio_handler.stop_output()
+        conversation_log.close()
+        if tracer.enabled:
+            tracer.report()
+            if config.TRACE_JSON_PATH:
+                tracer.write_json(config.TRACE_JSON_PATH)
+            if config.TRACE_CHROME_PATH:
+                tracer.write_chrome_trace(config.TRACE_CHROME_PATH)
+        print("Thank you for using the conversational AI system.")
+
+
+if __name__ == "__main__":
+    main()
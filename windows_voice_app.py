@@ -2,10 +2,16 @@
 import os
 import sys
 import time
+import uuid
 import logging
 import speech_recognition as sr
 import pyttsx3
-import google.generativeai as genai
+
+import config
+from modules.conversation_log import ConversationLog
+from modules.dialouge import DialogueManager
+from modules.llm_backends import LocalBackend
+from utils.text_utils import SentenceSegmenter
 
 # Set up logging
 logging.basicConfig(
@@ -23,10 +29,6 @@ def main():
         print("Use: set GEMINI_API_KEY=your_api_key_here (on Windows)")
         return
 
-    # Initialize Gemini
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-flash")
-
     # Initialize speech recognizer
     recognizer = sr.Recognizer()
 
@@ -75,8 +77,15 @@ def main():
     when appropriate to maintain the conversation flow. Avoid sounding robotic or overly formal.
     """
 
-    # Conversation history for context
-    conversation_history = []
+    # The system prompt is sent as a system instruction with every request
+    # instead of as an extra first message; with LLM_BACKEND = "local" the
+    # assistant answers offline instead of calling Gemini
+    dialogue = DialogueManager(api_key, "gemini-1.5-flash", system_prompt,
+                               backend=LocalBackend() if config.LLM_BACKEND == "local" else None)
+
+    # Turns are written to the log by a background thread
+    conversation_log = ConversationLog(config.CONVERSATION_LOG_DIR, max_file_bytes=config.CONVERSATION_LOG_MAX_BYTES)
+    session_id = uuid.uuid4().hex
 
     try:
         # Start with a greeting
@@ -85,8 +94,8 @@ def main():
         engine.say(greeting)
         engine.runAndWait()
 
-        # Add greeting to history
-        conversation_history.append({"role": "model", "parts": [greeting]})
+        # The conversation starts from the greeting
+        dialogue.context.add("model", greeting)
 
         while True:
             print("\n> Your turn (speak now)...")
@@ -129,54 +138,35 @@ def main():
                 # Add pauses to seem more natural
                 time.sleep(0.5)
 
-                # Add to conversation history
-                conversation_history.append({"role": "user", "parts": [user_text]})
-
                 # Generate AI response
                 print("Thinking...")
                 time.sleep(1)  # Slight pause to seem more natural
 
-                if len(conversation_history) == 2:  # Count includes the greeting
-                    # First user message, create a new chat
-                    chat = model.start_chat(history=[])
-                    # Set system prompt
-                    chat.send_message(system_prompt)
-                else:
-                    # Format history for Gemini
-                    formatted_history = []
-                    for entry in conversation_history[:-1]:  # Exclude the current user message
-                        formatted_history.append({
-                            "role": entry["role"],
-                            "parts": [entry["parts"][0]]
-                        })
-                    chat = model.start_chat(history=formatted_history)
-
-                response = chat.send_message(user_text)
-                ai_text = response.text
-
-                # Add AI response to history
-                conversation_history.append({"role": "model", "parts": [ai_text]})
-
-                # Keep history manageable
-                if len(conversation_history) > 20:
-                    conversation_history = conversation_history[-20:]
-
-                print(f"AI: \"{ai_text}\"")
-
-                # Convert response to speech with natural pauses between sentences
+                # Stream the response and speak each sentence as soon as it is complete,
+                # with natural pauses between sentences
+                request_start = time.perf_counter()
+                first_token = None
+                parts = []
+                segmenter = SentenceSegmenter()
                 print("Speaking...")
-                sentences = ai_text.split(". ")
-                for sentence in sentences:
-                    if sentence.strip():
-                        engine.say(sentence.strip())
+                for delta in dialogue.stream_response(user_text):
+                    if first_token is None:
+                        first_token = time.perf_counter() - request_start
+                    parts.append(delta)
+                    for sentence in segmenter.push(delta):
+                        engine.say(sentence)
                         engine.runAndWait()
                         time.sleep(0.3)  # Small pause between sentences
+                for sentence in segmenter.flush():
+                    engine.say(sentence)
+                    engine.runAndWait()
+                ai_text = "".join(parts)
+                latencies = {"first_token": first_token, "done": time.perf_counter() - request_start}
+
+                print(f"AI: \"{ai_text}\"")
 
-                # Save the conversation to log file
-                log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversation_log.txt")
-                with open(log_path, "a", encoding="utf-8") as f:
-                    f.write(f"User: {user_text}\n")
-                    f.write(f"AI: {ai_text}\n\n")
+                # Save the conversation
+                conversation_log.log_turn(session_id, user_text, ai_text, latencies=latencies)
 
             except sr.UnknownValueError:
                 print("Could not understand audio")
@@ -202,6 +192,7 @@ def main():
         engine.say("I've encountered a problem. Let's restart our conversation.")
         engine.runAndWait()
     finally:
+        conversation_log.close()
         print("Thank you for using the conversational AI system.")
 
 